@@ -1,15 +1,44 @@
+import axios from "axios";
 import { apiRequest } from "./httpService";
 import type { Message } from "../model/message";
+import { config } from "../config/environment";
 
 export const getMessages = async (chatroomId: string) => {
   return apiRequest<Message[]>("get", `/chatRooms/${chatroomId}/messages`);
 };
 
-export const sendMessage = async (
-  chatroomId: string,
-  text: string,
-  file: File | null
-): Promise<Message> => {
+export interface BatchRoomRequest {
+  id: string;
+  limit?: number;
+  since?: string;
+}
+
+export interface MessageBatch {
+  rooms: Record<string, Message[]>;
+  not_found: string[];
+}
+
+// Reads several rooms' newest messages (or changes since a cursor) in one request
+export const getMessagesBatch = async (rooms: BatchRoomRequest[]) => {
+  return apiRequest<MessageBatch>("post", "/chatRooms/messages/batch", {
+    rooms,
+  });
+};
+
+export interface SendMessageVariables {
+  chatroomId: string;
+  text: string;
+  file: File | null;
+  // Created once per send action and kept across retries of it
+  idempotencyKey: string;
+}
+
+export const sendMessage = async ({
+  chatroomId,
+  text,
+  file,
+  idempotencyKey,
+}: SendMessageVariables): Promise<Message> => {
   const formData = new FormData();
   formData.append("chatroom_id", chatroomId);
   formData.append("sender", "user");
@@ -20,18 +49,48 @@ export const sendMessage = async (
     formData.append("file", file);
   }
 
+  // A retry sending the same key gets the first reply replayed
+  // instead of generating a second one
   return apiRequest<Message>("post", "/messages/gemini", formData, {
     headers: {
       "Content-Type": "multipart/form-data",
+      "Idempotency-Key": idempotencyKey,
     },
   });
 };
 
+// Sends are retried only when the outcome is unknown: no response, or a server error
+export const isRetryableSendError = (error: unknown) =>
+  axios.isAxiosError(error) &&
+  (!error.response || error.response.status >= 500);
+
+export interface EditedMessage {
+  message: string;
+  data: Message;
+}
+
 export const editMessage = async (
   messageId: string,
   newText: string
-): Promise<Message> => {
-  return apiRequest<Message>("put", `/messages/${messageId}`, {
+): Promise<EditedMessage> => {
+  return apiRequest<EditedMessage>("put", `/messages/${messageId}`, {
     text: newText,
   });
 };
+
+// Opens a Server-Sent Events stream of new and edited messages for a chatroom.
+// EventSource reconnects on its own and resumes from the last event id.
+export const subscribeToMessages = (
+  chatroomId: string,
+  onMessage: (message: Message) => void
+): (() => void) => {
+  const source = new EventSource(
+    `${config.API_BASE_URL}/chatRooms/${chatroomId}/events`
+  );
+  const handleEvent = (event: MessageEvent) => {
+    onMessage(JSON.parse(event.data) as Message);
+  };
+  source.addEventListener("created", handleEvent);
+  source.addEventListener("updated", handleEvent);
+  return () => source.close();
+};
@@ -49,6 +49,11 @@ export const ChatroomTab: React.FC<ChatroomTabProps> = ({
         {chatRooms?.map((room) => (
           <Tab
             key={room.name}
+            title={
+              room.last_message_preview
+                ? `${room.last_message_sender === "ai" ? "AI" : "You"}: ${room.last_message_preview}`
+                : undefined
+            }
             label={
               <Box
                 sx={{ display: "flex", alignItems: "center", gap: 1 }}
@@ -12,7 +12,7 @@ import EditIcon from "@mui/icons-material/Edit";
 import SaveIcon from "@mui/icons-material/Save";
 import CancelIcon from "@mui/icons-material/Cancel";
 import { StyledMessage, MessageBubble } from "../styles/MessageStyles";
-import { getImageUrl } from "../utils/imageUtils";
+import { getImageUrl, getThumbnailUrl } from "../utils/imageUtils";
 import type { Message } from "../model/message";
 
 interface MessageListProps {
@@ -146,7 +146,10 @@ export const MessageList: React.FC<MessageListProps> = ({
                   {message.image && getImageUrl(message.image) && (
                     <Box
                       component="img"
-                      src={getImageUrl(message.image)!}
+                      src={
+                        getThumbnailUrl(message.thumbnail ?? null) ??
+                        getImageUrl(message.image)!
+                      }
                       alt="Uploaded"
                       sx={{ maxWidth: "200px", maxHeight: "200px", mt: 1 }}
                     />
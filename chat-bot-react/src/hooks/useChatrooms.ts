@@ -1,11 +1,17 @@
-import { useState, useCallback, useMemo } from "react";
-import { useQuery } from "@tanstack/react-query";
+import { useState, useCallback, useEffect, useMemo } from "react";
+import { useQuery, useQueryClient } from "@tanstack/react-query";
 import {
   createNewChatroom,
   getChatrooms,
   deleteChatroom,
 } from "../api/chatroomQuery";
+import { getMessagesBatch } from "../api/messageQuery";
 import type { ChatRoom } from "../model/chatroom";
+import type { Message } from "../model/message";
+
+// Rooms whose recent messages are prefetched together when the room list loads
+const PREFETCH_ROOMS = 10;
+const PREFETCH_MESSAGES = 50;
 
 export const useChatrooms = () => {
   const [activeChatRoom, setActiveChatRoom] = useState("Default Chatroom");
@@ -26,6 +32,34 @@ export const useChatrooms = () => {
     queryFn: getChatrooms,
   });
 
+  const queryClient = useQueryClient();
+
+  // Seed the most recently active rooms' messages with one batched request,
+  // so switching tabs shows history at once. Seeded data is left stale, so
+  // opening a room still fetches its full history in the background.
+  useEffect(() => {
+    const rooms = (chatRooms ?? [])
+      .slice(0, PREFETCH_ROOMS)
+      .filter(
+        (room: ChatRoom) =>
+          queryClient.getQueryData(["messages", room.id]) === undefined
+      );
+    if (rooms.length === 0) return;
+    getMessagesBatch(
+      rooms.map((room: ChatRoom) => ({ id: room.id, limit: PREFETCH_MESSAGES }))
+    )
+      .then((batch) => {
+        Object.entries(batch.rooms).forEach(([id, messages]) => {
+          if (queryClient.getQueryData(["messages", id]) === undefined) {
+            queryClient.setQueryData<Message[]>(["messages", id], messages);
+          }
+        });
+      })
+      .catch((error) => {
+        console.error("Error prefetching messages:", error);
+      });
+  }, [chatRooms, queryClient]);
+
   const chatroomsWithUpdatedCounts = useMemo(() => {
     if (!chatRooms) return chatRooms;
 
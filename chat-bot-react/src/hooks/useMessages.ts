@@ -1,6 +1,13 @@
-import { useState } from "react";
-import { useQuery } from "@tanstack/react-query";
-import { getMessages, sendMessage, editMessage } from "../api/messageQuery";
+import { useCallback, useEffect, useState } from "react";
+import { useMutation, useQuery, useQueryClient } from "@tanstack/react-query";
+import {
+  getMessages,
+  sendMessage,
+  editMessage,
+  subscribeToMessages,
+  isRetryableSendError,
+} from "../api/messageQuery";
+import type { Message } from "../model/message";
 
 export const useMessages = (chatroomId: string | null) => {
   const [newMessage, setNewMessage] = useState("");
@@ -20,6 +27,36 @@ export const useMessages = (chatroomId: string | null) => {
     enabled: !!chatroomId,
   });
 
+  const queryClient = useQueryClient();
+
+  // Adds a message to the cached list, or replaces the copy with its id
+  const mergeMessage = useCallback(
+    (message: Message) => {
+      queryClient.setQueryData<Message[]>(["messages", chatroomId], (prev) => {
+        if (!prev) return [message];
+        const index = prev.findIndex((m) => m.id === message.id);
+        if (index === -1) return [...prev, message];
+        const next = [...prev];
+        next[index] = message;
+        return next;
+      });
+    },
+    [chatroomId, queryClient]
+  );
+
+  // Retries reuse the mutation's variables, and with them its idempotency key
+  const sendMutation = useMutation({
+    mutationFn: sendMessage,
+    retry: (failureCount, error) =>
+      failureCount < 2 && isRetryableSendError(error),
+  });
+
+  // Merge pushed messages into the cached list instead of refetching it
+  useEffect(() => {
+    if (!chatroomId) return;
+    return subscribeToMessages(chatroomId, mergeMessage);
+  }, [chatroomId, mergeMessage]);
+
   const handleImageChange = async (
     event: React.ChangeEvent<HTMLInputElement>
   ) => {
@@ -49,7 +86,16 @@ export const useMessages = (chatroomId: string | null) => {
           return;
         }
 
-        await sendMessage(chatroomId, newMessage, selectedImage);
+        const reply = await sendMutation.mutateAsync({
+          chatroomId,
+          text: newMessage,
+          file: selectedImage,
+          idempotencyKey: crypto.randomUUID(),
+        });
+        mergeMessage(reply);
+        // The push stream may be served by another worker (or be reconnecting),
+        // so fetch the list too: it also brings in the saved user message
+        refetchMessages();
 
         setNewMessage("");
         setSelectedImage(null);
@@ -57,7 +103,6 @@ export const useMessages = (chatroomId: string | null) => {
         console.error("Error sending message:", error);
       } finally {
         setIsMessageSending(false);
-        refetchMessages();
       }
     }
   };
@@ -76,10 +121,10 @@ export const useMessages = (chatroomId: string | null) => {
     if (!editingMessageId || !editText.trim()) return;
 
     try {
-      await editMessage(editingMessageId, editText);
+      const { data } = await editMessage(editingMessageId, editText);
+      mergeMessage(data);
       setEditingMessageId(null);
       setEditText("");
-      refetchMessages();
     } catch (error) {
       console.error("Error editing message:", error);
     }
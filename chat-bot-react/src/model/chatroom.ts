@@ -2,5 +2,8 @@ export interface ChatRoom {
   id: string;
   name: string;
   message_count: number;
+  last_message_preview?: string | null;
+  last_message_sender?: string | null;
+  last_activity_at?: string | null;
 }
 
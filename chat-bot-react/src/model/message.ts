@@ -3,4 +3,5 @@ export interface Message {
   text: string | null;
   sender: "user" | "ai";
   image?: string | null;
+  thumbnail?: string | null;
 }
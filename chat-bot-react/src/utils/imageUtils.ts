@@ -17,11 +17,22 @@ export const getImageUrl = (imagePath: string | null): string | null => {
     return imagePath;
   }
 
-  // If it's a relative path, prepend the API base URL
-  return `${getBaseUrl()}/uploads/${imagePath}`;
+  // Older messages stored a path under uploads/
+  if (imagePath.startsWith("uploads/")) {
+    return `${getBaseUrl()}/uploads/${imagePath}`;
+  }
+
+  // Otherwise it's a blob key, served (or redirected to storage) by the API
+  return `${config.API_BASE_URL}/blobs/${imagePath}`;
+};
+
+// Thumbnails are served by the API with long-lived cache headers
+export const getThumbnailUrl = (thumbnail: string | null): string | null => {
+  if (!thumbnail) return null;
+  return `${config.API_BASE_URL}/thumbnails/${thumbnail}`;
 };
 
 export const isValidImageUrl = (url: string | null): boolean => {
   if (!url) return false;
-  return url.includes("/uploads/") || url.startsWith("blob:");
+  return url.includes("/uploads/") || url.includes("/blobs/") || url.startsWith("blob:");
 };
@@ -0,0 +1,115 @@
+# agent_runner.py - Runs a tool-calling agent in-process with parallel, memoized tool calls
+import inspect
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AgentError(Exception):
+    """Raised when the agent cannot produce a final answer."""
+
+
+class AgentTurn:
+    """One model response: either final text or a batch of tool calls."""
+
+    def __init__(self, text='', tool_calls=(), content=None):
+        self.text = text
+        self.tool_calls = list(tool_calls)  # [(tool name, {arg: value})]
+        self.content = content  # Raw model content, appended to the history as-is
+
+
+class GeminiAgentModel:
+    """Adapts a Gemini model with function declarations to the AgentRunner interface."""
+
+    def __init__(self, model_name, tools, instruction, safety_settings=None):
+        import google.generativeai as genai
+
+        self._protos = genai.protos
+        self._model = genai.GenerativeModel(model_name, tools=tools, system_instruction=instruction)
+        self._safety_settings = safety_settings
+
+    def generate(self, history):
+        response = self._model.generate_content(history, safety_settings=self._safety_settings)
+        content = response.candidates[0].content
+        tool_calls = [
+            (part.function_call.name, dict(part.function_call.args))
+            for part in content.parts if part.function_call.name
+        ]
+        text = ''.join(part.text for part in content.parts if part.text)
+        return AgentTurn(text, tool_calls, content)
+
+    def tool_results(self, results):
+        return self._protos.Content(role='user', parts=[
+            self._protos.Part(function_response=self._protos.FunctionResponse(name=name, response={'result': result}))
+            for name, result in results
+        ])
+
+
+class AgentRunner:
+    """Drives an agent model until it answers, running the tools it asks for.
+
+    All tool calls the model requests in one step run concurrently. Results are
+    memoized for the duration of one run(), so asking for the same city twice in
+    a compound question costs one upstream call.
+    """
+
+    def __init__(self, model, tools, max_steps=5, max_workers=8):
+        self.model = model
+        self.tools = {tool.__name__: tool for tool in tools}
+        self.max_steps = max_steps
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='agent-tool')
+        self._lock = threading.Lock()
+        self._tool_calls = 0
+        self._memo_hits = 0
+
+    def run(self, text):
+        """Returns the agent's final answer to a user message."""
+        history = [{'role': 'user', 'parts': [text]}]
+        memo = {}
+        for _ in range(self.max_steps):
+            turn = self.model.generate(history)
+            if not turn.tool_calls:
+                if not turn.text:
+                    raise AgentError("Agent returned an empty response")
+                return turn.text
+            history.append(turn.content)
+            history.append(self.model.tool_results(self._run_tools(turn.tool_calls, memo)))
+        raise AgentError(f"Agent did not answer within {self.max_steps} steps")
+
+    def _run_tools(self, tool_calls, memo):
+        pending = []
+        for name, args in tool_calls:
+            key = (name, json.dumps(args, sort_keys=True, default=str))
+            with self._lock:
+                if key in memo:
+                    self._memo_hits += 1
+                else:
+                    self._tool_calls += 1
+                    memo[key] = self._executor.submit(self._call_tool, name, args)
+            pending.append((name, memo[key]))
+        return [(name, future.result()) for name, future in pending]
+
+    def _call_tool(self, name, args):
+        tool = self.tools.get(name)
+        if tool is None:
+            return {"status": "error", "error_message": f"Unknown tool '{name}'."}
+        try:
+            return tool(**_coerce_args(tool, args))
+        except Exception as e:
+            return {"status": "error", "error_message": f"Error running {name}: {str(e)}"}
+
+    def stats(self):
+        with self._lock:
+            return {'tool_calls': self._tool_calls, 'memo_hits': self._memo_hits}
+
+
+def _coerce_args(tool, args):
+    """Casts arguments to the tool's annotated types (function-call numbers arrive as floats)."""
+    parameters = inspect.signature(tool).parameters
+    coerced = {}
+    for name, value in args.items():
+        parameter = parameters.get(name)
+        if parameter is not None and parameter.annotation in (int, float, str) and value is not None:
+            value = parameter.annotation(value)
+        coerced[name] = value
+    return coerced
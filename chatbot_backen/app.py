@@ -1,172 +1,511 @@
-# app.py
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from mongoengine import connect
-from models import ChatRoom, Message
-from chatbot_api import message_bp  # Import the chatbot Blueprint
-import git  
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
-# Configure MongoDB connection (replace with your details)
-connect('chatbot', host='mongodb://localhost:27017/')  # <--- Changed this line
-
-# Register the chatbot Blueprint
-app.register_blueprint(message_bp, url_prefix='/api')  # Mount the chatbot API under /api
-
-
-@app.route('/update_server', methods=['POST'])
-def webhook():
-    if request.method == 'POST':
-        repo = git.Repo('path/to/git_repo')
-        origin = repo.remotes.origin
-        origin.pull()
-        return 'Updated PythonAnywhere successfully', 200
-    else:
-        return 'Wrong event type', 400
-
-@app.route('/api/chatRooms', methods=['GET'])
-def get_chatRooms():
-    """Retrieves a list of all chat rooms."""
-    try:
-        chat_rooms = ChatRoom.objects.all()
-        chat_room_list = [room.to_json() for room in chat_rooms]
-        return jsonify(chat_room_list)
-    except Exception as e:
-        print(f"Error retrieving chat rooms: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/chatRooms', methods=['POST'])
-def create_chatroom():
-     """Creates a new chat room."""
-     try:
-         data = request.get_json()
-         name = data.get('name')
-
-         if not name:
-             return jsonify({'error': 'Chat room name is required'}), 400
-
-         # Check if a chat room with the same name already exists
-         existing_chatroom = ChatRoom.objects(name=name).first()
-         if existing_chatroom:
-             return jsonify({'error': 'Chat room with this name already exists'}), 409
-
-         chatroom = ChatRoom(name=name)  # ONLY set the name!
-         chatroom.save()
-
-         # Include the id in the response after creating
-         return jsonify({'message': 'Chat room created successfully', 'id': str(chatroom.pk), 'name': name}), 201
-
-     except Exception as e:
-         print(f"Error creating chat room: {e}")
-         return jsonify({'error': str(e)}), 500
-    
-@app.route('/api/chatRooms', methods=['DELETE'])
-def delete_all_chatRooms():
-    """Deletes all chat rooms from the database."""
-    try:
-        ChatRoom.objects.delete()  # Delete all chat rooms
-        return jsonify({'message': 'All chat rooms deleted successfully'}), 200
-    except Exception as e:
-        print(f"Error deleting chat rooms: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/chatRooms/<chatroom_id>', methods=['DELETE'])
-def delete_chatroom(chatroom_id):
-    """Deletes a chatroom and its associated messages."""
-    try:
-        chatroom = ChatRoom.objects.get(pk=chatroom_id)
-
-        # Delete all messages associated with the chatroom
-        Message.objects(chatRoom=chatroom).delete()
-
-        # Delete the chatroom itself
-        chatroom.delete()
-
-        return jsonify({'message': 'Chatroom and associated messages deleted successfully'}), 200
-
-    except Exception as e:
-        print(f"Error deleting chatroom: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/chatRooms/<chatroom_id>/messages', methods=['GET'])
-def get_messages(chatroom_id):
-    """Retrieves messages for a specific chat room, ordered by timestamp."""
-    try:
-        try:
-            chatroom = ChatRoom.objects.get(pk=chatroom_id)
-        except ChatRoom.DoesNotExist:
-            return jsonify({'error': 'Chat room not found'}), 404
-
-        messages = Message.objects(chatRoom=chatroom).order_by('timestamp') # Retrieve and order the messages
-        message_list = [message.to_json() for message in messages]  # Convert to JSON
-
-        return jsonify(message_list), 200
-
-    except Exception as e:
-        print(f"Error retrieving messages: {e}")
-        return jsonify({'error': str(e)}), 500
-    
-@app.route('/api/messages', methods=['POST'])
-def create_message():
-    print("Received a POST request to /api/messages")
-    """Creates a new message and associates it with a chat room."""
-    try:
-        data = request.get_json()
-        text = data.get('text')
-        sender = data.get('sender')
-        chatroom_id = data.get('chatroom_id')
-
-        if not all([text, sender, chatroom_id]):
-            return jsonify({'error': 'Missing required fields'}), 400
-
-        try:
-            chatroom = ChatRoom.objects.get(pk=chatroom_id)
-        except ChatRoom.DoesNotExist:
-            return jsonify({'error': 'Chat room not found'}), 404
-
-        message = Message(text=text, sender=sender, chatRoom=chatroom)
-        message.save()
-
-        # OPTIONAL: If you keep the messages ListField in ChatRoom, update it:
-        # chatroom.messages.append(message.id)
-        chatroom.message_count += 1
-        chatroom.save()
-
-        return jsonify({'message': 'Message created successfully', 'id': str(message.pk)}), 201
-
-    except Exception as e:
-        print(f"Error creating message: {e}")
-        return jsonify({'error': str(e)}), 500
-    
-@app.route('/api/messages/<message_id>', methods=['PUT'])
-def edit_message(message_id):
-    """Edits an existing message."""
-    try:
-        data = request.get_json()
-        new_text = data.get('text')
-
-        if not new_text:
-            return jsonify({'error': 'Text is re uired'}), 400
-
-        try:
-            message = Message.objects.get(pk=message_id)
-        except Message.DoesNotExist:
-            return jsonify({'error': 'Message not found'}), 404
-
-        # Only allow editing user messages, not bot responses
-        if message.sender != 'user':
-            return jsonify({'error': 'Only user messages can be edited'}), 403
-
-        message.text = new_text
-        message.save()
-
-        return jsonify({'message': 'Message updated successfully', 'data': message.to_json()}), 200
-
-    except Exception as e:
-        print(f"Error editing message: {e}")
-        return jsonify({'error': str(e)}), 500
-    
-if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+# app.py
+from flask import Flask, Response, request, jsonify
+from flask_cors import CORS
+from mongoengine import connect
+from models import ChatRoom, Message, MessageBucket, RoomStats, IdempotencyKey, MESSAGE_BUCKETS_ENABLED
+from chatbot_api import message_bp  # Import the chatbot Blueprint
+from broker import publish_message
+from generation_stats import summarize_generations
+from streaming import streamed_json_response
+from idempotency import idempotent
+from profiling import init_profiling
+from tail_cache import message_tails, TAIL_CACHE_MESSAGES
+from upload_store import get_upload_store, message_blobs
+from compression import expand_text
+from message_batch import parse_batch, encode_batch
+from bson import ObjectId
+from pymongo import UpdateOne
+import transfer
+import datetime
+import json
+import git  
+
+app = Flask(__name__)
+CORS(app)  # Enable CORS for all routes
+
+# Configure MongoDB connection (replace with your details)
+connect('chatbot', host='mongodb://localhost:27017/')  # <--- Changed this line
+
+# Register the chatbot Blueprint
+app.register_blueprint(message_bp, url_prefix='/api')  # Mount the chatbot API under /api
+
+# Opt-in request profiling (PROFILE_ADMIN_TOKEN); not installed when unset
+init_profiling(app)
+
+
+@app.route('/update_server', methods=['POST'])
+def webhook():
+    if request.method == 'POST':
+        repo = git.Repo('path/to/git_repo')
+        origin = repo.remotes.origin
+        origin.pull()
+        return 'Updated PythonAnywhere successfully', 200
+    else:
+        return 'Wrong event type', 400
+
+@app.route('/api/chatRooms', methods=['GET'])
+def get_chatRooms():
+    """Retrieves a list of all chat rooms."""
+    try:
+        # Most recently active first, served by the last_activity_at index
+        chat_rooms = ChatRoom.objects.order_by('-last_activity_at').no_cache()
+        return streamed_json_response(chat_rooms, lambda room: room.to_json())
+    except Exception as e:
+        print(f"Error retrieving chat rooms: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chatRooms', methods=['POST'])
+def create_chatroom():
+     """Creates a new chat room."""
+     try:
+         data = request.get_json()
+         name = data.get('name')
+
+         if not name:
+             return jsonify({'error': 'Chat room name is required'}), 400
+
+         # Check if a chat room with the same name already exists
+         existing_chatroom = ChatRoom.objects(name=name).first()
+         if existing_chatroom:
+             return jsonify({'error': 'Chat room with this name already exists'}), 409
+
+         # A new room's buckets are complete from its first message
+         chatroom = ChatRoom(name=name, model_tier=data.get('model_tier'), bucketed=MESSAGE_BUCKETS_ENABLED)
+         chatroom.save()
+
+         # Include the id in the response after creating
+         return jsonify({'message': 'Chat room created successfully', 'id': str(chatroom.pk), 'name': name}), 201
+
+     except Exception as e:
+         print(f"Error creating chat room: {e}")
+         return jsonify({'error': str(e)}), 500
+    
+@app.route('/api/chatRooms', methods=['DELETE'])
+def delete_all_chatRooms():
+    """Deletes all chat rooms from the database."""
+    try:
+        # Upload blobs any message references, released once the messages are gone
+        uploads = [key for message in Message.objects(image_url__ne=None).only('image_url', 'thumbnail')
+                   for key in message_blobs(message.image_url, message.thumbnail)]
+
+        Message.objects.delete()
+        ChatRoom.objects.delete()  # Delete all chat rooms
+        RoomStats.objects.delete()
+        MessageBucket.objects.delete()
+        message_tails.clear()
+        get_upload_store().release(uploads)
+        return jsonify({'message': 'All chat rooms deleted successfully'}), 200
+    except Exception as e:
+        print(f"Error deleting chat rooms: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chatRooms/<chatroom_id>', methods=['DELETE'])
+def delete_chatroom(chatroom_id):
+    """Deletes a chatroom and its associated messages."""
+    try:
+        chatroom = ChatRoom.objects.get(pk=chatroom_id)
+
+        # Upload blobs the room's messages reference, released once the messages are gone
+        uploads = [key for message in Message.objects(chatRoom=chatroom, image_url__ne=None).only('image_url', 'thumbnail')
+                   for key in message_blobs(message.image_url, message.thumbnail)]
+
+        # Delete all messages associated with the chatroom
+        Message.objects(chatRoom=chatroom).delete()
+        RoomStats.objects(chatRoom=chatroom).delete()
+        MessageBucket.objects(chatRoom=chatroom).delete()
+        message_tails.invalidate(str(chatroom.pk))
+
+        # Delete the chatroom itself
+        chatroom.delete()
+        get_upload_store().release(uploads)
+
+        return jsonify({'message': 'Chatroom and associated messages deleted successfully'}), 200
+
+    except Exception as e:
+        print(f"Error deleting chatroom: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chatRooms/<chatroom_id>/messages', methods=['GET'])
+def get_messages(chatroom_id):
+    """Retrieves messages for a specific chat room, ordered by timestamp.
+
+    With `?since=<cursor>` only messages created or edited after the cursor are
+    returned, ordered by `updated_at`, so a reconnecting client can catch up.
+    With `?limit=N` only the newest N messages are returned, from the room's
+    in-memory tail when possible; add `&before=<timestamp>` to page further back.
+    """
+    try:
+        try:
+            chatroom = ChatRoom.objects.get(pk=chatroom_id)
+        except ChatRoom.DoesNotExist:
+            return jsonify({'error': 'Chat room not found'}), 404
+
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit < 1:
+            return jsonify({'error': 'limit must be a positive integer'}), 400
+
+        since = request.args.get('since')
+        before = request.args.get('before')
+        if limit and before and not since:
+            try:
+                before = datetime.datetime.fromisoformat(before)
+            except ValueError:
+                return jsonify({'error': 'Invalid before cursor'}), 400
+            return streamed_json_response(_message_page(chatroom, limit, before), lambda message: message)
+        if limit and not since:
+            return streamed_json_response(_message_tail(chatroom, limit), None)
+        if since:
+            try:
+                since = datetime.datetime.fromisoformat(since)
+            except ValueError:
+                return jsonify({'error': 'Invalid since cursor'}), 400
+            messages = Message.objects(chatRoom=chatroom, updated_at__gt=since).order_by('updated_at')
+        else:
+            messages = Message.objects(chatRoom=chatroom).order_by('timestamp') # Retrieve and order the messages
+
+        # Encode straight from the cursor instead of building the whole list
+        return streamed_json_response(messages.no_cache(), lambda message: message.to_json())
+
+    except Exception as e:
+        print(f"Error retrieving messages: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+def _message_page(chatroom, limit, before=None):
+    """Returns the newest `limit` messages older than `before` as JSON dicts, oldest first."""
+    if MESSAGE_BUCKETS_ENABLED and chatroom.bucketed:
+        return MessageBucket.page(chatroom, limit, before)
+    messages = Message.objects(chatRoom=chatroom)
+    if before is not None:
+        messages = messages.filter(timestamp__lt=before)
+    recent = [message.to_json() for message in messages.order_by('-timestamp').limit(limit)]
+    recent.reverse()
+    return recent
+
+def _message_tail(chatroom, limit):
+    """Returns the newest `limit` messages as JSON text, oldest first."""
+    room_id = str(chatroom.pk)
+    cached = message_tails.get(room_id, limit, chatroom.revision)
+    if cached is not None:
+        return cached
+    recent = _message_page(chatroom, max(limit, TAIL_CACHE_MESSAGES))
+    encoded = [(message['id'], json.dumps(message)) for message in recent]
+    if limit <= TAIL_CACHE_MESSAGES:
+        message_tails.prime(room_id, encoded, chatroom.revision)
+    return [text for _, text in encoded[-limit:]]
+
+@app.route('/api/chatRooms/messages/batch', methods=['POST'])
+def get_messages_batch():
+    """Reads several rooms' messages in one request (see message_batch.parse_batch).
+
+    Tails cached in this worker are served from memory; every other room is
+    read by one aggregation with an index-bounded branch per room.
+    """
+    try:
+        try:
+            wanted = parse_batch(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        valid_ids = [ObjectId(r['id']) for r in wanted if ObjectId.is_valid(r['id'])]
+        revisions = {str(room['_id']): room.get('revision', 0)
+                     for room in ChatRoom.objects(pk__in=valid_ids).only('revision').as_pymongo()}
+
+        results = {}
+        misses = []
+        for r in wanted:
+            if r['id'] not in revisions:
+                continue
+            if r['since'] is None:
+                cached = message_tails.get(r['id'], r['limit'], revisions[r['id']])
+                if cached is not None:
+                    results[r['id']] = cached
+                    continue
+            misses.append(r)
+        results.update(_read_batch(misses, revisions))
+
+        body = encode_batch({r['id']: results[r['id']] for r in wanted if r['id'] in results},
+                            [r['id'] for r in wanted if r['id'] not in revisions])
+        return Response(body, status=200, mimetype='application/json')
+
+    except Exception as e:
+        print(f"Error retrieving message batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def _read_batch(wanted, revisions):
+    """Fetches the rooms in `wanted` with one aggregation; returns room id -> messages as JSON text.
+
+    Per-room limits can't be applied to a single `$in` scan without reading
+    each room in full, so each room is its own `$unionWith` branch, bounded
+    by the (chatRoom, timestamp) or (chatRoom, updated_at) index.
+    """
+    if not wanted:
+        return {}
+    branches = []
+    for r in wanted:
+        room = ObjectId(r['id'])
+        if r['since'] is not None:
+            branches.append([{'$match': {'chatRoom': room, 'updated_at': {'$gt': r['since']}}},
+                             {'$sort': {'updated_at': 1}}, {'$limit': r['limit']}])
+        else:
+            # Read a whole tail when it fits, so the worker's tail cache can be primed
+            branches.append([{'$match': {'chatRoom': room}},
+                             {'$sort': {'timestamp': -1}}, {'$limit': max(r['limit'], TAIL_CACHE_MESSAGES)}])
+    collection = Message._get_collection_name()
+    pipeline = branches[0] + [{'$unionWith': {'coll': collection, 'pipeline': branch}} for branch in branches[1:]]
+
+    grouped = {r['id']: [] for r in wanted}
+    for doc in Message.objects.aggregate(pipeline):
+        grouped[str(doc['chatRoom'])].append(Message._from_son(doc))
+
+    results = {}
+    for r in wanted:
+        messages = grouped[r['id']]
+        if r['since'] is None:
+            messages.reverse()  # Newest-first branch, returned oldest first
+            encoded = [(str(message.pk), json.dumps(message.to_json())) for message in messages]
+            if r['limit'] <= TAIL_CACHE_MESSAGES:
+                message_tails.prime(r['id'], encoded, revisions[r['id']])
+            results[r['id']] = [text for _, text in encoded[-r['limit']:]]
+        else:
+            results[r['id']] = [json.dumps(message.to_json()) for message in messages]
+    return results
+
+@app.route('/api/chatRooms/<chatroom_id>/stats', methods=['GET'])
+def get_chatroom_stats(chatroom_id):
+    """Returns a room's message counters without scanning its messages."""
+    try:
+        try:
+            chatroom = ChatRoom.objects.get(pk=chatroom_id)
+        except ChatRoom.DoesNotExist:
+            return jsonify({'error': 'Chat room not found'}), 404
+
+        stats = RoomStats.objects(chatRoom=chatroom).first()
+        if stats is None:
+            # Rooms created before counters existed are aggregated once
+            stats = RoomStats.rebuild(chatroom)
+
+        return jsonify(stats.to_json()), 200
+
+    except Exception as e:
+        print(f"Error retrieving chat room stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chatRooms/<chatroom_id>/stats/rebuild', methods=['POST'])
+def rebuild_chatroom_stats(chatroom_id):
+    """Recomputes a room's counters from its messages."""
+    try:
+        try:
+            chatroom = ChatRoom.objects.get(pk=chatroom_id)
+        except ChatRoom.DoesNotExist:
+            return jsonify({'error': 'Chat room not found'}), 404
+
+        return jsonify(RoomStats.rebuild(chatroom).to_json()), 200
+
+    except Exception as e:
+        print(f"Error rebuilding chat room stats: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+@app.route('/api/stats/generation', methods=['GET'])
+def get_generation_stats():
+    """Returns Gemini latency percentiles and token totals, overall and per room.
+
+    Optional filters: `chatroom_id`, and an ISO-8601 `start`/`end` time window.
+    """
+    try:
+        filters = {'generation_model__ne': None}
+        try:
+            if request.args.get('start'):
+                filters['timestamp__gte'] = datetime.datetime.fromisoformat(request.args['start'])
+            if request.args.get('end'):
+                filters['timestamp__lt'] = datetime.datetime.fromisoformat(request.args['end'])
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO-8601 timestamps'}), 400
+
+        chatroom_id = request.args.get('chatroom_id')
+        if chatroom_id:
+            try:
+                filters['chatRoom'] = ChatRoom.objects.get(pk=chatroom_id)
+            except ChatRoom.DoesNotExist:
+                return jsonify({'error': 'Chat room not found'}), 404
+
+        documents = Message.objects(**filters).only(
+            'chatRoom', 'generation_model', 'generation_latency_ms', 'prompt_tokens',
+            'output_tokens', 'finish_reason', 'cache_hit'
+        ).as_pymongo()
+        rows = ({
+            'chatRoom': doc.get('chatRoom'),
+            'model': doc.get('generation_model'),
+            'latency_ms': doc.get('generation_latency_ms'),
+            'prompt_tokens': doc.get('prompt_tokens'),
+            'output_tokens': doc.get('output_tokens'),
+            'finish_reason': doc.get('finish_reason'),
+            'cache_hit': doc.get('cache_hit'),
+        } for doc in documents)
+
+        return jsonify(summarize_generations(rows)), 200
+
+    except Exception as e:
+        print(f"Error retrieving generation stats: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+@app.route('/api/export', methods=['GET'])
+def export_chatrooms():
+    """Streams one room (`?chatroom_id=`) or all rooms as NDJSON.
+
+    Rooms and messages are read through DB cursors and written line by line,
+    so memory use does not grow with history size.
+    """
+    chatroom_id = request.args.get('chatroom_id')
+    if chatroom_id:
+        try:
+            rooms = [ChatRoom.objects.get(pk=chatroom_id)]
+        except ChatRoom.DoesNotExist:
+            return jsonify({'error': 'Chat room not found'}), 404
+    else:
+        rooms = ChatRoom.objects.no_cache()
+
+    def generate():
+        yield transfer.encode(transfer.header_record())
+        for room in rooms:
+            yield transfer.encode(transfer.room_record(room.pk, room.name, room.model_tier))
+            documents = Message.objects(chatRoom=room).order_by('timestamp').as_pymongo() \
+                .batch_size(transfer.EXPORT_FETCH_SIZE)
+            for doc in documents:
+                yield transfer.encode(transfer.message_record(
+                    room.pk, expand_text(doc.get('text')), doc.get('sender'), doc.get('timestamp'),
+                    image=doc.get('image_url'), thumbnail=doc.get('thumbnail'),
+                    gemini_response=expand_text(doc.get('gemini_response')),
+                    message_id=doc['_id'], reply=doc.get('reply'),
+                    **{field: doc.get(field) for field in transfer.GENERATION_FIELDS}
+                ))
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': 'attachment; filename=chatrooms.ndjson'
+    })
+
+@app.route('/api/import', methods=['POST'])
+def import_chatrooms():
+    """Imports an NDJSON export, appending to rooms that already exist by name."""
+
+    def get_or_create_room(record):
+        room = ChatRoom.objects(name=record['name']).first()
+        if room is None:
+            room = ChatRoom(name=record['name'], model_tier=record.get('model_tier'))
+            room.save()
+        return room
+
+    def insert_messages(room, records):
+        ids = Message.objects.insert([
+            Message(
+                chatRoom=room,
+                text=record.get('text'),
+                sender=record.get('sender'),
+                timestamp=transfer.parse_timestamp(record.get('timestamp')),
+                updated_at=transfer.parse_timestamp(record.get('timestamp')),
+                image_url=record.get('image'),
+                thumbnail=record.get('thumbnail'),
+                gemini_response=record.get('gemini_response'),
+                **{field: record.get(field) for field in transfer.GENERATION_FIELDS}
+            ) for record in records
+        ], load_bulk=False)
+        get_upload_store().acquire([key for record in records if record.get('image')
+                                    for key in message_blobs(record['image'], record.get('thumbnail'))])
+        return ids
+
+    def link_replies(links):
+        Message._get_collection().bulk_write(
+            [UpdateOne({'_id': message_id}, {'$set': {'reply': reply_id}}) for message_id, reply_id in links],
+            ordered=False
+        )
+
+    def finish_room(room, imported):
+        ChatRoom.objects(pk=room.pk).update_one(inc__message_count=imported)
+        ChatRoom.refresh_summary(room)
+        RoomStats.rebuild(room)
+        if MESSAGE_BUCKETS_ENABLED and room.bucketed:
+            MessageBucket.rebuild(room)
+
+    try:
+        result = transfer.import_records(
+            transfer.read_records(request.stream), get_or_create_room, insert_messages, finish_room,
+            link_replies=link_replies
+        )
+        return jsonify({'message': 'Import completed', **result}), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error importing chat rooms: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+@app.route('/api/messages', methods=['POST'])
+@idempotent(IdempotencyKey)
+def create_message():
+    print("Received a POST request to /api/messages")
+    """Creates a new message and associates it with a chat room."""
+    try:
+        data = request.get_json()
+        text = data.get('text')
+        sender = data.get('sender')
+        chatroom_id = data.get('chatroom_id')
+
+        if not all([text, sender, chatroom_id]):
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        try:
+            chatroom = ChatRoom.objects.get(pk=chatroom_id)
+        except ChatRoom.DoesNotExist:
+            return jsonify({'error': 'Chat room not found'}), 404
+
+        message = Message(text=text, sender=sender, chatRoom=chatroom)
+        message.save()
+        RoomStats.record(message)
+
+        # OPTIONAL: If you keep the messages ListField in ChatRoom, update it:
+        # chatroom.messages.append(message.id)
+        revision = ChatRoom.record_message(message)  # Count and last-message preview in one atomic update
+        message_tails.append(str(chatroom.pk), str(message.pk), json.dumps(message.to_json()), revision)
+        MessageBucket.append(message)
+
+        publish_message(message.to_json())
+
+        return jsonify({'message': 'Message created successfully', 'id': str(message.pk)}), 201
+
+    except Exception as e:
+        print(f"Error creating message: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+@app.route('/api/messages/<message_id>', methods=['PUT'])
+def edit_message(message_id):
+    """Edits an existing message."""
+    try:
+        data = request.get_json()
+        new_text = data.get('text')
+
+        if not new_text:
+            return jsonify({'error': 'Text is re uired'}), 400
+
+        try:
+            message = Message.objects.get(pk=message_id)
+        except Message.DoesNotExist:
+            return jsonify({'error': 'Message not found'}), 404
+
+        # Only allow editing user messages, not bot responses
+        if message.sender != 'user':
+            return jsonify({'error': 'Only user messages can be edited'}), 403
+
+        message.text = new_text
+        message.save()  # Message.clean stamps updated_at
+        revision = ChatRoom.record_message(message, count=0)  # Refreshes the preview if this is the newest message
+        message_tails.replace(message.chatroom_id(), str(message.pk), json.dumps(message.to_json()), revision)
+        MessageBucket.replace(message)
+
+        publish_message(message.to_json(), event='updated')
+
+        return jsonify({'message': 'Message updated successfully', 'data': message.to_json()}), 200
+
+    except Exception as e:
+        print(f"Error editing message: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+if __name__ == '__main__':
+    app.run(debug=True, port=5000)
@@ -1,191 +1,437 @@
-# app_pythonanywhere.py - Production version for PythonAnywhere
-import os
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from models_mysql import db, ChatRoom, Message
-from chatbot_api import message_bp
-import logging
-import git
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-
-app = Flask(__name__)
-
-# Production CORS configuration
-CORS(app, origins=[
-    "https://mandyy1223.pythonanywhere.com",  # Your main domain
-    "https://mandyy1223.eu.pythonanywhere.com",  # Alternative domain format
-    "http://localhost:3000",   # For local development
-    "http://localhost:5173",   # For Vite dev server
-    "http://localhost:5174"    # For Vite dev server (alternate port)
-])
-
-# MySQL Database configuration for PythonAnywhere
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    f"mysql+pymysql://{os.environ.get('DB_USER')}:"
-    f"{os.environ.get('DB_PASSWORD')}@"
-    f"{os.environ.get('DB_HOST')}/"
-    f"{os.environ.get('DB_NAME')}"
-)
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize database
-db.init_app(app)
-
-# Register the chatbot Blueprint
-app.register_blueprint(message_bp, url_prefix='/api')
-
-@app.route('/update_server', methods=['POST'])
-def webhook():
-    if request.method == 'POST':
-        repo = git.Repo('path/to/git_repo')
-        origin = repo.remotes.origin
-        origin.pull()
-        return 'Updated PythonAnywhere successfully', 200
-    else:
-        return 'Wrong event type', 400
-
-@app.route('/api/chatRooms', methods=['GET'])
-def get_chatRooms():
-    """Retrieves a list of all chat rooms."""
-    try:
-        chat_rooms = ChatRoom.query.all()
-        chat_room_list = [room.to_json() for room in chat_rooms]
-        return jsonify(chat_room_list)
-    except Exception as e:
-        app.logger.error(f"Error retrieving chat rooms: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/chatRooms', methods=['POST'])
-def create_chatroom():
-    """Creates a new chat room."""
-    try:
-        data = request.get_json()
-        name = data.get('name')
-
-        if not name:
-            return jsonify({'error': 'Chat room name is required'}), 400
-
-        # Check if a chat room with the same name already exists
-        existing_chatroom = ChatRoom.query.filter_by(name=name).first()
-        if existing_chatroom:
-            return jsonify({'error': 'Chat room with this name already exists'}), 409
-
-        chatroom = ChatRoom(name=name)
-        db.session.add(chatroom)
-        db.session.commit()
-
-        return jsonify({
-            'message': 'Chat room created successfully', 
-            'id': str(chatroom.id), 
-            'name': name
-        }), 201
-
-    except Exception as e:
-        db.session.rollback()
-        app.logger.error(f"Error creating chat room: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/chatRooms', methods=['DELETE'])
-def delete_all_chatrooms():
-    """Deletes all chat rooms from the database."""
-    try:
-        ChatRoom.query.delete()
-        db.session.commit()
-        return jsonify({'message': 'All chat rooms deleted successfully'}), 200
-    except Exception as e:
-        db.session.rollback()
-        app.logger.error(f"Error deleting chat rooms: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/chatRooms/<int:chatroom_id>', methods=['DELETE'])
-def delete_chatroom(chatroom_id):
-    """Deletes a chatroom and its associated messages."""
-    try:
-        chatroom = ChatRoom.query.get_or_404(chatroom_id)
-        db.session.delete(chatroom)
-        db.session.commit()
-        return jsonify({'message': 'Chatroom and associated messages deleted successfully'}), 200
-    except Exception as e:
-        db.session.rollback()
-        app.logger.error(f"Error deleting chatroom: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/chatRooms/<int:chatroom_id>/messages', methods=['GET'])
-def get_messages(chatroom_id):
-    """Retrieves messages for a specific chat room, ordered by timestamp."""
-    try:
-        chatroom = ChatRoom.query.get_or_404(chatroom_id)
-        messages = Message.query.filter_by(chatRoom_id=chatroom_id).order_by(Message.timestamp).all()
-        message_list = [message.to_json() for message in messages]
-        return jsonify(message_list), 200
-    except Exception as e:
-        app.logger.error(f"Error retrieving messages: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/messages', methods=['POST'])
-def create_message():
-    """Creates a new message and associates it with a chat room."""
-    try:
-        data = request.get_json()
-        text = data.get('text')
-        sender = data.get('sender')
-        chatroom_id = data.get('chatroom_id')
-
-        if not all([text, sender, chatroom_id]):
-            return jsonify({'error': 'Missing required fields'}), 400
-
-        chatroom = ChatRoom.query.get_or_404(chatroom_id)
-        message = Message(text=text, sender=sender, chatRoom_id=chatroom.id)
-        
-        db.session.add(message)
-        chatroom.message_count += 1
-        db.session.commit()
-
-        return jsonify({
-            'message': 'Message created successfully', 
-            'id': str(message.id)
-        }), 201
-
-    except Exception as e:
-        db.session.rollback()
-        app.logger.error(f"Error creating message: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/messages/<int:message_id>', methods=['PUT'])
-def edit_message(message_id):
-    """Edits an existing message."""
-    try:
-        data = request.get_json()
-        new_text = data.get('text')
-
-        if not new_text:
-            return jsonify({'error': 'Text is required'}), 400
-
-        message = Message.query.get_or_404(message_id)
-
-        # Only allow editing user messages, not bot responses
-        if message.sender != 'user':
-            return jsonify({'error': 'Only user messages can be edited'}), 403
-
-        message.text = new_text
-        db.session.commit()
-
-        return jsonify({
-            'message': 'Message updated successfully', 
-            'data': message.to_json()
-        }), 200
-
-    except Exception as e:
-        db.session.rollback()
-        app.logger.error(f"Error editing message: {e}")
-        return jsonify({'error': str(e)}), 500
-
-# Create tables
-@app.before_first_request
-def create_tables():
-    db.create_all()
-
-if __name__ == '__main__':
-    app.run(debug=False)  # Set to False for production
+# app_pythonanywhere.py - Production version for PythonAnywhere
+import os
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask_cors import CORS
+from models_mysql import db, ChatRoom, Message, RoomStats, IdempotencyKey
+from chatbot_api import message_bp
+from broker import publish_message
+from generation_stats import summarize_generations
+from streaming import streamed_json_response
+from idempotency import idempotent
+from profiling import init_profiling
+from db_pool import ReadRouter
+from upload_store import get_upload_store, message_blobs
+from message_batch import parse_batch, encode_batch
+from sqlalchemy import select, union_all
+import transfer
+from datetime import datetime
+import json
+import logging
+import git
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+
+app = Flask(__name__)
+
+# Production CORS configuration
+CORS(app, origins=[
+    "https://mandyy1223.pythonanywhere.com",  # Your main domain
+    "https://mandyy1223.eu.pythonanywhere.com",  # Alternative domain format
+    "http://localhost:3000",   # For local development
+    "http://localhost:5173",   # For Vite dev server
+    "http://localhost:5174"    # For Vite dev server (alternate port)
+])
+
+# MySQL Database configuration for PythonAnywhere: sized pool with pre-ping and
+# recycle, plus an optional read replica (DB_REPLICA_HOST) for listings
+reads = ReadRouter()
+reads.init_app(app, db)
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Initialize database
+db.init_app(app)
+
+# Register the chatbot Blueprint
+app.register_blueprint(message_bp, url_prefix='/api')
+
+# Opt-in request profiling (PROFILE_ADMIN_TOKEN); not installed when unset
+init_profiling(app)
+
+@app.route('/update_server', methods=['POST'])
+def webhook():
+    if request.method == 'POST':
+        repo = git.Repo('path/to/git_repo')
+        origin = repo.remotes.origin
+        origin.pull()
+        return 'Updated PythonAnywhere successfully', 200
+    else:
+        return 'Wrong event type', 400
+
+@app.route('/api/chatRooms', methods=['GET'])
+def get_chatRooms():
+    """Retrieves a list of all chat rooms."""
+    try:
+        # Most recently active first, served by the last_activity_at index
+        chat_rooms = reads.query(ChatRoom).order_by(ChatRoom.last_activity_at.desc(), ChatRoom.id).yield_per(500)
+        return streamed_json_response(chat_rooms, lambda room: room.to_json(), wrap=stream_with_context)
+    except Exception as e:
+        app.logger.error(f"Error retrieving chat rooms: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chatRooms', methods=['POST'])
+def create_chatroom():
+    """Creates a new chat room."""
+    try:
+        data = request.get_json()
+        name = data.get('name')
+
+        if not name:
+            return jsonify({'error': 'Chat room name is required'}), 400
+
+        # Check if a chat room with the same name already exists
+        existing_chatroom = ChatRoom.query.filter_by(name=name).first()
+        if existing_chatroom:
+            return jsonify({'error': 'Chat room with this name already exists'}), 409
+
+        chatroom = ChatRoom(name=name, model_tier=data.get('model_tier'))
+        db.session.add(chatroom)
+        db.session.commit()
+
+        return jsonify({
+            'message': 'Chat room created successfully', 
+            'id': str(chatroom.id), 
+            'name': name
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error creating chat room: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chatRooms', methods=['DELETE'])
+def delete_all_chatrooms():
+    """Deletes all chat rooms from the database."""
+    try:
+        # Upload blobs any message references, released once the delete commits
+        uploads = [key for image, thumbnail in Message.query.with_entities(Message.image, Message.thumbnail)
+                   .filter(Message.image.isnot(None))
+                   for key in message_blobs(image, thumbnail)]
+        # Bulk deletes skip the ORM cascade from rooms to messages
+        Message.query.delete()
+        RoomStats.query.delete()
+        ChatRoom.query.delete()
+        db.session.commit()
+        get_upload_store().release(uploads)
+        return jsonify({'message': 'All chat rooms deleted successfully'}), 200
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error deleting chat rooms: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chatRooms/<int:chatroom_id>', methods=['DELETE'])
+def delete_chatroom(chatroom_id):
+    """Deletes a chatroom and its associated messages."""
+    try:
+        chatroom = ChatRoom.query.get_or_404(chatroom_id)
+        # Upload blobs the room's messages reference, released once the delete commits
+        uploads = [key for image, thumbnail in Message.query.with_entities(Message.image, Message.thumbnail)
+                   .filter(Message.chatRoom_id == chatroom_id, Message.image.isnot(None))
+                   for key in message_blobs(image, thumbnail)]
+        db.session.delete(chatroom)
+        db.session.commit()
+        get_upload_store().release(uploads)
+        return jsonify({'message': 'Chatroom and associated messages deleted successfully'}), 200
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error deleting chatroom: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chatRooms/<int:chatroom_id>/messages', methods=['GET'])
+def get_messages(chatroom_id):
+    """Retrieves messages for a specific chat room, ordered by timestamp.
+
+    With `?since=<cursor>` only messages created or edited after the cursor are
+    returned, ordered by `updated_at`, so a reconnecting client can catch up.
+    """
+    try:
+        # A room created moments ago may not have reached the replica yet
+        if reads.session.get(ChatRoom, chatroom_id) is None:
+            ChatRoom.query.get_or_404(chatroom_id)
+        since = request.args.get('since')
+        if since:
+            try:
+                since = datetime.fromisoformat(since)
+            except ValueError:
+                return jsonify({'error': 'Invalid since cursor'}), 400
+            messages = reads.query(Message).filter(
+                Message.chatRoom_id == chatroom_id,
+                Message.updated_at > since
+            ).order_by(Message.updated_at)
+        else:
+            messages = reads.query(Message).filter_by(chatRoom_id=chatroom_id).order_by(Message.timestamp)
+
+        # Encode straight from a server-side cursor instead of building the whole list
+        messages = messages.execution_options(stream_results=True).yield_per(500)
+        return streamed_json_response(messages, lambda message: message.to_json(), wrap=stream_with_context)
+    except Exception as e:
+        app.logger.error(f"Error retrieving messages: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chatRooms/messages/batch', methods=['POST'])
+def get_messages_batch():
+    """Reads several rooms' messages in one request (see message_batch.parse_batch).
+
+    All rooms are fetched by one UNION ALL query with an index-bounded branch
+    per room, since per-room limits can't be applied to a single IN scan.
+    """
+    try:
+        try:
+            wanted = parse_batch(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # isdigit() alone accepts digits such as '²' that int() rejects
+        ids = {r['id']: int(r['id']) for r in wanted if r['id'].isascii() and r['id'].isdigit()}
+        found = set(reads.session.scalars(select(ChatRoom.id).where(ChatRoom.id.in_(ids.values()))))
+        missing = [room_id for room_id in ids.values() if room_id not in found]
+        if missing:
+            # Rooms created moments ago may not have reached the replica yet
+            found.update(db.session.scalars(select(ChatRoom.id).where(ChatRoom.id.in_(missing))))
+        rooms = [r for r in wanted if ids.get(r['id']) in found]
+
+        grouped = {ids[r['id']]: [] for r in rooms}
+        if rooms:
+            branches = []
+            for r in rooms:
+                branch = select(Message.id).where(Message.chatRoom_id == ids[r['id']])
+                if r['since'] is not None:
+                    branch = branch.where(Message.updated_at > r['since']).order_by(Message.updated_at)
+                else:
+                    branch = branch.order_by(Message.timestamp.desc())
+                # Wrapped as derived tables, since MySQL only allows LIMIT inside them
+                branch = branch.limit(r['limit']).subquery()
+                branches.append(select(branch.c.id))
+            picked = union_all(*branches).subquery()
+            for message in reads.session.scalars(select(Message).join(picked, Message.id == picked.c.id)):
+                grouped[message.chatRoom_id].append(message)
+
+        results = {}
+        for r in rooms:
+            cursor = (lambda m: m.updated_at) if r['since'] is not None else (lambda m: m.timestamp)
+            messages = sorted(grouped[ids[r['id']]], key=lambda m: (cursor(m), m.id))
+            results[r['id']] = [json.dumps(message.to_json()) for message in messages]
+        not_found = [r['id'] for r in wanted if r['id'] not in results]
+        return Response(encode_batch(results, not_found), status=200, mimetype='application/json')
+    except Exception as e:
+        app.logger.error(f"Error retrieving message batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/metrics/db', methods=['GET'])
+def get_db_metrics():
+    """Returns connection pool checkout latency and saturation for this worker."""
+    return jsonify(reads.stats())
+
+@app.route('/api/chatRooms/<int:chatroom_id>/stats', methods=['GET'])
+def get_chatroom_stats(chatroom_id):
+    """Returns a room's message counters without scanning its messages."""
+    try:
+        ChatRoom.query.get_or_404(chatroom_id)
+        stats = db.session.get(RoomStats, chatroom_id)
+        if stats is None:
+            # Rooms created before counters existed are aggregated once
+            stats = RoomStats.rebuild(chatroom_id)
+        return jsonify(stats.to_json()), 200
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error retrieving chat room stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chatRooms/<int:chatroom_id>/stats/rebuild', methods=['POST'])
+def rebuild_chatroom_stats(chatroom_id):
+    """Recomputes a room's counters from its messages."""
+    try:
+        ChatRoom.query.get_or_404(chatroom_id)
+        return jsonify(RoomStats.rebuild(chatroom_id).to_json()), 200
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error rebuilding chat room stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats/generation', methods=['GET'])
+def get_generation_stats():
+    """Returns Gemini latency percentiles and token totals, overall and per room.
+
+    Optional filters: `chatroom_id`, and an ISO-8601 `start`/`end` time window.
+    """
+    try:
+        query = db.session.query(
+            Message.chatRoom_id, Message.generation_model, Message.generation_latency_ms,
+            Message.prompt_tokens, Message.output_tokens, Message.finish_reason, Message.cache_hit
+        ).filter(Message.generation_model.isnot(None))
+        try:
+            if request.args.get('start'):
+                query = query.filter(Message.timestamp >= datetime.fromisoformat(request.args['start']))
+            if request.args.get('end'):
+                query = query.filter(Message.timestamp < datetime.fromisoformat(request.args['end']))
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO-8601 timestamps'}), 400
+        if request.args.get('chatroom_id'):
+            query = query.filter(Message.chatRoom_id == int(request.args['chatroom_id']))
+
+        rows = ({
+            'chatRoom': row.chatRoom_id,
+            'model': row.generation_model,
+            'latency_ms': row.generation_latency_ms,
+            'prompt_tokens': row.prompt_tokens,
+            'output_tokens': row.output_tokens,
+            'finish_reason': row.finish_reason,
+            'cache_hit': row.cache_hit,
+        } for row in query.yield_per(1000))
+
+        return jsonify(summarize_generations(rows)), 200
+    except Exception as e:
+        app.logger.error(f"Error retrieving generation stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export', methods=['GET'])
+def export_chatrooms():
+    """Streams one room (`?chatroom_id=`) or all rooms as NDJSON.
+
+    Rooms and messages are read through server-side cursors and written line
+    by line, so memory use does not grow with history size.
+    """
+    chatroom_id = request.args.get('chatroom_id', type=int)
+    rooms = ChatRoom.query.order_by(ChatRoom.id)
+    if chatroom_id:
+        ChatRoom.query.get_or_404(chatroom_id)
+        rooms = rooms.filter(ChatRoom.id == chatroom_id)
+
+    def generate():
+        yield transfer.encode(transfer.header_record())
+        for room in rooms.all():
+            yield transfer.encode(transfer.room_record(room.id, room.name, room.model_tier))
+            messages = Message.query.filter_by(chatRoom_id=room.id).order_by(Message.timestamp) \
+                .execution_options(stream_results=True).yield_per(transfer.EXPORT_FETCH_SIZE)
+            for message in messages:
+                yield transfer.encode(transfer.message_record(
+                    room.id, message.text, message.sender, message.timestamp,
+                    image=message.image, thumbnail=message.thumbnail, message_id=message.id,
+                    **{field: getattr(message, field) for field in transfer.GENERATION_FIELDS}
+                ))
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': 'attachment; filename=chatrooms.ndjson'
+    })
+
+@app.route('/api/import', methods=['POST'])
+def import_chatrooms():
+    """Imports an NDJSON export, appending to rooms that already exist by name."""
+
+    def get_or_create_room(record):
+        room = ChatRoom.query.filter_by(name=record['name']).first()
+        if room is None:
+            room = ChatRoom(name=record['name'], model_tier=record.get('model_tier'), message_count=0)
+            db.session.add(room)
+            db.session.commit()
+        return room
+
+    def insert_messages(room, records):
+        db.session.bulk_insert_mappings(Message, [{
+            'chatRoom_id': room.id,
+            'text': record.get('text'),
+            'sender': record.get('sender'),
+            'timestamp': transfer.parse_timestamp(record.get('timestamp')),
+            'updated_at': transfer.parse_timestamp(record.get('timestamp')),
+            'image': record.get('image'),
+            'thumbnail': record.get('thumbnail'),
+            **{field: record.get(field) for field in transfer.GENERATION_FIELDS}
+        } for record in records])
+        db.session.commit()
+        get_upload_store().acquire([key for record in records if record.get('image')
+                                    for key in message_blobs(record['image'], record.get('thumbnail'))])
+
+    def finish_room(room, imported):
+        ChatRoom.query.filter_by(id=room.id).update(
+            {ChatRoom.message_count: db.func.coalesce(ChatRoom.message_count, 0) + imported},
+            synchronize_session=False
+        )
+        db.session.commit()
+        ChatRoom.refresh_summary(room.id)
+        RoomStats.rebuild(room.id)
+
+    try:
+        result = transfer.import_records(
+            transfer.read_records(request.stream), get_or_create_room, insert_messages, finish_room
+        )
+        return jsonify({'message': 'Import completed', **result}), 201
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error importing chat rooms: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/messages', methods=['POST'])
+@idempotent(IdempotencyKey)
+def create_message():
+    """Creates a new message and associates it with a chat room."""
+    try:
+        data = request.get_json()
+        text = data.get('text')
+        sender = data.get('sender')
+        chatroom_id = data.get('chatroom_id')
+
+        if not all([text, sender, chatroom_id]):
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        chatroom = ChatRoom.query.get_or_404(chatroom_id)
+        message = Message(text=text, sender=sender, chatRoom_id=chatroom.id)
+        
+        db.session.add(message)
+        RoomStats.record(message)
+        ChatRoom.record_message(message)  # Count and last-message preview in one UPDATE
+        db.session.commit()
+
+        publish_message(message.to_json())
+
+        return jsonify({
+            'message': 'Message created successfully', 
+            'id': str(message.id)
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error creating message: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/messages/<int:message_id>', methods=['PUT'])
+def edit_message(message_id):
+    """Edits an existing message."""
+    try:
+        data = request.get_json()
+        new_text = data.get('text')
+
+        if not new_text:
+            return jsonify({'error': 'Text is required'}), 400
+
+        message = Message.query.get_or_404(message_id)
+
+        # Only allow editing user messages, not bot responses
+        if message.sender != 'user':
+            return jsonify({'error': 'Only user messages can be edited'}), 403
+
+        message.text = new_text
+        ChatRoom.record_message(message, count=0)  # Refreshes the preview if this is the newest message
+        db.session.commit()
+
+        publish_message(message.to_json(), event='updated')
+
+        return jsonify({
+            'message': 'Message updated successfully', 
+            'data': message.to_json()
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error editing message: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Create tables
+@app.before_first_request
+def create_tables():
+    db.create_all()
+
+if __name__ == '__main__':
+    app.run(debug=False)  # Set to False for production
@@ -0,0 +1,324 @@
+# blob_store.py - Blob storage for uploads: local directory or an S3-compatible bucket
+import datetime
+import hashlib
+import hmac
+import http.client
+import os
+import posixpath
+import shutil
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from urllib.parse import quote, urlencode, urlparse
+
+from image_pipeline import UPLOAD_FOLDER
+
+# 'local' keeps blobs under BLOB_LOCAL_ROOT; 's3' stores them in BLOB_S3_BUCKET, visible to every node
+BLOB_BACKEND = os.environ.get("BLOB_BACKEND", "local")
+BLOB_LOCAL_ROOT = os.environ.get("BLOB_LOCAL_ROOT", UPLOAD_FOLDER)
+# Any S3-compatible endpoint (AWS, MinIO, R2, ...); buckets are addressed path-style
+BLOB_S3_ENDPOINT = os.environ.get("BLOB_S3_ENDPOINT", "https://s3.amazonaws.com")
+BLOB_S3_BUCKET = os.environ.get("BLOB_S3_BUCKET", "")
+BLOB_S3_REGION = os.environ.get("BLOB_S3_REGION", "us-east-1")
+BLOB_S3_ACCESS_KEY = os.environ.get("BLOB_S3_ACCESS_KEY", os.environ.get("AWS_ACCESS_KEY_ID", ""))
+BLOB_S3_SECRET_KEY = os.environ.get("BLOB_S3_SECRET_KEY", os.environ.get("AWS_SECRET_ACCESS_KEY", ""))
+# Lifetime of signed download URLs handed to browsers
+BLOB_URL_TTL_SECONDS = int(os.environ.get("BLOB_URL_TTL_SECONDS", "3600"))
+BLOB_CHUNK_BYTES = 64 * 1024
+
+
+class BlobStoreError(Exception):
+    """An unexpected response from the blob backend."""
+
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+def blob_key(image):
+    """Blob key for a stored image reference; older messages stored 'uploads/<file>' paths."""
+    if image and image.startswith(UPLOAD_FOLDER + '/'):
+        return image[len(UPLOAD_FOLDER) + 1:]
+    return image
+
+
+def served_key(key, prefixes):
+    """Normalized `key` if browsers may fetch it, i.e. it lies under one of `prefixes`; else None.
+
+    Keys with `..` or dot-file segments are refused before the prefix check,
+    so a path like 'thumbs/../.index.sqlite3' can't reach other blobs.
+    """
+    if not key or key.startswith('/') or '\\' in key:
+        return None
+    segments = key.split('/')
+    if any(segment in ('', '.', '..') or segment.startswith('.') for segment in segments):
+        return None
+    key = posixpath.normpath(key)
+    return key if key.startswith(prefixes) else None
+
+
+def new_upload_key(filename):
+    """A fresh, stable key for an uploaded original, keeping its extension."""
+    return f"originals/{uuid.uuid4().hex}{os.path.splitext(filename)[1].lower()}"
+
+
+class LocalBlobStore:
+    """Blobs as files under one directory on this host."""
+
+    per_host = True  # Other nodes cannot see these blobs
+
+    def __init__(self, root=BLOB_LOCAL_ROOT):
+        self.root = root
+
+    def local_path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Invalid blob key '{key}'")
+        return path
+
+    def put(self, key, stream, content_type=None):
+        """Writes a file-like object under `key`, chunk by chunk."""
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(stream, f, BLOB_CHUNK_BYTES)
+        os.replace(tmp_path, path)
+
+    def put_file(self, key, path, content_type=None):
+        """Stores a local file under `key`, consuming the file (it is moved, not copied)."""
+        target = self.local_path(key)
+        if os.path.abspath(path) != target:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+
+    def open(self, key):
+        """Yields the blob's bytes in chunks; raises FileNotFoundError if it is missing."""
+        f = open(self.local_path(key), 'rb')
+
+        def chunks():
+            with f:
+                while True:
+                    chunk = f.read(BLOB_CHUNK_BYTES)
+                    if not chunk:
+                        return
+                    yield chunk
+        return chunks()
+
+    def read(self, key):
+        with open(self.local_path(key), 'rb') as f:
+            return f.read()
+
+    def size(self, key):
+        """Size in bytes, or None if the blob does not exist."""
+        try:
+            return os.path.getsize(self.local_path(key))
+        except OSError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self, prefix=''):
+        """Yields (key, size) for every stored blob whose key starts with `prefix`."""
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(folder, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if key.startswith(prefix) and not key.startswith('.') and not key.endswith('.tmp'):
+                    try:
+                        yield key, os.path.getsize(path)
+                    except OSError:
+                        pass  # Deleted since it was listed
+
+    def url(self, key, ttl=BLOB_URL_TTL_SECONDS):
+        return None  # Served by the app (see chatbot_api.get_blob)
+
+
+class S3BlobStore:
+    """Blobs in an S3-compatible bucket, using AWS Signature V4 over http.client.
+
+    Bodies are streamed in both directions and never held in memory whole;
+    payloads are sent as UNSIGNED-PAYLOAD so uploads need no hashing pass.
+    """
+
+    per_host = False
+
+    def __init__(self, endpoint=BLOB_S3_ENDPOINT, bucket=BLOB_S3_BUCKET, region=BLOB_S3_REGION,
+                 access_key=BLOB_S3_ACCESS_KEY, secret_key=BLOB_S3_SECRET_KEY, timeout=30):
+        parsed = urlparse(endpoint)
+        self.scheme = parsed.scheme or 'https'
+        self.host = parsed.netloc
+        self.endpoint = f"{self.scheme}://{self.host}"
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.timeout = timeout
+
+    def _path(self, key=''):
+        return f"/{self.bucket}/{quote(key, safe='/-_.~')}" if key else f"/{self.bucket}"
+
+    def _signing_key(self, date):
+        key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in (date, self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+        return key
+
+    def _signature(self, method, path, query, headers, now):
+        """Returns (signed header names, credential scope, signature) for a request or presigned URL."""
+        names = sorted(name.lower() for name in headers)
+        canonical_headers = ''.join(f"{name}:{str(headers[name]).strip()}\n" for name in names)
+        canonical_query = '&'.join(
+            f"{quote(name, safe='-_.~')}={quote(str(value), safe='-_.~')}" for name, value in sorted(query.items())
+        )
+        canonical_request = '\n'.join([
+            method, path, canonical_query, canonical_headers, ';'.join(names), 'UNSIGNED-PAYLOAD'
+        ])
+        scope = f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', f"{now:%Y%m%dT%H%M%SZ}", scope,
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+        ])
+        signature = hmac.new(self._signing_key(f"{now:%Y%m%d}"), string_to_sign.encode('utf-8'),
+                             hashlib.sha256).hexdigest()
+        return ';'.join(names), scope, signature
+
+    def _request(self, method, key='', query=None, body=None, headers=None):
+        query = query or {}
+        now = datetime.datetime.now(datetime.timezone.utc)
+        headers = {
+            'host': self.host,
+            'x-amz-content-sha256': 'UNSIGNED-PAYLOAD',
+            'x-amz-date': f"{now:%Y%m%dT%H%M%SZ}",
+            **(headers or {}),
+        }
+        path = self._path(key)
+        signed_headers, scope, signature = self._signature(method, path, query, headers, now)
+        headers['Authorization'] = (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                    f"SignedHeaders={signed_headers}, Signature={signature}")
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        conn = connection_class(self.host, timeout=self.timeout)
+        url = f"{path}?{urlencode(sorted(query.items()), quote_via=quote, safe='-_.~')}" if query else path
+        conn.request(method, url, body=body, headers=headers)
+        return conn, conn.getresponse()
+
+    def _call(self, method, key='', query=None, body=None, headers=None, allow=()):
+        conn, response = self._request(method, key, query, body, headers)
+        try:
+            data = response.read()
+            if response.status >= 300 and response.status not in allow:
+                raise BlobStoreError(response.status, data[:200].decode('utf-8', 'replace'))
+            return response.status, data
+        finally:
+            conn.close()
+
+    def put(self, key, stream, content_type=None):
+        """Uploads a seekable file-like object; it is streamed, with its length sent up front."""
+        start = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        length = stream.tell() - start
+        stream.seek(start)
+        headers = {'content-length': str(length)}
+        if content_type:
+            headers['content-type'] = content_type
+        self._call('PUT', key, body=stream, headers=headers)
+
+    def put_file(self, key, path, content_type=None):
+        """Uploads a local file under `key`, then removes the local copy."""
+        with open(path, 'rb') as f:
+            self.put(key, f, content_type)
+        os.remove(path)
+
+    def open(self, key):
+        """Yields the blob's bytes in chunks; raises FileNotFoundError if it is missing."""
+        conn, response = self._request('GET', key)
+        if response.status == 404:
+            conn.close()
+            raise FileNotFoundError(key)
+        if response.status >= 300:
+            message = response.read()[:200].decode('utf-8', 'replace')
+            conn.close()
+            raise BlobStoreError(response.status, message)
+
+        def chunks():
+            try:
+                while True:
+                    chunk = response.read(BLOB_CHUNK_BYTES)
+                    if not chunk:
+                        return
+                    yield chunk
+            finally:
+                conn.close()
+        return chunks()
+
+    def read(self, key):
+        return b''.join(self.open(key))
+
+    def size(self, key):
+        conn, response = self._request('HEAD', key)
+        try:
+            response.read()
+            if response.status == 404:
+                return None
+            if response.status >= 300:
+                raise BlobStoreError(response.status, 'HEAD failed')
+            return int(response.getheader('Content-Length', 0))
+        finally:
+            conn.close()
+
+    def delete(self, key):
+        self._call('DELETE', key, allow=(404,))
+
+    def entries(self, prefix=''):
+        """Yields (key, size) for every stored blob whose key starts with `prefix`."""
+        token = None
+        while True:
+            query = {'list-type': '2', 'prefix': prefix}
+            if token:
+                query['continuation-token'] = token
+            _, data = self._call('GET', query=query)
+            root = ET.fromstring(data)
+            ns = root.tag[:root.tag.index('}') + 1] if root.tag.startswith('{') else ''
+            for item in root.iter(f'{ns}Contents'):
+                yield item.findtext(f'{ns}Key'), int(item.findtext(f'{ns}Size') or 0)
+            if root.findtext(f'{ns}IsTruncated') != 'true':
+                return
+            token = root.findtext(f'{ns}NextContinuationToken')
+
+    def url(self, key, ttl=BLOB_URL_TTL_SECONDS):
+        """A presigned GET URL, valid for `ttl` seconds."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        path = self._path(key)
+        query = {
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': f"{self.access_key}/{now:%Y%m%d}/{self.region}/s3/aws4_request",
+            'X-Amz-Date': f"{now:%Y%m%dT%H%M%SZ}",
+            'X-Amz-Expires': str(ttl),
+            'X-Amz-SignedHeaders': 'host',
+        }
+        _, _, signature = self._signature('GET', path, query, {'host': self.host}, now)
+        return (f"{self.endpoint}{path}?{urlencode(sorted(query.items()), quote_via=quote, safe='-_.~')}"
+                f"&X-Amz-Signature={signature}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Returns the configured backend (BLOB_BACKEND), created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if BLOB_BACKEND == 's3':
+                    _store = S3BlobStore()
+                elif BLOB_BACKEND == 'local':
+                    _store = LocalBlobStore()
+                else:
+                    raise ValueError(f"Unknown blob backend '{BLOB_BACKEND}'")
+    return _store
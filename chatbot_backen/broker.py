@@ -0,0 +1,134 @@
+# broker.py - Per-room publish/subscribe channel for pushing new and edited messages
+import json
+import os
+import queue
+import threading
+
+
+def room_channel(chatroom_id):
+    """Returns the broker channel name for a chat room."""
+    return f"chatroom:{chatroom_id}"
+
+
+class Subscription:
+    """A single subscriber's view of a channel."""
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self._queue = queue.Queue()
+
+    def deliver(self, payload):
+        self._queue.put(payload)
+
+    def get(self, timeout=None):
+        """Returns the next payload, or None if nothing arrived within timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    """Fans out events to subscribers inside a single process (tests, `flask run`)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, event):
+        payload = json.dumps(event)
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(payload)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+class RedisBroker(InMemoryBroker):
+    """Fans out events across worker processes through a local Redis pub/sub server.
+
+    Each process keeps one Redis subscriber thread and hands messages to its
+    own in-memory subscribers, so one Redis connection serves every open stream.
+    """
+
+    def __init__(self, url):
+        super().__init__()
+        import redis  # Optional dependency, only needed for multi-worker deployments
+
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(**{'chatroom:*': self._on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=0.5, daemon=True)
+
+    def _on_message(self, message):
+        channel = message['channel']
+        payload = message['data']
+        if isinstance(channel, bytes):
+            channel = channel.decode('utf-8')
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(payload)
+
+    def publish(self, channel, event):
+        self._client.publish(channel, json.dumps(event))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Returns the process-wide broker, configured by MESSAGE_BROKER_URL.
+
+    Without MESSAGE_BROKER_URL events only reach subscribers connected to the
+    same worker process.
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                url = os.environ.get("MESSAGE_BROKER_URL")
+                _broker = RedisBroker(url) if url else InMemoryBroker()
+    return _broker
+
+
+def set_broker(broker):
+    """Replaces the process-wide broker (used by tests)."""
+    global _broker
+    _broker = broker
+
+
+def publish_message(message_json, event='created'):
+    """Publishes a serialized Message to its room's subscribers.
+
+    Publishing is best effort: a broker outage must never fail the request
+    that saved the message, since clients can catch up with `since=`.
+    """
+    try:
+        get_broker().publish(room_channel(message_json['chatRoom']), {
+            'event': event,
+            'cursor': message_json.get('updated_at'),
+            'message': message_json,
+        })
+    except Exception as e:
+        print(f"Error publishing message event: {e}")
@@ -0,0 +1,444 @@
+# cache.py - Cache abstraction with in-process, SQLite (shared by workers on one host) and Redis backends
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+# Backend used by get_cache(): 'memory', 'sqlite' or 'redis'
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+# SQLite file path or redis://host:port/db URL, depending on the backend
+CACHE_URL = os.environ.get("CACHE_URL", "")
+# Maximum entries per cache before least-recently-used ones are evicted
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))
+
+
+class LRUCache:
+    """In-process cache with TTLs and LRU eviction, private to one worker."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, clock=time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (serialized value, expires_at or None)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return json.loads(payload)
+
+    def set(self, key, value, ttl=None):
+        payload = json.dumps(value)
+        expires_at = self._clock() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """Sets `key` only if it is missing or expired; returns whether it was set."""
+        payload = json.dumps(value)
+        with self._lock:
+            entry = self._entries.get(key)
+            now = self._clock()
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                return False
+            self._entries[key] = (payload, now + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def push(self, key, value, max_items, ttl=None):
+        """Prepends `value` to the list at `key`, keeping the newest `max_items`; atomic."""
+        with self._lock:
+            entry = self._entries.get(key)
+            now = self._clock()
+            items = json.loads(entry[0]) if entry is not None and (entry[1] is None or entry[1] > now) else []
+            self._entries[key] = (json.dumps([value] + items[:max_items - 1]), now + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_list(self, key):
+        """Returns the list written by push(), newest first."""
+        return self.get(key) or []
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """Cache stored in a SQLite file, shared by every worker process on one host.
+
+    Uses WAL mode so readers don't block the writer. Eviction removes the
+    least recently accessed rows once the table grows past max_entries. The
+    size is only checked every `trim_every` writes per process (default 1% of
+    max_entries), so the table can briefly run that far over.
+    """
+
+    def __init__(self, path, max_entries=CACHE_MAX_ENTRIES, clock=time.time, trim_every=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.trim_every = trim_every or max(1, max_entries // 100)
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_accessed_at ON cache (accessed_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = self._clock()
+        row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            return None
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        conn = self._connect()
+        now = self._clock()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl if ttl else None, now)
+        )
+        self._wrote(conn, now)
+
+    def _wrote(self, conn, now):
+        with self._writes_lock:
+            self._writes += 1
+            if self._writes < self.trim_every:
+                return
+            self._writes = 0
+        self._trim(conn, now)
+
+    def _trim(self, conn, now):
+        count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (max(0, count - self.max_entries),)
+            )
+
+    def add(self, key, value, ttl=None):
+        """Sets `key` only if it is missing or expired; returns whether it was set."""
+        conn = self._connect()
+        now = self._clock()
+        conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl if ttl else None, now)
+        )
+        return cursor.rowcount == 1
+
+    def push(self, key, value, max_items, ttl=None):
+        """Prepends `value` to the list at `key`, keeping the newest `max_items`.
+
+        Read and write happen in one write transaction, so concurrent workers
+        don't drop each other's items.
+        """
+        conn = self._connect()
+        now = self._clock()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            items = json.loads(row[0]) if row is not None and (row[1] is None or row[1] > now) else []
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps([value] + items[:max_items - 1]), now + ttl if ttl else None, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._wrote(conn, now)
+
+    def get_list(self, key):
+        """Returns the list written by push(), newest first."""
+        return self.get(key) or []
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+
+class RespClient:
+    """Minimal Redis protocol (RESP2) client, one connection per thread."""
+
+    def __init__(self, host='localhost', port=6379, db=0, timeout=2.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url):
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip('/') or 0)
+        return cls(parsed.hostname or 'localhost', parsed.port or 6379, db)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+            if self.db:
+                self.execute('SELECT', self.db)
+        return conn
+
+    def execute(self, *args):
+        sock, reader = self._connection()
+        command = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            command.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        try:
+            sock.sendall(b''.join(command))
+            return self._read_reply(reader)
+        except (OSError, ConnectionError):
+            self._local.conn = None  # Reconnect on the next command
+            raise
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b'+':
+            return body.decode('utf-8')
+        if kind == b'-':
+            raise RuntimeError(body.decode('utf-8'))
+        if kind == b':':
+            return int(body)
+        if kind == b'$':
+            length = int(body)
+            if length == -1:
+                return None
+            return reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(body)
+            return None if length == -1 else [self._read_reply(reader) for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply: {line!r}")
+
+
+class RedisCache:
+    """Cache on a Redis-protocol server, shared across hosts.
+
+    TTLs use SET EX. A sorted set of last-access times per namespace bounds
+    the entry count, evicting the least recently used keys.
+    """
+
+    def __init__(self, client, namespace='cache', max_entries=CACHE_MAX_ENTRIES, clock=time.time):
+        self.client = client
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._clock = clock
+        self._index = f"{namespace}:__lru__"
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key):
+        value = self.client.execute('GET', self._key(key))
+        if value is None:
+            self.client.execute('ZREM', self._index, key)
+            return None
+        self.client.execute('ZADD', self._index, self._clock(), key)
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        args = ['SET', self._key(key), json.dumps(value)]
+        if ttl:
+            args += ['EX', max(1, int(ttl))]
+        self.client.execute(*args)
+        self.client.execute('ZADD', self._index, self._clock(), key)
+        overflow = self.client.execute('ZCARD', self._index) - self.max_entries
+        if overflow > 0:
+            evicted = self.client.execute('ZPOPMIN', self._index, overflow)
+            keys = [self._key(k.decode('utf-8')) for k in evicted[::2]]
+            if keys:
+                self.client.execute('DEL', *keys)
+
+    def add(self, key, value, ttl=None):
+        """Sets `key` only if it is missing (SET NX); returns whether it was set."""
+        args = ['SET', self._key(key), json.dumps(value), 'NX']
+        if ttl:
+            args += ['EX', max(1, int(ttl))]
+        if self.client.execute(*args) is None:
+            return False
+        self.client.execute('ZADD', self._index, self._clock(), key)
+        return True
+
+    def push(self, key, value, max_items, ttl=None):
+        """Prepends `value` to a Redis list (LPUSH + LTRIM), keeping the newest `max_items`.
+
+        Read these keys back with get_list(), not get().
+        """
+        self.client.execute('LPUSH', self._key(key), json.dumps(value))
+        self.client.execute('LTRIM', self._key(key), 0, max_items - 1)
+        if ttl:
+            self.client.execute('EXPIRE', self._key(key), max(1, int(ttl)))
+        self.client.execute('ZADD', self._index, self._clock(), key)
+
+    def get_list(self, key):
+        """Returns the list written by push(), newest first."""
+        return [json.loads(item) for item in self.client.execute('LRANGE', self._key(key), 0, -1) or []]
+
+    def delete(self, key):
+        self.client.execute('DEL', self._key(key))
+        self.client.execute('ZREM', self._index, key)
+
+    def clear(self):
+        keys = self.client.execute('ZRANGE', self._index, 0, -1)
+        if keys:
+            self.client.execute('DEL', *[self._key(k.decode('utf-8')) for k in keys])
+        self.client.execute('DEL', self._index)
+
+
+class NamespacedCache:
+    """Prefixes keys so several caches can share one backend store."""
+
+    def __init__(self, backend, namespace):
+        self.backend = backend
+        self.namespace = namespace
+
+    def get(self, key):
+        return self.backend.get(f"{self.namespace}:{key}")
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(f"{self.namespace}:{key}", value, ttl)
+
+    def add(self, key, value, ttl=None):
+        return self.backend.add(f"{self.namespace}:{key}", value, ttl)
+
+    def push(self, key, value, max_items, ttl=None):
+        self.backend.push(f"{self.namespace}:{key}", value, max_items, ttl)
+
+    def get_list(self, key):
+        return self.backend.get_list(f"{self.namespace}:{key}")
+
+    def delete(self, key):
+        self.backend.delete(f"{self.namespace}:{key}")
+
+
+class FailSafeCache:
+    """Treats backend errors as cache misses, so an unreachable Redis or a locked
+    SQLite file slows requests down instead of failing them.
+
+    Errors are logged; get() returns None, get_list() an empty list, add()
+    returns False (the caller doesn't get the lock) and writes are skipped.
+    """
+
+    def __init__(self, backend, namespace):
+        self.backend = backend
+        self.namespace = namespace
+
+    def _log(self, action, key, error):
+        print(f"Cache '{self.namespace}' {action} failed for {key}, treating as a miss: {error}")
+
+    def get(self, key):
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            self._log('get', key, e)
+            return None
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception as e:
+            self._log('set', key, e)
+
+    def add(self, key, value, ttl=None):
+        try:
+            return self.backend.add(key, value, ttl)
+        except Exception as e:
+            self._log('add', key, e)
+            return False
+
+    def push(self, key, value, max_items, ttl=None):
+        try:
+            self.backend.push(key, value, max_items, ttl)
+        except Exception as e:
+            self._log('push', key, e)
+
+    def get_list(self, key):
+        try:
+            return self.backend.get_list(key)
+        except Exception as e:
+            self._log('get_list', key, e)
+            return []
+
+    def delete(self, key):
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            self._log('delete', key, e)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def create_cache(namespace, backend=None, url=None, max_entries=None):
+    """Builds a cache for `namespace` on the given (or configured) backend."""
+    backend = backend or CACHE_BACKEND
+    url = url if url is not None else CACHE_URL
+    max_entries = max_entries or CACHE_MAX_ENTRIES
+    if backend == 'memory':
+        return LRUCache(max_entries)
+    if backend == 'sqlite':
+        return NamespacedCache(SQLiteCache(url or 'cache.sqlite3', max_entries), namespace)
+    if backend == 'redis':
+        return RedisCache(RespClient.from_url(url or 'redis://localhost:6379/0'), namespace, max_entries)
+    raise ValueError(f"Unknown cache backend '{backend}'")
+
+
+def get_cache(namespace):
+    """Returns the process-wide cache for a namespace, created on first use.
+
+    Backend errors are logged and treated as misses (see FailSafeCache).
+    """
+    with _caches_lock:
+        if namespace not in _caches:
+            _caches[namespace] = FailSafeCache(create_cache(namespace), namespace)
+        return _caches[namespace]
@@ -1,420 +1,883 @@
-# chatbot_api/messages_bp.py
-import os
-from dotenv import load_dotenv
-from flask import Blueprint, request, jsonify
-from mongoengine import DoesNotExist
-from models import ChatRoom, Message
-from werkzeug.utils import secure_filename
-import google.generativeai as genai  # Import the Gemini API library
-import re
-from weather_agent.agent import weather_agent, get_weather, get_current_time, get_weather_forecast
-
-message_bp = Blueprint('messages', __name__, url_prefix='/messages')
-
-load_dotenv()  # Load environment variables from .env
-
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
-
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY environment variable not set!")
-
-genai.configure(api_key=GOOGLE_API_KEY)
-
-# Configure safety settings for less restrictive filtering
-safety_settings = [
-    {
-        "category": "HARM_CATEGORY_HARASSMENT",
-        "threshold": "BLOCK_ONLY_HIGH"
-    },
-    {
-        "category": "HARM_CATEGORY_HATE_SPEECH",
-        "threshold": "BLOCK_ONLY_HIGH"
-    },
-    {
-        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-        "threshold": "BLOCK_ONLY_HIGH"
-    },
-    {
-        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-        "threshold": "BLOCK_ONLY_HIGH"
-    }
-]
-
-# Use gemini-1.5-pro for better image processing
-model = genai.GenerativeModel('gemini-2.5-pro')
-
-UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-
-def is_weather_query(text):
-    """Check if the text contains weather-related keywords."""
-    weather_keywords = [
-        'weather', 'temperature', 'forecast', 'rain', 'raining', 'sunny', 'cloudy', 'snow', 'snowing',
-        'wind', 'windy', 'humidity', 'hot', 'cold', 'warm', 'cool', 'climate', 'storm',
-        'what\'s the weather', 'how\'s the weather', 'weather report', 'weather in',
-        'is it raining', 'is it snowing', 'is it sunny', 'is it cloudy', 'is it windy',
-        'is it hot', 'is it cold', 'is it warm', 'is it cool'
-    ]
-    
-    time_keywords = [
-        'time', 'current time', 'what time', 'time in', 'clock', 'hour', 'minute'
-    ]
-    
-    text_lower = text.lower()
-    
-    # Check for weather keywords
-    for keyword in weather_keywords:
-        if keyword in text_lower:
-            return True, 'weather'
-    
-    # Check for time keywords
-    for keyword in time_keywords:
-        if keyword in text_lower:
-            return True, 'time'
-    
-    return False, None
-
-
-def extract_city_from_query(text):
-    """Extract city name from weather/time query."""
-    # Common patterns for city extraction - order matters!
-    patterns = [
-        # Specific time patterns first
-        r'what\s+time\s+is\s+it\s+(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
-        r'(?:current\s+time|time)\s+(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
-        
-        # Weather-specific patterns
-        r'(?:what\'s|how\'s)\s+the\s+(?:weather|time)\s+(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
-        r'(?:is\s+it|are\s+there)\s+(?:raining|snowing|sunny|cloudy|windy|hot|cold|warm|cool)\s+(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
-        
-        # General patterns last
-        r'(?:weather|forecast|temperature)\s+(?:in|for|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
-        r'(?:rain|snow|sun|wind|storm|temperature|hot|cold|warm|cool)\s+(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
-        r'(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.|,)\s*(?:is\s+it|what\'s|how\'s|weather|raining|snowing)',
-        
-        # Fallback patterns
-        r'([a-zA-Z\s]+?)\s+(?:weather|time|forecast|temperature)',
-    ]
-    
-    text_lower = text.lower()
-    
-    for pattern in patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            city = match.group(1).strip()
-            # Clean up common words that aren't city names
-            exclude_words = ['the', 'a', 'an', 'today', 'tomorrow', 'now', 'current']
-            city_words = [word for word in city.split() if word not in exclude_words]
-            if city_words:
-                return ' '.join(city_words)
-    
-    # Default fallback cities if no city is found
-    return None
-
-
-def handle_weather_query(text):
-    """Handle weather-related queries using the weather agent tools."""
-    is_weather, query_type = is_weather_query(text)
-    
-    if not is_weather:
-        return None
-    
-    city = extract_city_from_query(text)
-    if not city:
-        return {
-            "status": "error",
-            "error_message": "Please specify a city for weather/time information. For example: 'What's the weather in New York?'"
-        }
-    
-    text_lower = text.lower()
-    
-    # Handle forecast queries
-    if 'forecast' in text_lower or 'tomorrow' in text_lower or 'next' in text_lower:
-        days = 3  # Default forecast days
-        if 'tomorrow' in text_lower:
-            days = 1
-        elif '5 day' in text_lower or 'five day' in text_lower:
-            days = 5
-        
-        return get_weather_forecast(city, days)
-    
-    # Handle time queries
-    elif query_type == 'time' or 'time' in text_lower:
-        return get_current_time(city)
-    
-    # Handle weather queries
-    else:
-        return get_weather(city)
-
-
-@message_bp.route('/messages/gemini', methods=['POST'])
-def create_message():
-    """Creates a new message (text or image) and interacts with Gemini."""
-    print("Received a POST request to /messages")
-    print(f"Form data: {dict(request.form)}")
-    print(f"Files: {list(request.files.keys())}")
-
-    try:
-        chatroom_id = request.form.get('chatroom_id')
-        sender = request.form.get('sender')
-
-        if not all([sender, chatroom_id]):
-            print(f"Missing fields - sender: {sender}, chatroom_id: {chatroom_id}")
-            return jsonify({'error': 'Missing required fields (sender and chatroom_id)'}), 400
-
-        try:
-            chatroom = ChatRoom.objects.get(pk=chatroom_id)
-        except ChatRoom.DoesNotExist:
-            print(f"Chatroom not found: {chatroom_id}")
-            return jsonify({'error': 'Chat room not found'}), 404
-
-        # Check if a file was uploaded
-        file_upload = request.files.get('file')  # Use .get to avoid KeyError
-        text = request.form.get('text')
-        
-        print(f"File upload: {file_upload}")
-        print(f"Text: {text}")
-
-        if file_upload:
-            print(f"File filename: {file_upload.filename}")
-            if file_upload.filename == '':
-                print("Empty filename detected")
-                return jsonify({'error': 'No file selected'}), 400
-
-            if file_upload and allowed_file(file_upload.filename):
-                print(f"File allowed, processing...")
-                filename = secure_filename(file_upload.filename)
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                file_upload.save(filepath)
-                print(f"File saved to: {filepath}")
-
-                message = Message(sender=sender, chatRoom=chatroom, image_url=filepath)
-
-                # --- Gemini Integration for Image ---
-                try:
-                    # Open the image file to create prompt
-                    with open(filepath, 'rb') as f:
-                        image_data = f.read()
-
-                    # Formulate the gemini prompt
-                    gemini_prompt_parts = [text if text else "Describe this image",
-                                           {"mime_type": "image/jpeg", "data": image_data}]  # Ensure MIME Type is correct
-
-                    # Generate the Gemini response with safety settings
-                    response = model.generate_content(
-                        gemini_prompt_parts,
-                        safety_settings=safety_settings
-                    )
-
-                    # Check if the response was blocked by safety filters
-                    if hasattr(response, 'candidates') and response.candidates:
-                        candidate = response.candidates[0]
-                        if hasattr(candidate, 'finish_reason'):
-                            if candidate.finish_reason == 1:  # STOP
-                                # Check if response has valid text content
-                                try:
-                                    if response.text:
-                                        gemini_response = response.text
-                                    else:
-                                        gemini_response = "I couldn't generate a response for this image."
-                                except ValueError:
-                                    # This happens when response.text is accessed but no valid parts exist
-                                    gemini_response = "I couldn't generate a response for this image."
-                            elif candidate.finish_reason == 3:  # SAFETY
-                                # Log safety filter details for debugging
-                                safety_ratings = getattr(candidate, 'safety_ratings', [])
-                                print(f"Safety filter triggered. Ratings: {[(rating.category, rating.probability) for rating in safety_ratings]}")
-                                gemini_response = "I'm sorry, but I cannot process this image due to safety guidelines. Please try uploading a different image."
-                            elif candidate.finish_reason == 4:  # RECITATION
-                                gemini_response = "This image appears to contain copyrighted content. Please try a different image."
-                            else:
-                                print(f"Unexpected finish_reason: {candidate.finish_reason}")
-                                gemini_response = "I wasn't able to generate a response for this image. Please try again."
-                        else:
-                            # No finish_reason, try to get text
-                            try:
-                                if response.text:
-                                    gemini_response = response.text
-                                else:
-                                    gemini_response = "I wasn't able to generate a response for this image. Please try again."
-                            except ValueError:
-                                gemini_response = "I wasn't able to generate a response for this image. Please try again."
-                    else:
-                        print("No candidates in response")
-                        gemini_response = "No response was generated for this image. Please try again."
-
-                    #Store the response
-                    message.gemini_response = gemini_response
-                    message.save()
-
-                except Exception as gemini_err:
-                    print(f"Gemini API Error: {gemini_err}")
-                    message.gemini_response = f"Error from Gemini: {gemini_err}"  # Store Error
-                    message.save()
-
-            else:
-                print(f"Invalid file type for file: {file_upload.filename}")
-                return jsonify({'error': 'Invalid file type'}), 400
-
-        elif text:
-            # Handle text-only messages
-            message = Message(text=text, sender=sender, chatRoom=chatroom)
-
-            # Check if this is a weather-related query first
-            weather_response = handle_weather_query(text)
-            
-            if weather_response:
-                if weather_response.get('status') == 'success':
-                    gemini_response = weather_response['report']
-                else:
-                    gemini_response = weather_response.get('error_message', 'Sorry, I couldn\'t process your weather request.')
-                
-                message.gemini_response = gemini_response
-                message.save()
-            else:
-                # --- Standard Gemini Integration for Text ---
-                try:
-                    response = model.generate_content(
-                        text,
-                        safety_settings=safety_settings
-                    )  # Generate the response
-                    
-                    # Safely access response text
-                    try:
-                        gemini_response = response.text  # get the text
-                    except ValueError:
-                        # Handle case where response.text is not available
-                        gemini_response = "I couldn't generate a response to your message. Please try again."
-                    
-                    message.gemini_response = gemini_response #Saves the gemini response to the DB
-                    message.save()
-
-                except Exception as gemini_err:
-                    print(f"Gemini API Error: {gemini_err}")
-                    message.gemini_response = f"Error from Gemini: {gemini_err}"  # Store Error
-                    message.save()
-        else:
-            return jsonify({'error': 'Missing text or file'}), 400  # Neither text nor file
-
-        # Create the AI Message object
-
-        ai_message = Message(
-            text=message.gemini_response,
-            sender='ai',
-            chatRoom=chatroom
-        )
-
-        ai_message.save()
-
-        chatroom.message_count += 1
-        chatroom.save()
-
-        return jsonify(ai_message.to_json()), 201
-
-    except Exception as e:
-        print(f"Error creating message: {e}")
-        return jsonify({'error': str(e)}), 500
-
-
-@message_bp.route('/weather', methods=['POST'])
-def get_weather_info():
-    """Direct endpoint for weather agent queries."""
-    try:
-        data = request.get_json()
-        query = data.get('query', '')
-        chatroom_id = data.get('chatroom_id')
-        
-        if not query:
-            return jsonify({'error': 'Query is required'}), 400
-        
-        if not chatroom_id:
-            return jsonify({'error': 'Chatroom ID is required'}), 400
-        
-        try:
-            chatroom = ChatRoom.objects.get(pk=chatroom_id)
-        except ChatRoom.DoesNotExist:
-            return jsonify({'error': 'Chat room not found'}), 404
-        
-        # Save user message
-        user_message = Message(text=query, sender='user', chatRoom=chatroom)
-        user_message.save()
-        
-        # Handle the weather query
-        weather_response = handle_weather_query(query)
-        
-        if weather_response:
-            if weather_response.get('status') == 'success':
-                response_text = weather_response['report']
-            else:
-                response_text = weather_response.get('error_message', 'Sorry, I couldn\'t process your weather request.')
-        else:
-            response_text = "I can help you with weather information, current time, and forecasts. Please ask about the weather or time in a specific city."
-        
-        # Save AI response
-        ai_message = Message(
-            text=response_text,
-            sender='ai',
-            chatRoom=chatroom,
-            gemini_response=response_text
-        )
-        ai_message.save()
-        
-        chatroom.message_count += 2  # User message + AI response
-        chatroom.save()
-        
-        return jsonify({
-            'user_message': user_message.to_json(),
-            'ai_response': ai_message.to_json()
-        }), 201
-        
-    except Exception as e:
-        print(f"Error handling weather query: {e}")
-        return jsonify({'error': str(e)}), 500
-
-
-@message_bp.route('/weather/capabilities', methods=['GET'])
-def get_weather_capabilities():
-    """Get information about weather agent capabilities."""
-    capabilities = {
-        "supported_functions": [
-            {
-                "name": "get_weather",
-                "description": "Get current weather for a city",
-                "example": "What's the weather in New York?"
-            },
-            {
-                "name": "get_current_time", 
-                "description": "Get current time for a city",
-                "example": "What time is it in Tokyo?"
-            },
-            {
-                "name": "get_weather_forecast",
-                "description": "Get weather forecast for 1-5 days",
-                "example": "What's the forecast for London?"
-            }
-        ],
-        "supported_cities": [
-            "New York", "London", "Paris", "Tokyo", "Los Angeles", "Chicago",
-            "Sydney", "Moscow", "Beijing", "Mumbai", "Dubai", "Singapore",
-            "Berlin", "Rome", "Madrid", "Toronto", "Vancouver", "Mexico City",
-            "São Paulo", "Buenos Aires", "and many more..."
-        ],
-        "example_queries": [
-            "What's the weather in Paris?",
-            "Current time in Tokyo",
-            "5-day forecast for London",
-            "Is it raining in New York?",
-            "Temperature in Sydney"
-        ]
-    }
-    
-    return jsonify(capabilities)
\ No newline at end of file
+# chatbot_api/messages_bp.py
+import os
+import json
+import hashlib
+import functools
+import inspect
+import math
+import time
+import datetime
+from dotenv import load_dotenv
+import mimetypes
+from flask import Blueprint, Response, request, jsonify, send_from_directory, redirect
+from mongoengine import DoesNotExist
+from models import ChatRoom, Message, MessageBucket, RoomStats, IdempotencyKey
+from werkzeug.utils import secure_filename
+import google.generativeai as genai  # Import the Gemini API library
+import re
+from weather_agent.agent import weather_agent, get_weather, get_current_time, get_weather_forecast
+from broker import get_broker, publish_message, room_channel
+from image_pipeline import preprocess_image
+from single_flight import SingleFlight
+from resilience import AdmissionController, CircuitBreaker, CircuitOpenError, HedgedCaller, Overloaded, upstream_failure
+from model_router import ModelRouter, load_tiers
+from agent_runner import AgentRunner, GeminiAgentModel
+from cache import get_cache
+from idempotency import idempotent
+from weather_prefetch import PrefetchScheduler
+from tail_cache import message_tails
+from generation_stats import response_metadata
+from gemini_settings import safety_settings
+from prompt_cache import NearDuplicateCache, PROMPT_CACHE_ENABLED
+from upload_store import get_upload_store, message_blobs
+from blob_store import get_blob_store, new_upload_key, served_key, BLOB_URL_TTL_SECONDS
+
+message_bp = Blueprint('messages', __name__, url_prefix='/messages')
+
+load_dotenv()  # Load environment variables from .env
+
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+
+if not GOOGLE_API_KEY:
+    raise ValueError("GOOGLE_API_KEY environment variable not set!")
+
+genai.configure(api_key=GOOGLE_API_KEY)
+
+# Concurrent identical upstream calls share one request instead of each paying for it
+weather_flight = SingleFlight('weather')
+gemini_flight = SingleFlight('gemini')
+
+# Fail fast while Gemini is erroring instead of making every request wait for it.
+# Only outages count: one user's rejected prompts or images mustn't open it for everyone
+gemini_breaker = CircuitBreaker(
+    'gemini',
+    failure_threshold=int(os.environ.get("GEMINI_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.environ.get("GEMINI_BREAKER_RESET_SECONDS", "30")),
+    is_failure=upstream_failure
+)
+
+# Admission control in front of Gemini: a global concurrency cap with a per-room share,
+# per-room and per-sender token buckets, and a bounded wait queue. Requests beyond
+# that are shed with 429/503 and Retry-After instead of piling onto Gemini.
+gemini_admission = AdmissionController(
+    'gemini',
+    max_concurrent=int(os.environ.get("GEMINI_MAX_CONCURRENT", "8")),
+    max_per_key=int(os.environ.get("GEMINI_MAX_CONCURRENT_PER_ROOM", "2")),
+    max_queue=int(os.environ.get("GEMINI_QUEUE_SIZE", "16")),
+    queue_timeout=float(os.environ.get("GEMINI_QUEUE_TIMEOUT_SECONDS", "10")),
+    rate_limits={
+        'room': (float(os.environ.get("GEMINI_ROOM_RATE_PER_MINUTE", "20")),
+                 int(os.environ.get("GEMINI_ROOM_BURST", "5"))),
+        'sender': (float(os.environ.get("GEMINI_SENDER_RATE_PER_MINUTE", "30")),
+                   int(os.environ.get("GEMINI_SENDER_BURST", "10"))),
+    }
+)
+
+# Optional hedging: set GEMINI_HEDGE_PERCENTILE (e.g. 95) to send a second request
+# once a call runs longer than that percentile of its tier's recent latencies
+GEMINI_HEDGE_PERCENTILE = os.environ.get("GEMINI_HEDGE_PERCENTILE")
+
+
+def _new_hedger():
+    return HedgedCaller(
+        percentile=float(GEMINI_HEDGE_PERCENTILE),
+        min_samples=int(os.environ.get("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+    )
+
+
+# Short chit-chat goes to a flash model, images and long prompts to gemini-2.5-pro
+model_router = ModelRouter(
+    load_tiers(),
+    model_factory=genai.GenerativeModel,
+    hedger_factory=_new_hedger if GEMINI_HEDGE_PERCENTILE else None
+)
+
+# Successful weather results are cached in the configured backend (CACHE_BACKEND),
+# so every worker process can reuse them
+WEATHER_CACHE_TTL_SECONDS = int(os.environ.get("WEATHER_CACHE_TTL_SECONDS", "600"))
+FORECAST_CACHE_TTL_SECONDS = int(os.environ.get("FORECAST_CACHE_TTL_SECONDS", "1800"))
+weather_cache = get_cache('weather')
+
+
+def _shared_tool(tool, ttl, name):
+    """Wraps a weather tool with the shared cache and single-flight coalescing.
+
+    Successful lookups are counted towards prefetching under `name`, whether
+    they come from the weather agent or from keyword routing.
+    """
+    signature = inspect.signature(tool)
+
+    def prepare(args, kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (tool.__name__,) + tuple(
+            value.lower() if isinstance(value, str) else value for value in bound.arguments.values()
+        )
+        return bound, key, ':'.join(str(part) for part in key)
+
+    def fetch(bound, key, cache_key):
+        result = weather_flight.do(key, tool, *bound.args, **bound.kwargs)
+        if result.get('status') == 'success':
+            weather_cache.set(cache_key, result, ttl)
+        return result
+
+    @functools.wraps(tool)
+    def wrapper(*args, **kwargs):
+        bound, key, cache_key = prepare(args, kwargs)
+        result = weather_cache.get(cache_key)
+        fetched = result is None
+        if fetched:
+            result = fetch(bound, key, cache_key)
+        if WEATHER_PREFETCH_ENABLED and result.get('status') == 'success':
+            weather_prefetcher.record(name, *key[1:], fetched=fetched)
+        return result
+
+    def refresh(*args, **kwargs):
+        """Fetches upstream and rewrites the cache entry, skipping the cache read."""
+        return fetch(*prepare(args, kwargs))
+
+    wrapper.refresh = refresh
+    wrapper.ttl = ttl
+    return wrapper
+
+
+cached_get_weather = _shared_tool(get_weather, WEATHER_CACHE_TTL_SECONDS, 'weather')
+cached_get_weather_forecast = _shared_tool(get_weather_forecast, FORECAST_CACHE_TTL_SECONDS, 'forecast')
+
+# Popular cities are refreshed in the background before their entries expire
+# (WEATHER_PREFETCH_* settings). Each worker process tracks its own requests,
+# and a per-city lock in the weather cache keeps workers from refreshing twice
+WEATHER_PREFETCH_ENABLED = os.environ.get("WEATHER_PREFETCH_ENABLED", "true").lower() == "true"
+weather_prefetcher = PrefetchScheduler({
+    'weather': cached_get_weather,
+    'forecast': cached_get_weather_forecast,
+}, locks=weather_cache)
+
+# Runs the ADK weather agent's model and tools in-process; several tool calls in
+# one step (e.g. "weather and time in Tokyo and Paris") run concurrently
+USE_WEATHER_AGENT = os.environ.get("USE_WEATHER_AGENT", "true").lower() == "true"
+weather_runner = AgentRunner(
+    GeminiAgentModel(weather_agent.model, weather_agent.tools, weather_agent.instruction, safety_settings),
+    tools=[cached_get_weather, get_current_time, cached_get_weather_forecast]
+)
+
+# Text prompts that differ only trivially from a recent one reuse its reply
+# (PROMPT_CACHE_* settings; per worker process)
+prompt_cache = NearDuplicateCache() if PROMPT_CACHE_ENABLED else None
+
+GEMINI_UNAVAILABLE_REPLY = "Gemini is temporarily unavailable. Please try again in a moment."
+
+UPLOAD_FOLDER = 'uploads'
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+if not os.path.exists(UPLOAD_FOLDER):
+    os.makedirs(UPLOAD_FOLDER)
+
+# Blob keys are never reused (thumbnails are content-addressed), so clients may cache them indefinitely
+THUMBNAIL_CACHE_SECONDS = int(os.environ.get("THUMBNAIL_CACHE_SECONDS", str(365 * 24 * 3600)))
+# Key prefixes /blobs/ serves; model copies stay private
+SERVED_BLOB_PREFIXES = ('originals/', 'thumbs/')
+# Signed URLs are reused for half their lifetime, so repeat views hit the browser cache
+blob_urls = get_cache('blob_urls')
+
+# Seconds between SSE keep-alive comments, keeps proxies from closing idle streams
+SSE_KEEPALIVE_SECONDS = int(os.environ.get("SSE_KEEPALIVE_SECONDS", "15"))
+
+
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def _prompt_key(contents):
+    """Builds a hashable key for a Gemini prompt, hashing any inline image data."""
+    if isinstance(contents, str):
+        return (contents,)
+    key = []
+    for part in contents:
+        if isinstance(part, dict):
+            key.append((part['mime_type'], hashlib.sha1(part['data']).hexdigest()))
+        else:
+            key.append(part)
+    return tuple(key)
+
+
+def _call_gemini(contents, tier, room=None):
+    """Calls Gemini on the routed tier through admission control and the circuit breaker."""
+    with gemini_admission.slot(room):
+        return gemini_breaker.call(
+            model_router.generate,
+            tier,
+            contents,
+            safety_settings=safety_settings
+        )
+
+
+def _sender_key(sender):
+    """Identifies a sender for rate limiting; the form's sender is only 'user' or 'ai'."""
+    return f"{sender}@{request.access_route[0] if request.access_route else request.remote_addr}"
+
+
+def _overloaded_response(err):
+    response = jsonify({'error': str(err)})
+    response.status_code = err.status
+    response.headers['Retry-After'] = str(max(1, math.ceil(err.retry_after)))
+    return response
+
+
+def _generation_metadata(response, served_by, latency_seconds, cache_hit):
+    """Extracts the fields stored on the AI Message about how its reply was generated."""
+    return {
+        'generation_model': served_by.model_name,
+        'generation_latency_ms': round(latency_seconds * 1000, 1),
+        **response_metadata(response),
+        'cache_hit': cache_hit,
+    }
+
+
+def generate_content(contents, tier, room=None, sender=None):
+    """Calls Gemini, joining an identical prompt that is already in flight.
+
+    Raises CircuitOpenError without calling Gemini while the circuit is open,
+    and Overloaded when the room or sender is over its rate or Gemini is saturated.
+
+    Returns:
+        tuple: (response, generation metadata for the AI Message)
+    """
+    gemini_admission.check_rate(room=room, sender=sender)
+    start = time.monotonic()
+    (response, served_by), shared = gemini_flight.do_shared(
+        (tier.name,) + _prompt_key(contents), _call_gemini, contents, tier, room
+    )
+    return response, _generation_metadata(response, served_by, time.monotonic() - start, cache_hit=shared)
+
+
+def _cached_reply(text, tier):
+    """Returns (reply, generation metadata) saved for a near-duplicate prompt, or None."""
+    if prompt_cache is None:
+        return None
+    start = time.monotonic()
+    hit = prompt_cache.get(text, scope=tier.name)
+    if hit is None:
+        return None
+    (reply, model_name), _ = hit
+    return reply, {
+        'generation_model': model_name,
+        'generation_latency_ms': round((time.monotonic() - start) * 1000, 1),
+        'finish_reason': 'STOP',
+        'cache_hit': True,
+    }
+
+
+def _remember_reply(text, tier, reply, generation):
+    """Caches a complete reply so near-duplicate prompts can reuse it."""
+    if prompt_cache is not None and reply and generation.get('finish_reason') == 'STOP' \
+            and not generation.get('cache_hit'):
+        prompt_cache.put(text, (reply, generation['generation_model']), scope=tier.name)
+
+
+def _append_to_history(message, revision):
+    """Adds a saved message to its room's in-memory tail (see tail_cache.py) and history bucket."""
+    message_tails.append(message.chatroom_id(), str(message.pk), json.dumps(message.to_json()), revision)
+    MessageBucket.append(message)
+
+
+def is_weather_query(text):
+    """Check if the text contains weather-related keywords."""
+    weather_keywords = [
+        'weather', 'temperature', 'forecast', 'rain', 'raining', 'sunny', 'cloudy', 'snow', 'snowing',
+        'wind', 'windy', 'humidity', 'hot', 'cold', 'warm', 'cool', 'climate', 'storm',
+        'what\'s the weather', 'how\'s the weather', 'weather report', 'weather in',
+        'is it raining', 'is it snowing', 'is it sunny', 'is it cloudy', 'is it windy',
+        'is it hot', 'is it cold', 'is it warm', 'is it cool'
+    ]
+    
+    time_keywords = [
+        'time', 'current time', 'what time', 'time in', 'clock', 'hour', 'minute'
+    ]
+    
+    text_lower = text.lower()
+    
+    # Check for weather keywords
+    for keyword in weather_keywords:
+        if keyword in text_lower:
+            return True, 'weather'
+    
+    # Check for time keywords
+    for keyword in time_keywords:
+        if keyword in text_lower:
+            return True, 'time'
+    
+    return False, None
+
+
+def extract_city_from_query(text):
+    """Extract city name from weather/time query."""
+    # Common patterns for city extraction - order matters!
+    patterns = [
+        # Specific time patterns first
+        r'what\s+time\s+is\s+it\s+(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
+        r'(?:current\s+time|time)\s+(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
+        
+        # Weather-specific patterns
+        r'(?:what\'s|how\'s)\s+the\s+(?:weather|time)\s+(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
+        r'(?:is\s+it|are\s+there)\s+(?:raining|snowing|sunny|cloudy|windy|hot|cold|warm|cool)\s+(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
+        
+        # General patterns last
+        r'(?:weather|forecast|temperature)\s+(?:in|for|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
+        r'(?:rain|snow|sun|wind|storm|temperature|hot|cold|warm|cool)\s+(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.)',
+        r'(?:in|at)\s+([a-zA-Z\s]+?)(?:\?|$|\.|,)\s*(?:is\s+it|what\'s|how\'s|weather|raining|snowing)',
+        
+        # Fallback patterns
+        r'([a-zA-Z\s]+?)\s+(?:weather|time|forecast|temperature)',
+    ]
+    
+    text_lower = text.lower()
+    
+    for pattern in patterns:
+        match = re.search(pattern, text_lower)
+        if match:
+            city = match.group(1).strip()
+            # Clean up common words that aren't city names
+            exclude_words = ['the', 'a', 'an', 'today', 'tomorrow', 'now', 'current']
+            city_words = [word for word in city.split() if word not in exclude_words]
+            if city_words:
+                return ' '.join(city_words)
+    
+    # Default fallback cities if no city is found
+    return None
+
+
+def handle_weather_query(text):
+    """Handle weather-related queries using the weather agent tools."""
+    is_weather, query_type = is_weather_query(text)
+    
+    if not is_weather:
+        return None
+    
+    city = extract_city_from_query(text)
+    if not city:
+        return {
+            "status": "error",
+            "error_message": "Please specify a city for weather/time information. For example: 'What's the weather in New York?'"
+        }
+    
+    text_lower = text.lower()
+    
+    # Handle forecast queries
+    if 'forecast' in text_lower or 'tomorrow' in text_lower or 'next' in text_lower:
+        days = 3  # Default forecast days
+        if 'tomorrow' in text_lower:
+            days = 1
+        elif '5 day' in text_lower or 'five day' in text_lower:
+            days = 5
+        
+        return cached_get_weather_forecast(city, days)
+    
+    # Handle time queries
+    elif query_type == 'time' or 'time' in text_lower:
+        return get_current_time(city)
+    
+    # Handle weather queries
+    else:
+        return cached_get_weather(city)
+
+
+def answer_weather_query(text, room=None, sender=None):
+    """Answers weather/time questions with the weather agent.
+
+    Falls back to keyword routing (handle_weather_query) if the agent is
+    disabled or Gemini fails. Returns None for non-weather messages.
+    The agent's Gemini calls go through admission control like any other,
+    so this raises Overloaded when the room or sender is over its rate or
+    Gemini is saturated.
+    """
+    is_weather, _ = is_weather_query(text)
+    if not is_weather:
+        return None
+
+    if USE_WEATHER_AGENT:
+        gemini_admission.check_rate(room=room, sender=sender)
+        try:
+            with gemini_admission.slot(room):
+                # AgentError (no answer within the step limit, an empty reply) isn't an outage,
+                # so upstream_failure leaves it out of the breaker's count
+                return {"status": "success", "report": gemini_breaker.call(weather_runner.run, text)}
+        except Overloaded:
+            raise
+        except Exception as agent_err:
+            print(f"Weather agent error, falling back to keyword routing: {agent_err}")
+
+    return handle_weather_query(text)
+
+
+@message_bp.route('/messages/gemini', methods=['POST'])
+@idempotent(IdempotencyKey)
+def create_message():
+    """Creates a new message (text or image) and interacts with Gemini."""
+    print("Received a POST request to /messages")
+    print(f"Form data: {dict(request.form)}")
+    print(f"Files: {list(request.files.keys())}")
+
+    try:
+        chatroom_id = request.form.get('chatroom_id')
+        sender = request.form.get('sender')
+        generation = {}  # Filled in when Gemini produces the reply
+
+        if not all([sender, chatroom_id]):
+            print(f"Missing fields - sender: {sender}, chatroom_id: {chatroom_id}")
+            return jsonify({'error': 'Missing required fields (sender and chatroom_id)'}), 400
+
+        try:
+            chatroom = ChatRoom.objects.get(pk=chatroom_id)
+        except ChatRoom.DoesNotExist:
+            print(f"Chatroom not found: {chatroom_id}")
+            return jsonify({'error': 'Chat room not found'}), 404
+
+        # Check if a file was uploaded
+        file_upload = request.files.get('file')  # Use .get to avoid KeyError
+        text = request.form.get('text')
+        
+        print(f"File upload: {file_upload}")
+        print(f"Text: {text}")
+
+        if file_upload:
+            print(f"File filename: {file_upload.filename}")
+            if file_upload.filename == '':
+                print("Empty filename detected")
+                return jsonify({'error': 'No file selected'}), 400
+
+            if file_upload and allowed_file(file_upload.filename):
+                print(f"File allowed, processing...")
+                filename = secure_filename(file_upload.filename)
+                image_key = new_upload_key(filename)
+                # Local working copy for preprocessing, moved into blob storage once answered
+                filepath = os.path.join(UPLOAD_FOLDER, image_key)
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                file_upload.save(filepath)
+                print(f"File saved to: {filepath}")
+
+                # Downscale for Gemini and render a thumbnail off the request worker
+                processed = preprocess_image(filepath)
+
+                message = Message(sender=sender, chatRoom=chatroom, image_url=image_key,
+                                  thumbnail=processed['thumbnail'] if processed else None)
+
+                # --- Gemini Integration for Image ---
+                try:
+                    # Send the downscaled copy, falling back to the original if preprocessing failed
+                    if processed:
+                        image_path, mime_type = processed['model_path'], processed['mime_type']
+                    else:
+                        image_path = filepath
+                        mime_type = mimetypes.guess_type(filepath)[0] or 'image/jpeg'
+
+                    with open(image_path, 'rb') as f:
+                        image_data = f.read()
+
+                    # Formulate the gemini prompt
+                    gemini_prompt_parts = [text if text else "Describe this image",
+                                           {"mime_type": mime_type, "data": image_data}]
+
+                    # Generate the Gemini response with safety settings
+                    tier = model_router.choose(text, has_image=True, room_preference=chatroom.model_tier)
+                    response, generation = generate_content(
+                        gemini_prompt_parts, tier, room=chatroom_id, sender=_sender_key(sender)
+                    )
+
+                    # Check if the response was blocked by safety filters
+                    if hasattr(response, 'candidates') and response.candidates:
+                        candidate = response.candidates[0]
+                        if hasattr(candidate, 'finish_reason'):
+                            if candidate.finish_reason == 1:  # STOP
+                                # Check if response has valid text content
+                                try:
+                                    if response.text:
+                                        gemini_response = response.text
+                                    else:
+                                        gemini_response = "I couldn't generate a response for this image."
+                                except ValueError:
+                                    # This happens when response.text is accessed but no valid parts exist
+                                    gemini_response = "I couldn't generate a response for this image."
+                            elif candidate.finish_reason == 3:  # SAFETY
+                                # Log safety filter details for debugging
+                                safety_ratings = getattr(candidate, 'safety_ratings', [])
+                                print(f"Safety filter triggered. Ratings: {[(rating.category, rating.probability) for rating in safety_ratings]}")
+                                gemini_response = "I'm sorry, but I cannot process this image due to safety guidelines. Please try uploading a different image."
+                            elif candidate.finish_reason == 4:  # RECITATION
+                                gemini_response = "This image appears to contain copyrighted content. Please try a different image."
+                            else:
+                                print(f"Unexpected finish_reason: {candidate.finish_reason}")
+                                gemini_response = "I wasn't able to generate a response for this image. Please try again."
+                        else:
+                            # No finish_reason, try to get text
+                            try:
+                                if response.text:
+                                    gemini_response = response.text
+                                else:
+                                    gemini_response = "I wasn't able to generate a response for this image. Please try again."
+                            except ValueError:
+                                gemini_response = "I wasn't able to generate a response for this image. Please try again."
+                    else:
+                        print("No candidates in response")
+                        gemini_response = "No response was generated for this image. Please try again."
+
+                    #Store the response
+                    reply_text = gemini_response
+
+                except Overloaded:
+                    # Shed before anything is stored; the client retries later
+                    _discard_upload(filepath, processed)
+                    raise
+
+                except CircuitOpenError as circuit_err:
+                    print(f"Gemini circuit open: {circuit_err}")
+                    reply_text = GEMINI_UNAVAILABLE_REPLY
+
+                except Exception as gemini_err:
+                    print(f"Gemini API Error: {gemini_err}")
+                    reply_text = f"Error from Gemini: {gemini_err}"  # Store Error
+
+                _store_upload(message, filepath, processed)
+
+            else:
+                print(f"Invalid file type for file: {file_upload.filename}")
+                return jsonify({'error': 'Invalid file type'}), 400
+
+        elif text:
+            # Handle text-only messages
+            message = Message(text=text, sender=sender, chatRoom=chatroom)
+
+            # Check if this is a weather-related query first
+            weather_response = answer_weather_query(text, room=chatroom_id, sender=_sender_key(sender))
+            
+            if weather_response:
+                if weather_response.get('status') == 'success':
+                    gemini_response = weather_response['report']
+                else:
+                    gemini_response = weather_response.get('error_message', 'Sorry, I couldn\'t process your weather request.')
+                
+                reply_text = gemini_response
+            else:
+                # --- Standard Gemini Integration for Text ---
+                try:
+                    tier = model_router.choose(text, room_preference=chatroom.model_tier)
+                    cached = _cached_reply(text, tier)
+                    if cached:
+                        gemini_response, generation = cached
+                    else:
+                        response, generation = generate_content(
+                            text, tier, room=chatroom_id, sender=_sender_key(sender)
+                        )  # Generate the response
+
+                        # Safely access response text
+                        try:
+                            gemini_response = response.text  # get the text
+                            _remember_reply(text, tier, gemini_response, generation)
+                        except ValueError:
+                            # Handle case where response.text is not available
+                            gemini_response = "I couldn't generate a response to your message. Please try again."
+                    
+                    reply_text = gemini_response
+
+                except Overloaded:
+                    raise  # Shed before anything is stored; the client retries later
+
+                except CircuitOpenError as circuit_err:
+                    print(f"Gemini circuit open: {circuit_err}")
+                    reply_text = GEMINI_UNAVAILABLE_REPLY
+
+                except Exception as gemini_err:
+                    print(f"Gemini API Error: {gemini_err}")
+                    reply_text = f"Error from Gemini: {gemini_err}"  # Store Error
+        else:
+            return jsonify({'error': 'Missing text or file'}), 400  # Neither text nor file
+
+        # Create the AI Message object
+
+        ai_message = Message(
+            text=reply_text,
+            sender='ai',
+            chatRoom=chatroom,
+            **generation
+        )
+
+        ai_message.save()
+        message.reply = ai_message  # The reply text is stored once, on the AI message
+        message.save()
+
+        # The exchange adds one to message_count; the AI reply becomes the room's preview
+        _append_to_history(message, ChatRoom.record_message(message))
+        _append_to_history(ai_message, ChatRoom.record_message(ai_message, count=0))
+
+        RoomStats.record(message)
+        RoomStats.record(ai_message)
+
+        publish_message(message.to_json())
+        publish_message(ai_message.to_json())
+
+        return jsonify(ai_message.to_json()), 201
+
+    except Overloaded as overloaded:
+        print(f"Gemini request shed: {overloaded}")
+        return _overloaded_response(overloaded)
+
+    except Exception as e:
+        print(f"Error creating message: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@message_bp.route('/weather', methods=['POST'])
+@idempotent(IdempotencyKey)
+def get_weather_info():
+    """Direct endpoint for weather agent queries."""
+    try:
+        data = request.get_json()
+        query = data.get('query', '')
+        chatroom_id = data.get('chatroom_id')
+        
+        if not query:
+            return jsonify({'error': 'Query is required'}), 400
+        
+        if not chatroom_id:
+            return jsonify({'error': 'Chatroom ID is required'}), 400
+        
+        try:
+            chatroom = ChatRoom.objects.get(pk=chatroom_id)
+        except ChatRoom.DoesNotExist:
+            return jsonify({'error': 'Chat room not found'}), 404
+        
+        # User message, saved with a reference to the reply below
+        user_message = Message(text=query, sender='user', chatRoom=chatroom)
+        
+        # Handle the weather query
+        weather_response = answer_weather_query(query, room=chatroom_id, sender=_sender_key('user'))
+        
+        if weather_response:
+            if weather_response.get('status') == 'success':
+                response_text = weather_response['report']
+            else:
+                response_text = weather_response.get('error_message', 'Sorry, I couldn\'t process your weather request.')
+        else:
+            response_text = "I can help you with weather information, current time, and forecasts. Please ask about the weather or time in a specific city."
+        
+        # Save AI response
+        ai_message = Message(
+            text=response_text,
+            sender='ai',
+            chatRoom=chatroom
+        )
+        ai_message.save()
+        user_message.reply = ai_message
+        user_message.save()
+        
+        _append_to_history(user_message, ChatRoom.record_message(user_message))
+        _append_to_history(ai_message, ChatRoom.record_message(ai_message))
+
+        RoomStats.record(user_message)
+        RoomStats.record(ai_message)
+
+        publish_message(user_message.to_json())
+        publish_message(ai_message.to_json())
+        
+        return jsonify({
+            'user_message': user_message.to_json(),
+            'ai_response': ai_message.to_json()
+        }), 201
+
+    except Overloaded as overloaded:
+        print(f"Weather request shed: {overloaded}")
+        return _overloaded_response(overloaded)
+
+    except Exception as e:
+        print(f"Error handling weather query: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+def _store_upload(message, filepath, processed):
+    """Moves an upload and its derived images into blob storage and counts the message's references."""
+    blobs = get_blob_store()
+    try:
+        blobs.put_file(message.image_url, filepath, mimetypes.guess_type(filepath)[0])
+        if processed:
+            for key, path, mime_type in (
+                (f"thumbs/{processed['thumbnail']}", processed['thumbnail_path'], None),
+                (f"model/{os.path.basename(processed['model_path'])}", processed['model_path'], processed['mime_type']),
+            ):
+                if os.path.exists(path):  # An identical concurrent upload may have stored it already
+                    blobs.put_file(key, path, mime_type or mimetypes.guess_type(path)[0])
+        get_upload_store().acquire(message_blobs(message.image_url, message.thumbnail))
+    except Exception as e:
+        print(f"Error storing upload {message.image_url}: {e}")
+
+
+def _discard_upload(filepath, processed):
+    """Deletes the working files of an upload whose request was shed, so nothing references them."""
+    blobs = get_blob_store()
+    store = get_upload_store()
+    paths = [filepath]
+    if processed:
+        for key, path in (
+            (f"thumbs/{processed['thumbnail']}", processed['thumbnail_path']),
+            (f"model/{os.path.basename(processed['model_path'])}", processed['model_path']),
+        ):
+            # Derived images are content-addressed: on the local backend this may be
+            # the very file an earlier identical upload stored
+            stored = blobs.per_host and blobs.local_path(key) == os.path.abspath(path)
+            if not (stored and store.in_use(key)):
+                paths.append(path)
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error discarding upload file {path}: {e}")
+
+
+def _serve_blob(key):
+    """Streams a blob from local storage, or redirects to a signed URL on a shared backend."""
+    try:
+        get_upload_store().touch(key)
+    except Exception as e:
+        print(f"Error recording upload access {key}: {e}")
+    blobs = get_blob_store()
+    url = blob_urls.get(key)
+    if url is None:
+        url = blobs.url(key)
+        if url is not None:
+            blob_urls.set(key, url, BLOB_URL_TTL_SECONDS // 2)
+    if url is not None:
+        response = redirect(url, 302)
+        response.headers['Cache-Control'] = f'private, max-age={BLOB_URL_TTL_SECONDS // 2}'
+        return response
+    response = send_from_directory(os.path.abspath(blobs.root), key, max_age=THUMBNAIL_CACHE_SECONDS)
+    response.headers['Cache-Control'] = f'public, max-age={THUMBNAIL_CACHE_SECONDS}, immutable'
+    return response
+
+
+@message_bp.route('/thumbnails/<path:filename>', methods=['GET'])
+def get_thumbnail(filename):
+    """Serves an image thumbnail with long-lived cache headers."""
+    key = served_key(f"thumbs/{filename}", ('thumbs/',))
+    if key is None:
+        return jsonify({'error': 'Not found'}), 404
+    return _serve_blob(key)
+
+
+@message_bp.route('/blobs/<path:key>', methods=['GET'])
+def get_blob(key):
+    """Serves an uploaded image by its blob key (the message's `image`)."""
+    key = served_key(key, SERVED_BLOB_PREFIXES)
+    if key is None:
+        return jsonify({'error': 'Not found'}), 404
+    return _serve_blob(key)
+
+
+@message_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Returns in-process counters for this worker."""
+    return jsonify({
+        'single_flight': {
+            'weather': weather_flight.stats(),
+            'gemini': gemini_flight.stats(),
+        },
+        'gemini_circuit_breaker': gemini_breaker.stats(),
+        'gemini_admission': gemini_admission.stats(),
+        'gemini_tiers': model_router.stats(),
+        'weather_agent': weather_runner.stats(),
+        'weather_prefetch': weather_prefetcher.stats(),
+        'message_tails': message_tails.stats(),
+        'prompt_cache': prompt_cache.stats() if prompt_cache is not None else None,
+        'uploads': get_upload_store().stats(),
+    })
+
+
+@message_bp.route('/weather/capabilities', methods=['GET'])
+def get_weather_capabilities():
+    """Get information about weather agent capabilities."""
+    capabilities = {
+        "supported_functions": [
+            {
+                "name": "get_weather",
+                "description": "Get current weather for a city",
+                "example": "What's the weather in New York?"
+            },
+            {
+                "name": "get_current_time", 
+                "description": "Get current time for a city",
+                "example": "What time is it in Tokyo?"
+            },
+            {
+                "name": "get_weather_forecast",
+                "description": "Get weather forecast for 1-5 days",
+                "example": "What's the forecast for London?"
+            }
+        ],
+        "supported_cities": [
+            "New York", "London", "Paris", "Tokyo", "Los Angeles", "Chicago",
+            "Sydney", "Moscow", "Beijing", "Mumbai", "Dubai", "Singapore",
+            "Berlin", "Rome", "Madrid", "Toronto", "Vancouver", "Mexico City",
+            "São Paulo", "Buenos Aires", "and many more..."
+        ],
+        "example_queries": [
+            "What's the weather in Paris?",
+            "Current time in Tokyo",
+            "5-day forecast for London",
+            "Is it raining in New York?",
+            "Temperature in Sydney"
+        ]
+    }
+    
+    return jsonify(capabilities)
+
+
+def _sse_event(event):
+    """Formats a broker event as a Server-Sent Events frame."""
+    return f"id: {event['cursor']}\nevent: {event['event']}\ndata: {json.dumps(event['message'])}\n\n"
+
+
+@message_bp.route('/chatRooms/<chatroom_id>/events', methods=['GET'])
+def stream_chatroom_events(chatroom_id):
+    """Streams new and edited messages for a chat room as Server-Sent Events.
+
+    A reconnecting client passes `?since=<cursor>` (or the Last-Event-ID header
+    EventSource sends automatically) to replay what it missed. The replay may
+    overlap with live events, so clients should upsert messages by id.
+    """
+    try:
+        chatroom = ChatRoom.objects.get(pk=chatroom_id)
+    except ChatRoom.DoesNotExist:
+        return jsonify({'error': 'Chat room not found'}), 404
+
+    since = request.args.get('since') or request.headers.get('Last-Event-ID')
+    if since:
+        try:
+            since = datetime.datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({'error': 'Invalid since cursor'}), 400
+
+    # Subscribe before reading the backlog so nothing saved in between is lost
+    subscription = get_broker().subscribe(room_channel(chatroom_id))
+    backlog = []
+    if since:
+        backlog = list(Message.objects(chatRoom=chatroom, updated_at__gt=since).order_by('updated_at'))
+
+    def generate():
+        try:
+            for message in backlog:
+                message_json = message.to_json()
+                yield _sse_event({'event': 'created', 'cursor': message_json['updated_at'], 'message': message_json})
+            while True:
+                payload = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                if payload is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse_event(json.loads(payload))
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Disable proxy buffering so events are flushed immediately
+    })
@@ -0,0 +1,44 @@
+# compression.py - Compressed storage form for long text fields
+import bz2
+import lzma
+import os
+import zlib
+
+# Text shorter than this (UTF-8 bytes) is stored as a plain string
+TEXT_COMPRESS_MIN_BYTES = int(os.environ.get("TEXT_COMPRESS_MIN_BYTES", "1024"))
+# Codec for newly written text: 'zlib', 'bz2' or 'lzma'; stored values record their own
+TEXT_COMPRESS_ALGORITHM = os.environ.get("TEXT_COMPRESS_ALGORITHM", "zlib")
+
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+    'bz2': (bz2.compress, bz2.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+def is_compressed(stored):
+    return isinstance(stored, dict) and 'codec' in stored
+
+
+def compress_text(text, algorithm=TEXT_COMPRESS_ALGORITHM, min_bytes=TEXT_COMPRESS_MIN_BYTES):
+    """Returns the stored form of `text`: the string itself, or a tagged compressed subdocument.
+
+    The subdocument keeps the character count, so aggregations can measure the
+    text without decompressing it.
+    """
+    if not isinstance(text, str):
+        return text
+    data = text.encode('utf-8')
+    if len(data) < min_bytes:
+        return text
+    packed = CODECS[algorithm][0](data)
+    if len(packed) >= len(data):
+        return text
+    return {'codec': algorithm, 'data': packed, 'chars': len(text)}  # bytes are stored as BSON binary
+
+
+def expand_text(stored):
+    """Inverse of compress_text; plain strings and None pass through."""
+    if not is_compressed(stored):
+        return stored
+    return CODECS[stored['codec']][1](bytes(stored['data'])).decode('utf-8')
@@ -0,0 +1,149 @@
+# db_pool.py - MySQL connection pool settings, checkout instrumentation and read-replica routing
+import os
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from resilience import LatencyTracker
+
+# Pool sizing per worker process: DB_POOL_SIZE kept open, up to DB_MAX_OVERFLOW more under load
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "5"))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+# PythonAnywhere closes connections idle for 300s; recycle them before that happens
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "280"))
+# Optional read replica host; read-only endpoints use it when set
+DB_REPLICA_HOST = os.environ.get("DB_REPLICA_HOST")
+
+
+def database_uri(host):
+    return (
+        f"mysql+pymysql://{os.environ.get('DB_USER')}:"
+        f"{os.environ.get('DB_PASSWORD')}@"
+        f"{host}/"
+        f"{os.environ.get('DB_NAME')}"
+    )
+
+
+class PoolMonitor:
+    """Records how long connection checkouts take and how full the pool gets."""
+
+    def __init__(self, name, window=500):
+        self.name = name
+        self.latencies = LatencyTracker(window)
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._peak_in_use = 0
+        self._pool = None
+
+    def pool_class(self):
+        """A QueuePool subclass timing each checkout; survives pool recreation."""
+        monitor = self
+
+        class TimedQueuePool(QueuePool):
+            def connect(self):
+                start = time.perf_counter()
+                try:
+                    connection = super().connect()
+                except PoolTimeoutError:
+                    monitor.record(time.perf_counter() - start, self, timed_out=True)
+                    raise
+                monitor.record(time.perf_counter() - start, self)
+                return connection
+
+        return TimedQueuePool
+
+    def record(self, seconds, pool, timed_out=False):
+        self.latencies.record(seconds)
+        with self._lock:
+            self._pool = pool
+            if timed_out:
+                self._timeouts += 1
+                return
+            self._checkouts += 1
+            self._peak_in_use = max(self._peak_in_use, pool.checkedout())
+
+    def stats(self):
+        with self._lock:
+            pool = self._pool
+            stats = {
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'peak_in_use': self._peak_in_use,
+            }
+        capacity = DB_POOL_SIZE + DB_MAX_OVERFLOW
+        in_use = pool.checkedout() if pool is not None else 0
+        stats.update({
+            'in_use': in_use,
+            'capacity': capacity,
+            'saturation': round(in_use / capacity, 3) if capacity else None,
+            'checkout_ms': {
+                f'p{p}': round(self.latencies.percentile(p) * 1000, 2) if len(self.latencies) else None
+                for p in (50, 95, 99)
+            },
+        })
+        return stats
+
+
+def engine_options(monitor):
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,  # Replaces connections the server dropped instead of failing a query
+        'poolclass': monitor.pool_class(),
+    }
+
+
+class ReadRouter:
+    """Sends read-only queries to the replica bind when one is configured.
+
+    Replicas lag the primary slightly, so only endpoints that tolerate that
+    (room and message listings) should read through here.
+    """
+
+    def __init__(self):
+        self.monitors = {'primary': PoolMonitor('primary')}
+        self._db = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        """Applies pool settings and registers the optional 'replica' bind."""
+        self._db = db
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(os.environ.get('DB_HOST'))
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(self.monitors['primary'])
+        if DB_REPLICA_HOST:
+            self.monitors['replica'] = PoolMonitor('replica')
+            app.config.setdefault('SQLALCHEMY_BINDS', {})['replica'] = {
+                'url': database_uri(DB_REPLICA_HOST),
+                **engine_options(self.monitors['replica']),
+            }
+            app.teardown_appcontext(self._remove_session)
+
+    @property
+    def session(self):
+        if not DB_REPLICA_HOST:
+            return self._db.session
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    # Engines only exist inside an app context, so bind on first use
+                    self._session = scoped_session(sessionmaker(bind=self._db.engines['replica']))
+        return self._session
+
+    def query(self, *entities):
+        return self.session.query(*entities)
+
+    def _remove_session(self, exc=None):
+        if self._session is not None:
+            self._session.remove()
+
+    def stats(self):
+        return {name: monitor.stats() for name, monitor in self.monitors.items()}
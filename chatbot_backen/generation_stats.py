@@ -0,0 +1,69 @@
+# generation_stats.py - Summarizes stored Gemini generation metadata per room
+from collections import defaultdict
+
+PERCENTILES = (50, 90, 99)
+
+
+def response_metadata(response):
+    """Reads token usage and the finish reason off a Gemini response."""
+    usage = getattr(response, 'usage_metadata', None)
+    finish_reason = None
+    if getattr(response, 'candidates', None):
+        reason = getattr(response.candidates[0], 'finish_reason', None)
+        if reason is not None:
+            finish_reason = getattr(reason, 'name', str(reason))
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_token_count', None),
+        'output_tokens': getattr(usage, 'candidates_token_count', None),
+        'finish_reason': finish_reason,
+    }
+
+
+def percentile(sorted_values, p):
+    """Returns the p-th percentile (0-100) of an already sorted list, or None if empty."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _summarize(rows):
+    latencies = sorted(row['latency_ms'] for row in rows if row.get('latency_ms') is not None)
+    models = defaultdict(int)
+    finish_reasons = defaultdict(int)
+    for row in rows:
+        models[row.get('model') or 'unknown'] += 1
+        finish_reasons[row.get('finish_reason') or 'unknown'] += 1
+    summary = {
+        'generations': len(rows),
+        'cache_hits': sum(1 for row in rows if row.get('cache_hit')),
+        'prompt_tokens': sum(row.get('prompt_tokens') or 0 for row in rows),
+        'output_tokens': sum(row.get('output_tokens') or 0 for row in rows),
+        'latency_ms_total': sum(latencies),
+        'latency_ms_max': latencies[-1] if latencies else None,
+        'models': dict(models),
+        'finish_reasons': dict(finish_reasons),
+    }
+    for p in PERCENTILES:
+        summary[f'latency_ms_p{p}'] = percentile(latencies, p)
+    return summary
+
+
+def summarize_generations(rows):
+    """Aggregates generation rows into overall and per-room latency and token stats.
+
+    Args:
+        rows (iterable): dicts with chatRoom, model, latency_ms, prompt_tokens,
+            output_tokens, finish_reason and cache_hit keys.
+
+    Returns:
+        dict: 'overall' summary and a 'rooms' mapping of room id to summary.
+    """
+    rows = list(rows)
+    by_room = defaultdict(list)
+    for row in rows:
+        by_room[str(row['chatRoom'])].append(row)
+    return {
+        'overall': _summarize(rows),
+        'rooms': {room_id: _summarize(room_rows) for room_id, room_rows in by_room.items()},
+    }
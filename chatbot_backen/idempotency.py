@@ -0,0 +1,106 @@
+# idempotency.py - Idempotency-Key support for message-creating endpoints
+import datetime
+import functools
+import hashlib
+import os
+import time
+
+from flask import Response, jsonify, make_response, request
+
+# How long a completed response is replayed for a repeated key
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# How long a repeat waits for the original request to finish before giving up
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "90"))
+# A pending claim older than this is presumed abandoned (its worker crashed) and may be taken over
+IDEMPOTENCY_LEASE_SECONDS = float(os.environ.get("IDEMPOTENCY_LEASE_SECONDS", "300"))
+
+HEADER = 'Idempotency-Key'
+
+
+def request_fingerprint():
+    """Hashes the request's method, path, body fields and file contents."""
+    digest = hashlib.sha256(f"{request.method} {request.path}".encode('utf-8'))
+    # parse_form_data leaves request.form/files usable; for JSON this is the raw body
+    digest.update(request.get_data(cache=True, parse_form_data=True))
+    for name in sorted(request.form):
+        digest.update(f"{name}={request.form[name]}".encode('utf-8'))
+    for name in sorted(request.files):
+        upload = request.files[name]
+        digest.update(f"{name}:{upload.filename}".encode('utf-8'))
+        digest.update(upload.stream.read())
+        upload.stream.seek(0)
+    return digest.hexdigest()
+
+
+def _replay(record):
+    response = Response(record['body'], status=record['status_code'], mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _lease_expired(record):
+    claimed_at = record.get('claimed_at')
+    lease_start = datetime.datetime.utcnow() - datetime.timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+    return claimed_at is None or claimed_at <= lease_start
+
+
+def _run_claimed(store, key, view, args, kwargs):
+    """Runs the view for a claimed key and stores or releases the outcome."""
+    try:
+        response = make_response(view(*args, **kwargs))
+    except Exception:
+        store.release(key)
+        raise
+    if response.status_code >= 500 or response.status_code == 429 or response.is_streamed:
+        store.release(key)
+    else:
+        store.complete(key, response.status_code, response.get_data(as_text=True))
+    return response
+
+
+def idempotent(store):
+    """Makes a view replay its stored response for a repeated Idempotency-Key.
+
+    `store` is a model class with begin/lookup/take_over/complete/release
+    classmethods (see IdempotencyKey in models.py and models_mysql.py). A
+    repeat that arrives while the first request is still running waits for
+    its result instead of generating again, unless the claim has outlived
+    IDEMPOTENCY_LEASE_SECONDS, in which case the repeat takes it over. Server
+    errors and 429s release the key so the client can retry.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            header = request.headers.get(HEADER)
+            if not header:
+                return view(*args, **kwargs)
+            if len(header) > 200:
+                return jsonify({'error': f'{HEADER} must be at most 200 characters'}), 400
+
+            key = f"{request.path}:{header}"
+            fingerprint = request_fingerprint()
+            existing = store.begin(key, fingerprint)
+            if existing is not None:
+                if existing['fingerprint'] != fingerprint:
+                    return jsonify({'error': f'{HEADER} was already used with a different request'}), 422
+                record = existing
+                deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+                delay = 0.05
+                while (record is not None and record['state'] != 'done' and not _lease_expired(record)
+                       and time.monotonic() < deadline):
+                    time.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+                    record = store.lookup(key)
+                if record is None:
+                    # The original request failed and released the key; run this one
+                    return wrapper(*args, **kwargs)
+                if record['state'] != 'done':
+                    # Only one repeat wins the takeover; the others keep waiting on it
+                    if _lease_expired(record) and store.take_over(key, record['claimed_at']):
+                        return _run_claimed(store, key, view, args, kwargs)
+                    return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+                return _replay(record)
+
+            return _run_claimed(store, key, view, args, kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,126 @@
+# image_pipeline.py - Downscales uploaded images for Gemini and renders chat thumbnails
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+UPLOAD_FOLDER = 'uploads'
+MODEL_FOLDER = os.path.join(UPLOAD_FOLDER, 'model')
+THUMBNAIL_FOLDER = os.path.join(UPLOAD_FOLDER, 'thumbs')
+
+# Longest side (px) of the copy sent to Gemini, larger images are downscaled
+MODEL_MAX_SIDE = int(os.environ.get("IMAGE_MODEL_MAX_SIDE", "1536"))
+MODEL_JPEG_QUALITY = int(os.environ.get("IMAGE_MODEL_JPEG_QUALITY", "85"))
+# Longest side (px) of the thumbnail shown in the chat list
+THUMBNAIL_MAX_SIDE = int(os.environ.get("IMAGE_THUMBNAIL_MAX_SIDE", "320"))
+THUMBNAIL_FORMAT = os.environ.get("IMAGE_THUMBNAIL_FORMAT", "WEBP").upper()  # WEBP or JPEG
+POOL_WORKERS = int(os.environ.get("IMAGE_POOL_WORKERS", "2"))
+PROCESS_TIMEOUT_SECONDS = float(os.environ.get("IMAGE_PROCESS_TIMEOUT_SECONDS", "30"))
+
+THUMBNAIL_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _flatten(image):
+    """Converts an image to RGB, compositing any transparency onto white."""
+    from PIL import Image
+
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _save_atomic(image, path, image_format, **params):
+    """Saves to a temporary file beside `path`, then renames it into place.
+
+    Other workers reuse output by name, so they must never see a half-written file.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, image_format, **params)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def process_image(source_path, model_max_side=MODEL_MAX_SIDE, thumbnail_max_side=THUMBNAIL_MAX_SIDE,
+                  thumbnail_format=THUMBNAIL_FORMAT, model_folder=MODEL_FOLDER, thumbnail_folder=THUMBNAIL_FOLDER):
+    """Normalizes orientation, writes a downscaled model copy and a thumbnail.
+
+    Runs inside a pool worker process, so it only takes and returns plain values.
+
+    Args:
+        source_path (str): Path of the uploaded original.
+        model_max_side (int): Longest side of the copy sent to the model.
+        thumbnail_max_side (int): Longest side of the thumbnail.
+        thumbnail_format (str): 'WEBP' or 'JPEG'.
+        model_folder (str): Directory for model copies.
+        thumbnail_folder (str): Directory for thumbnails.
+
+    Returns:
+        dict: paths of the model copy and thumbnail, plus the model copy's mime type.
+    """
+    from PIL import Image, ImageOps
+
+    with open(source_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:20]
+
+    model_path = os.path.join(model_folder, f"{digest}.jpg")
+    thumbnail_name = f"{digest}.{THUMBNAIL_EXTENSIONS.get(thumbnail_format, 'jpg')}"
+    thumbnail_path = os.path.join(thumbnail_folder, thumbnail_name)
+
+    # Identical uploads hash to the same name, so earlier output can be reused
+    if not (os.path.exists(model_path) and os.path.exists(thumbnail_path)):
+        with Image.open(source_path) as original:
+            image = _flatten(ImageOps.exif_transpose(original))
+        os.makedirs(model_folder, exist_ok=True)
+        os.makedirs(thumbnail_folder, exist_ok=True)
+
+        model_image = image.copy()
+        model_image.thumbnail((model_max_side, model_max_side), Image.LANCZOS)
+        _save_atomic(model_image, model_path, 'JPEG', quality=MODEL_JPEG_QUALITY, optimize=True)
+
+        image.thumbnail((thumbnail_max_side, thumbnail_max_side), Image.LANCZOS)
+        if thumbnail_format == 'WEBP':
+            _save_atomic(image, thumbnail_path, 'WEBP', quality=80, method=4)
+        else:
+            _save_atomic(image, thumbnail_path, 'JPEG', quality=80, optimize=True)
+
+    return {
+        'model_path': model_path,
+        'mime_type': 'image/jpeg',
+        'thumbnail_path': thumbnail_path,
+        'thumbnail': thumbnail_name,
+    }
+
+
+def get_pool():
+    """Returns the shared process pool, created on first use in each worker."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+    return _pool
+
+
+def preprocess_image(source_path):
+    """Runs process_image on the process pool and waits for its result.
+
+    Returns None if the image could not be processed, in which case callers
+    should fall back to the original upload.
+    """
+    try:
+        future = get_pool().submit(process_image, source_path)
+        return future.result(timeout=PROCESS_TIMEOUT_SECONDS)
+    except Exception as e:
+        print(f"Error preprocessing image {source_path}: {e}")
+        return None
@@ -0,0 +1,56 @@
+# message_batch.py - Request parsing and response encoding for batched multi-room message reads
+import datetime
+import json
+import os
+
+# Rooms one batch request may read
+BATCH_MAX_ROOMS = int(os.environ.get("BATCH_MAX_ROOMS", "20"))
+# Messages returned per room when the request gives no limit, and the most it may ask for
+BATCH_DEFAULT_LIMIT = int(os.environ.get("BATCH_DEFAULT_LIMIT", "50"))
+BATCH_MAX_LIMIT = int(os.environ.get("BATCH_MAX_LIMIT", "200"))
+
+
+def parse_batch(data):
+    """Validates a batch body: {"rooms": [{"id": ..., "limit": N, "since": cursor}, ...]}.
+
+    Without `since` a room returns its newest `limit` messages; with it, the
+    first `limit` messages created or edited after the cursor, in `updated_at`
+    order, so a client can page through changes. Raises ValueError.
+    """
+    rooms = (data or {}).get('rooms')
+    if not isinstance(rooms, list) or not rooms:
+        raise ValueError('rooms must be a non-empty list')
+    if len(rooms) > BATCH_MAX_ROOMS:
+        raise ValueError(f'At most {BATCH_MAX_ROOMS} rooms per request')
+
+    requests = []
+    seen = set()
+    for room in rooms:
+        if not isinstance(room, dict) or room.get('id') in (None, ''):
+            raise ValueError('Each room needs an id')
+        room_id = str(room['id'])
+        if room_id in seen:
+            raise ValueError(f'Room {room_id} is listed twice')
+        seen.add(room_id)
+
+        limit = room.get('limit', BATCH_DEFAULT_LIMIT)
+        if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= BATCH_MAX_LIMIT:
+            raise ValueError(f'limit must be an integer between 1 and {BATCH_MAX_LIMIT}')
+        since = room.get('since')
+        if since is not None:
+            try:
+                since = datetime.datetime.fromisoformat(since)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid since cursor for room {room_id}')
+        requests.append({'id': room_id, 'limit': limit, 'since': since})
+    return requests
+
+
+def encode_batch(results, not_found):
+    """Builds the response body from room id -> list of messages as JSON text.
+
+    Messages arrive already encoded (some straight from the tail cache), so
+    the body is joined as text rather than re-serialized.
+    """
+    rooms = ','.join(f"{json.dumps(room_id)}:[{','.join(messages)}]" for room_id, messages in results.items())
+    return f'{{"rooms":{{{rooms}}},"not_found":{json.dumps(not_found)}}}'
@@ -0,0 +1,48 @@
+# migrate_buckets.py - Builds MessageBucket documents for existing MongoDB rooms
+"""
+Copies each room's messages into history buckets (see models.MessageBucket)
+and marks the room bucketed, so get_messages serves its pages from buckets.
+
+    python migrate_buckets.py                # Rooms not yet bucketed
+    python migrate_buckets.py --room <id>    # One room, rebuilt even if bucketed
+    python migrate_buckets.py --all          # Rebuild every room
+
+Run it with MESSAGE_BUCKETS_ENABLED=true set on the app, so messages written
+during the migration are appended too. Rebuild with --all after the app has
+run with buckets disabled, since those writes never reached the buckets.
+"""
+import argparse
+import os
+import time
+
+from mongoengine import connect
+
+from models import ChatRoom, MessageBucket, MESSAGE_BUCKET_SIZE
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--room', help='Only this chat room id')
+    parser.add_argument('--all', action='store_true', help='Also rebuild rooms that are already bucketed')
+    args = parser.parse_args(argv)
+
+    connect('chatbot', host=os.environ.get("MONGODB_HOST", 'mongodb://localhost:27017/'))
+    if args.room:
+        rooms = ChatRoom.objects(pk=args.room)
+    elif args.all:
+        rooms = ChatRoom.objects
+    else:
+        rooms = ChatRoom.objects(bucketed__ne=True)
+
+    total = 0
+    for room in rooms.only('name').no_cache():
+        start = time.monotonic()
+        written = MessageBucket.rebuild(room)
+        total += written
+        print(f"{room.name}: {written} messages in {-(-written // MESSAGE_BUCKET_SIZE)} buckets "
+              f"({time.monotonic() - start:.1f}s)")
+    print(f"Migrated {total} messages")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# migrate_compression.py - Links stored replies and compresses long text in existing MongoDB messages
+"""
+Brings messages written before compressed text fields existed up to date:
+
+1. A user message's `gemini_response` copy of its reply is replaced by a
+   `reply` reference to the AI message holding the same text. Copies with no
+   matching AI message are kept, and compressed like any other text.
+2. Long `text`/`gemini_response` values (and regeneration responses) are
+   rewritten in compressed form.
+
+    python migrate_compression.py
+    python migrate_compression.py --dry-run
+
+Safe to re-run: linked and compressed documents are skipped.
+"""
+import argparse
+import os
+
+from mongoengine import connect
+from pymongo import UpdateOne
+
+from compression import compress_text, expand_text, TEXT_COMPRESS_MIN_BYTES
+from models import Message, Regeneration
+
+BATCH_SIZE = 500
+
+
+class _Writer:
+    """Buffers updates and sends them in unordered bulk writes."""
+
+    def __init__(self, collection, dry_run):
+        self.collection = collection
+        self.dry_run = dry_run
+        self.pending = []
+        self.written = 0
+
+    def add(self, operation):
+        self.pending.append(operation)
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.pending and not self.dry_run:
+            self.collection.bulk_write(self.pending, ordered=False)
+        self.written += len(self.pending)
+        self.pending = []
+
+
+def link_replies(collection, dry_run=False):
+    """Replaces gemini_response copies with references to the matching AI message."""
+    writer = _Writer(collection, dry_run)
+    kept = 0
+    users = collection.find(
+        {'sender': 'user', 'gemini_response': {'$ne': None}, 'reply': {'$exists': False}},
+        {'chatRoom': True, 'timestamp': True, 'gemini_response': True}
+    )
+    for user in users:
+        ai = collection.find_one(
+            {'chatRoom': user.get('chatRoom'), 'sender': 'ai', 'timestamp': {'$gte': user['timestamp']}},
+            {'text': True}, sort=[('timestamp', 1)]
+        )
+        if ai is not None and expand_text(ai.get('text')) == expand_text(user['gemini_response']):
+            writer.add(UpdateOne({'_id': user['_id']},
+                                 {'$set': {'reply': ai['_id']}, '$unset': {'gemini_response': ''}}))
+        else:
+            kept += 1
+    # Replies saved by the /weather endpoint also carried a copy of their own text
+    for ai in collection.find({'sender': 'ai', 'gemini_response': {'$ne': None}}, {'text': True, 'gemini_response': True}):
+        if expand_text(ai.get('text')) == expand_text(ai['gemini_response']):
+            writer.add(UpdateOne({'_id': ai['_id']}, {'$unset': {'gemini_response': ''}}))
+    writer.flush()
+    return {'copies_removed': writer.written, 'kept': kept}
+
+
+def compress_fields(collection, fields, dry_run=False):
+    """Rewrites string values of `fields` long enough to be stored compressed."""
+    writer = _Writer(collection, dry_run)
+    for field in fields:
+        long_strings = {'$expr': {'$and': [
+            {'$eq': [{'$type': f'${field}'}, 'string']},
+            {'$gte': [{'$strLenBytes': f'${field}'}, TEXT_COMPRESS_MIN_BYTES]},
+        ]}}
+        for doc in collection.find(long_strings, {field: True}):
+            stored = compress_text(doc[field])
+            if stored is not doc[field]:
+                writer.add(UpdateOne({'_id': doc['_id'], field: doc[field]}, {'$set': {field: stored}}))
+    writer.flush()
+    return writer.written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='Count the changes without writing them')
+    args = parser.parse_args(argv)
+
+    connect('chatbot', host=os.environ.get("MONGODB_HOST", 'mongodb://localhost:27017/'))
+    messages = Message._get_collection()
+    print(f"Replies: {link_replies(messages, args.dry_run)}")
+    print(f"Compressed message fields: {compress_fields(messages, ['text', 'gemini_response'], args.dry_run)}")
+    print(f"Compressed regeneration responses: "
+          f"{compress_fields(Regeneration._get_collection(), ['response'], args.dry_run)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# migrate_mysql.py - Brings an existing MySQL database up to the current models_mysql schema
+"""
+db.create_all() creates missing tables but never alters existing ones, so
+columns and indexes added to `chatrooms` and `messages` after a database was
+created must be added here. Run it before reloading the web app on new code:
+
+    python migrate_mysql.py --dry-run   # Print the pending statements
+    python migrate_mysql.py
+
+Then it creates new tables, backfills the new columns on existing rows, and
+builds counters for rooms that have none. Safe to re-run: only missing
+columns and indexes are added, and backfills only touch rows still unset.
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+
+from app_pythonanywhere import app  # noqa: E402  (reads the DB_* settings on import)
+from models_mysql import db, ChatRoom, RoomStats  # noqa: E402
+
+# Fill columns added to existing rows; each only touches rows it hasn't filled yet
+BACKFILLS = [
+    "UPDATE messages SET updated_at = `timestamp` WHERE updated_at IS NULL",
+    "UPDATE chatrooms SET last_activity_at = created_at WHERE last_activity_at IS NULL",
+]
+
+
+def pending_statements(engine):
+    """ALTER TABLE / CREATE INDEX statements for model columns and indexes missing from existing tables."""
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    existing_tables = set(inspector.get_table_names())
+    statements = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue  # Created whole by create_all
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                # Added as NULL so existing rows stay valid; BACKFILLS fills them in
+                statements.append(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                                  f"{preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)} NULL")
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                statements.append(str(CreateIndex(index).compile(dialect=engine.dialect)))
+    return statements
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='Print the schema changes without applying them')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        statements = pending_statements(db.engine)
+        for statement in statements:
+            print(statement)
+        if args.dry_run:
+            print(f"{len(statements)} schema changes pending (dry run, nothing written)")
+            return
+
+        with db.engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+        db.create_all()  # Tables that didn't exist yet
+        with db.engine.begin() as conn:
+            for statement in BACKFILLS:
+                print(f"{statement}: {conn.execute(text(statement)).rowcount} rows")
+
+        unsummarized = [room_id for (room_id,) in
+                        db.session.query(ChatRoom.id).filter(ChatRoom.last_message_preview.is_(None))]
+        for room_id in unsummarized:
+            ChatRoom.refresh_summary(room_id)
+        # RoomStats.record only counts messages written since, so older rooms need counters built from their messages
+        uncounted = [room_id for (room_id,) in db.session.query(ChatRoom.id).outerjoin(
+            RoomStats, RoomStats.chatRoom_id == ChatRoom.id).filter(RoomStats.chatRoom_id.is_(None))]
+        for room_id in uncounted:
+            RoomStats.rebuild(room_id)
+        print(f"Applied {len(statements)} schema changes; refreshed {len(unsummarized)} room summaries; "
+              f"built counters for {len(uncounted)} rooms")
+
+
+if __name__ == '__main__':
+    main()
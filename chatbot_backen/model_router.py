@@ -0,0 +1,168 @@
+# model_router.py - Picks a Gemini model tier per request and falls back when it runs over budget
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from resilience import LatencyTracker
+
+# Tier name -> model, latency budget (seconds) and the faster tier to fall back to.
+# Override with GEMINI_MODEL_TIERS (same JSON shape).
+DEFAULT_TIERS = {
+    'fast': {'model': 'gemini-2.0-flash', 'latency_budget': 8.0, 'fallback': None},
+    'standard': {'model': 'gemini-2.5-flash', 'latency_budget': 20.0, 'fallback': 'fast'},
+    'pro': {'model': 'gemini-2.5-pro', 'latency_budget': 40.0, 'fallback': 'standard'},
+}
+
+# Prompts up to this many characters go to the fast tier
+SHORT_PROMPT_CHARS = int(os.environ.get("ROUTER_SHORT_PROMPT_CHARS", "120"))
+# Prompts of at least this many characters go to the pro tier
+LONG_PROMPT_CHARS = int(os.environ.get("ROUTER_LONG_PROMPT_CHARS", "2000"))
+# Tier used whenever the prompt includes an image
+IMAGE_TIER = os.environ.get("ROUTER_IMAGE_TIER", "pro")
+# Tiers for short, long and other text prompts; each must be defined in the tier config
+SHORT_TIER = os.environ.get("ROUTER_SHORT_TIER", "fast")
+LONG_TIER = os.environ.get("ROUTER_LONG_TIER", "pro")
+DEFAULT_TIER = os.environ.get("ROUTER_DEFAULT_TIER", "standard")
+
+
+class ModelTier:
+    """A model plus its latency budget and per-tier latency stats."""
+
+    def __init__(self, name, model_name, latency_budget, fallback=None, model=None, hedger=None):
+        self.name = name
+        self.model_name = model_name
+        self.latency_budget = latency_budget
+        self.fallback = fallback
+        self.model = model
+        self.hedger = hedger
+        self.latencies = LatencyTracker()
+        self.requests = 0
+        self.errors = 0
+        self.budget_exceeded = 0
+
+    def stats(self):
+        stats = {
+            'model': self.model_name,
+            'latency_budget_seconds': self.latency_budget,
+            'requests': self.requests,
+            'errors': self.errors,
+            'budget_exceeded': self.budget_exceeded,
+            'latency_p50_seconds': self.latencies.percentile(50),
+            'latency_p95_seconds': self.latencies.percentile(95),
+        }
+        if self.hedger is not None:
+            stats['hedging'] = self.hedger.stats()
+        return stats
+
+
+class ModelRouter:
+    """Routes each Gemini request to a model tier.
+
+    Tier choice: the room's preferred tier if it has one, `image_tier` for
+    prompts with images, otherwise by prompt length. When a call runs past its
+    tier's latency budget the fallback tier is started as well, and the first
+    successful response is returned.
+
+    Raises ValueError if a routing role or fallback names a tier that isn't
+    configured, so a bad GEMINI_MODEL_TIERS fails at startup, not per request.
+    """
+
+    def __init__(self, tiers, model_factory, hedger_factory=None, short_prompt_chars=SHORT_PROMPT_CHARS,
+                 long_prompt_chars=LONG_PROMPT_CHARS, image_tier=IMAGE_TIER, short_tier=SHORT_TIER,
+                 long_tier=LONG_TIER, default_tier=DEFAULT_TIER, max_workers=16, clock=time.monotonic):
+        roles = {'image': image_tier, 'short': short_tier, 'long': long_tier, 'default': default_tier}
+        roles.update({f"fallback of '{name}'": config.get('fallback')
+                      for name, config in tiers.items() if config.get('fallback')})
+        missing = {role: name for role, name in roles.items() if name not in tiers}
+        if missing:
+            raise ValueError(f"Unknown model tiers {missing}; configured tiers are {sorted(tiers)}")
+        self.tiers = {
+            name: ModelTier(
+                name,
+                config['model'],
+                float(config['latency_budget']),
+                config.get('fallback'),
+                model=model_factory(config['model']),
+                hedger=hedger_factory() if hedger_factory else None,
+            )
+            for name, config in tiers.items()
+        }
+        self.short_prompt_chars = short_prompt_chars
+        self.long_prompt_chars = long_prompt_chars
+        self.image_tier = image_tier
+        self.short_tier = short_tier
+        self.long_tier = long_tier
+        self.default_tier = default_tier
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-router')
+
+    def choose(self, text, has_image=False, room_preference=None):
+        """Returns the tier for a prompt."""
+        if room_preference in self.tiers:
+            return self.tiers[room_preference]
+        if has_image:
+            return self.tiers[self.image_tier]
+        length = len(text or '')
+        if length <= self.short_prompt_chars:
+            return self.tiers[self.short_tier]
+        if length >= self.long_prompt_chars:
+            return self.tiers[self.long_tier]
+        return self.tiers[self.default_tier]
+
+    def _invoke(self, tier, contents, kwargs):
+        start = self._clock()
+        try:
+            if tier.hedger is not None:
+                result = tier.hedger.call(tier.model.generate_content, contents, **kwargs)
+            else:
+                result = tier.model.generate_content(contents, **kwargs)
+        except Exception:
+            with self._lock:
+                tier.errors += 1
+            raise
+        tier.latencies.record(self._clock() - start)
+        return result
+
+    def _submit(self, tier, contents, kwargs):
+        with self._lock:
+            tier.requests += 1
+        return self._executor.submit(self._invoke, tier, contents, kwargs)
+
+    def generate(self, tier, contents, **kwargs):
+        """Generates a response on `tier`, falling back to faster tiers over budget.
+
+        Returns:
+            tuple: (response, the tier that produced it)
+        """
+        pending = {self._submit(tier, contents, kwargs): tier}
+        current = tier
+        error = None
+        while pending:
+            fallback = self.tiers.get(current.fallback) if current.fallback else None
+            timeout = current.latency_budget if fallback is not None else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Over budget: race the faster tier against the slow call
+                with self._lock:
+                    current.budget_exceeded += 1
+                current = fallback
+                pending[self._submit(current, contents, kwargs)] = current
+                continue
+            for future in done:
+                served_by = pending.pop(future)
+                if future.exception() is None:
+                    return future.result(), served_by
+                error = future.exception()
+        raise error
+
+    def stats(self):
+        return {name: tier.stats() for name, tier in self.tiers.items()}
+
+
+def load_tiers():
+    """Returns tier config from GEMINI_MODEL_TIERS, or the defaults."""
+    raw = os.environ.get("GEMINI_MODEL_TIERS")
+    return json.loads(raw) if raw else DEFAULT_TIERS
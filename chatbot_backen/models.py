@@ -1,36 +1,458 @@
-# models.py
-from mongoengine import Document, StringField, ListField, IntField, ReferenceField, DateTimeField
-import uuid
-import datetime  # Import the datetime module
-
-
-class ChatRoom(Document):
-    name = StringField(required=True, unique=True)  # Chat room name
-    message_count = IntField(default=0)  # Message count
-
-    def to_json(self):
-        return {
-            "id": str(self.pk),  # Convert ObjectId to string
-            "name": self.name,
-            "message_count": self.message_count,
-        }
-
-
-class Message(Document):
-    text = StringField()
-    sender = StringField(choices=['user', 'ai'])
-    chatRoom = ReferenceField(ChatRoom)
-    timestamp = DateTimeField(default=datetime.datetime.now)  # Add a timestamp
-    gemini_response = StringField() #Store Gemini's Response
-    image_url = StringField() # Stores the image url or path
-
-    def to_json(self):
-        return {
-            "id": str(self.pk),
-            "text": self.text,
-            "sender": self.sender,
-            "chatRoom": str(self.chatRoom.pk) if self.chatRoom else None,  # Handle potential None value
-            "timestamp": self.timestamp.isoformat(),  # Include timestamp
-            # "gemini_response": self.gemini_response if self.gemini_response else None,  # Include Gemini response
-            "image": self.image_url if self.image_url else None
-        }
\ No newline at end of file
+# models.py
+from mongoengine import Document, StringField, ListField, IntField, ReferenceField, DateTimeField, FloatField, BooleanField, DictField
+from mongoengine.errors import NotUniqueError
+from idempotency import IDEMPOTENCY_TTL_SECONDS
+from compression import compress_text, expand_text, is_compressed
+from bson import ObjectId
+from pymongo import ReturnDocument
+import os
+import uuid
+import datetime  # Import the datetime module
+
+PREVIEW_CHARS = 120  # Length of the last-message snippet kept on each room
+
+# Also store messages in per-room bucket documents, so a page of history is one or two reads
+MESSAGE_BUCKETS_ENABLED = os.environ.get("MESSAGE_BUCKETS_ENABLED", "false").lower() == "true"
+MESSAGE_BUCKET_SIZE = int(os.environ.get("MESSAGE_BUCKET_SIZE", "200"))
+
+
+def message_preview(text, has_image=False):
+    """Shortens a message to the snippet shown in the room list."""
+    preview = ' '.join((text or '').split())
+    if len(preview) > PREVIEW_CHARS:
+        preview = preview[:PREVIEW_CHARS - 1].rstrip() + '…'
+    return preview or ('[image]' if has_image else '')
+
+
+class _StoredText:
+    """A compressed value as loaded from MongoDB, decompressed on first read."""
+    __slots__ = ('stored',)
+
+    def __init__(self, stored):
+        self.stored = stored
+
+
+class CompressedStringField(StringField):
+    """A StringField stored compressed once it is long (see compression.py).
+
+    Loading a document leaves compressed values untouched; they are only
+    decompressed when the attribute is read. Plain strings written before
+    compression existed load as before.
+    """
+
+    def to_python(self, value):
+        if is_compressed(value):
+            return _StoredText(value)
+        return super().to_python(value)
+
+    def __get__(self, instance, owner):
+        value = super().__get__(instance, owner)
+        if isinstance(value, _StoredText):
+            value = expand_text(value.stored)
+            instance._data[self.name] = value  # Cache without marking the field changed
+        return value
+
+    def to_mongo(self, value):
+        if isinstance(value, _StoredText):
+            return value.stored  # Never read, so re-save it as it was loaded
+        return compress_text(value)
+
+    def prepare_query_value(self, op, value):
+        if op == 'set':  # update(set__field=...) bypasses to_mongo
+            return compress_text(value)
+        return super().prepare_query_value(op, value)
+
+    def validate(self, value):
+        if not isinstance(value, _StoredText):
+            super().validate(value)
+
+
+class ChatRoom(Document):
+    name = StringField(required=True, unique=True)  # Chat room name
+    message_count = IntField(default=0)  # Message count
+    model_tier = StringField()  # Optional preferred Gemini tier ('fast', 'standard' or 'pro')
+
+    # Denormalized summary of the newest message, so the room list needs no message reads
+    last_message_preview = StringField()
+    last_message_sender = StringField()
+    last_activity_at = DateTimeField(default=datetime.datetime.now)
+    revision = IntField(default=0)  # Bumped on every message write; lets workers detect stale caches
+    bucketed = BooleanField(default=False)  # History is complete in MessageBucket (see migrate_buckets.py)
+
+    meta = {
+        'indexes': ['-last_activity_at']  # Room list is ordered by recent activity
+    }
+
+    @classmethod
+    def record_message(cls, message, count=1):
+        """Bumps the message count and, if `message` is the newest, the room summary.
+
+        One pipeline update, so concurrent writers can neither lose increments
+        nor leave an older message's preview on the room. Returns the room's
+        new revision, or None if the room no longer exists.
+        """
+        newer = {'$lte': [{'$ifNull': ['$last_activity_at', datetime.datetime.min]}, message.timestamp]}
+        room = cls._get_collection().find_one_and_update({'_id': ObjectId(message.chatroom_id())}, [{'$set': {
+            'revision': {'$add': [{'$ifNull': ['$revision', 0]}, 1]},
+            'message_count': {'$add': [{'$ifNull': ['$message_count', 0]}, count]},
+            'last_message_preview': {'$cond': [
+                newer, message_preview(message.text, bool(message.image_url)), '$last_message_preview'
+            ]},
+            'last_message_sender': {'$cond': [newer, message.sender, '$last_message_sender']},
+            'last_activity_at': {'$cond': [newer, message.timestamp, '$last_activity_at']},
+        }}], projection={'revision': True}, return_document=ReturnDocument.AFTER)
+        return room['revision'] if room else None
+
+    @classmethod
+    def refresh_summary(cls, chatroom):
+        """Resets the summary from the room's newest message (after deletes and imports)."""
+        latest = Message.objects(chatRoom=chatroom).order_by('-timestamp').only(
+            'text', 'sender', 'timestamp', 'image_url'
+        ).first()
+        if latest is None:
+            cls.objects(pk=chatroom.pk).update_one(
+                unset__last_message_preview=True, unset__last_message_sender=True, inc__revision=1
+            )
+            return
+        cls.objects(pk=chatroom.pk).update_one(
+            inc__revision=1,
+            set__last_message_preview=message_preview(latest.text, bool(latest.image_url)),
+            set__last_message_sender=latest.sender,
+            set__last_activity_at=latest.timestamp,
+        )
+
+    def to_json(self):
+        return {
+            "id": str(self.pk),  # Convert ObjectId to string
+            "name": self.name,
+            "message_count": self.message_count,
+            "model_tier": self.model_tier,
+            "last_message_preview": self.last_message_preview,
+            "last_message_sender": self.last_message_sender,
+            "last_activity_at": self.last_activity_at.isoformat() if self.last_activity_at else None,
+        }
+
+
+class Message(Document):
+    text = CompressedStringField()
+    sender = StringField(choices=['user', 'ai'])
+    chatRoom = ReferenceField(ChatRoom)
+    timestamp = DateTimeField(default=datetime.datetime.now)  # Add a timestamp
+    reply = ReferenceField('self')  # On user messages: the AI message that answered it
+    gemini_response = CompressedStringField()  # Reply text on messages saved before `reply` existed
+    image_url = StringField() # Stores the image url or path
+    thumbnail = StringField() # Thumbnail filename under uploads/thumbs
+    updated_at = DateTimeField(default=datetime.datetime.utcnow)  # UTC, stamped on every save; the sync cursor
+
+    # Generation metadata, set on AI messages produced by Gemini
+    generation_model = StringField()
+    generation_latency_ms = FloatField()
+    prompt_tokens = IntField()
+    output_tokens = IntField()
+    finish_reason = StringField()
+    cache_hit = BooleanField()
+
+    meta = {
+        'indexes': [
+            ('chatRoom', 'updated_at'),  # Serves `since=` catch-up queries
+            ('chatRoom', 'timestamp'),  # Serves history reads and generation stats windows
+        ]
+    }
+
+    def clean(self):
+        # Stamped when saved, not when built: a message is constructed before a
+        # slow Gemini call, and a cursor taken in between must not skip it
+        self.updated_at = datetime.datetime.utcnow()
+
+    def to_json(self):
+        return {
+            "id": str(self.pk),
+            "text": self.text,
+            "sender": self.sender,
+            "chatRoom": self.chatroom_id(),
+            "timestamp": self.timestamp.isoformat(),  # Include timestamp
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            # "gemini_response": self.gemini_response if self.gemini_response else None,  # Include Gemini response
+            "image": self.image_url if self.image_url else None,
+            "thumbnail": self.thumbnail if self.thumbnail else None,
+            "generation": self.generation_json()
+        }
+
+    def chatroom_id(self):
+        """Returns the room id without dereferencing (and fetching) the ChatRoom."""
+        ref = self._data.get('chatRoom')
+        if ref is None:
+            return None
+        return str(getattr(ref, 'pk', None) or getattr(ref, 'id', ref))
+
+    def generation_json(self):
+        if not self.generation_model:
+            return None
+        return {
+            "model": self.generation_model,
+            "latency_ms": self.generation_latency_ms,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "finish_reason": self.finish_reason,
+            "cache_hit": self.cache_hit,
+        }
+
+
+def _bucket_entry(message):
+    """A message's JSON as kept in a bucket, with its text in stored (compressed) form."""
+    entry = message.to_json()
+    entry['text'] = compress_text(entry['text'])
+    return entry
+
+
+def _bucket_documents(chatroom_pk, messages, size=None):
+    """Lays out messages (oldest first) as bucket documents of up to `size` entries each."""
+    size = size or MESSAGE_BUCKET_SIZE
+    batch = []
+    for message in messages:
+        batch.append(message)
+        if len(batch) == size:
+            yield _bucket_document(chatroom_pk, batch)
+            batch = []
+    if batch:
+        yield _bucket_document(chatroom_pk, batch)
+
+
+def _bucket_document(chatroom_pk, batch):
+    return {
+        'chatRoom': chatroom_pk,
+        'first_ts': batch[0].timestamp,
+        'last_ts': batch[-1].timestamp,
+        'count': len(batch),
+        'messages': [_bucket_entry(message) for message in batch],
+    }
+
+
+def _page_from_buckets(buckets, limit, before=None):
+    """The newest `limit` messages older than `before` from bucket documents, oldest first, text expanded."""
+    cutoff = before.isoformat() if before is not None else None
+    messages = {}
+    for bucket in buckets:
+        for message in bucket['messages']:
+            if cutoff is None or message['timestamp'] < cutoff:
+                messages[message['id']] = message  # Rebuilt rooms may briefly hold duplicates
+    newest = sorted(messages.values(), key=lambda message: message['timestamp'])[-limit:]
+    for message in newest:
+        message['text'] = expand_text(message['text'])
+    return newest
+
+
+class MessageBucket(Document):
+    """Up to MESSAGE_BUCKET_SIZE consecutive messages of one room, as served JSON.
+
+    A copy of the Message documents laid out for history reads: the newest
+    page of a room is in its newest one or two buckets. Message stays the
+    record that edits, `since=` sync and the offline tools work from.
+    Long text is kept compressed as in Message (see compression.py), so the
+    copy doesn't double the storage of long replies; page() expands it.
+    """
+    chatRoom = ReferenceField(ChatRoom)
+    first_ts = DateTimeField()
+    last_ts = DateTimeField()
+    count = IntField(default=0)
+    messages = ListField(DictField())  # Message.to_json() of each message, in write order, text as stored
+
+    meta = {
+        'indexes': [('chatRoom', '-last_ts')]
+    }
+
+    @classmethod
+    def append(cls, message):
+        """Pushes a saved message onto its room's open bucket, opening a new one when full."""
+        if not MESSAGE_BUCKETS_ENABLED:
+            return
+        cls._get_collection().find_one_and_update(
+            {'chatRoom': ObjectId(message.chatroom_id()), 'count': {'$lt': MESSAGE_BUCKET_SIZE}},
+            {
+                '$push': {'messages': _bucket_entry(message)},
+                '$inc': {'count': 1},
+                '$min': {'first_ts': message.timestamp},
+                '$max': {'last_ts': message.timestamp},
+            },
+            sort=[('last_ts', -1)], upsert=True, projection={'_id': True}
+        )
+
+    @classmethod
+    def replace(cls, message):
+        """Overwrites an edited message's copy in place."""
+        if not MESSAGE_BUCKETS_ENABLED:
+            return
+        cls._get_collection().update_one(
+            {'chatRoom': ObjectId(message.chatroom_id()), 'messages.id': str(message.pk)},
+            {'$set': {'messages.$': _bucket_entry(message)}}
+        )
+
+    @classmethod
+    def page(cls, chatroom, limit, before=None):
+        """Returns the newest `limit` messages (older than `before`) as JSON dicts, oldest first."""
+        filters = {'chatRoom': chatroom}
+        if before is not None:
+            filters['first_ts__lt'] = before
+        # A full page spans at most limit // size + 1 buckets; one more covers a partly filled newest bucket
+        buckets = cls.objects(**filters).order_by('-last_ts').only('messages').limit(
+            limit // MESSAGE_BUCKET_SIZE + 2
+        ).as_pymongo()
+        return _page_from_buckets(buckets, limit, before)
+
+    @classmethod
+    def rebuild(cls, chatroom):
+        """Rewrites a room's buckets from its Message documents and marks the room bucketed.
+
+        Old buckets are dropped before messages are read, so messages written
+        meanwhile are either read here or appended afterwards (page() drops
+        the duplicates).
+        """
+        cls.objects(chatRoom=chatroom).delete()
+        written = 0
+        messages = Message.objects(chatRoom=chatroom).order_by('timestamp').no_cache()
+        for bucket in _bucket_documents(chatroom.pk, messages):
+            cls._get_collection().insert_one(bucket)
+            written += bucket['count']
+        ChatRoom.objects(pk=chatroom.pk).update_one(set__bucketed=True)
+        return written
+
+
+class RoomStats(Document):
+    """Per-room counters, updated atomically on every message write."""
+    chatRoom = ReferenceField(ChatRoom, unique=True)
+    user_messages = IntField(default=0)
+    ai_messages = IntField(default=0)
+    image_messages = IntField(default=0)
+    ai_response_chars = IntField(default=0)  # Total length of AI replies, for the average
+    first_activity = DateTimeField()
+    last_activity = DateTimeField()
+
+    @classmethod
+    def record(cls, message):
+        """Folds a newly saved message into its room's counters (one upsert)."""
+        updates = {
+            'inc__user_messages' if message.sender == 'user' else 'inc__ai_messages': 1,
+            'min__first_activity': message.timestamp,
+            'max__last_activity': message.timestamp,
+        }
+        if message.image_url:
+            updates['inc__image_messages'] = 1
+        if message.sender == 'ai':
+            updates['inc__ai_response_chars'] = len(message.text or '')
+        cls.objects(chatRoom=message.chatRoom).update_one(upsert=True, **updates)
+
+    @classmethod
+    def rebuild(cls, chatroom):
+        """Recomputes a room's counters with a server-side aggregation over Message."""
+        pipeline = [
+            {'$match': {'chatRoom': chatroom.pk}},
+            {'$group': {
+                '_id': None,
+                'user_messages': {'$sum': {'$cond': [{'$eq': ['$sender', 'user']}, 1, 0]}},
+                'ai_messages': {'$sum': {'$cond': [{'$eq': ['$sender', 'ai']}, 1, 0]}},
+                'image_messages': {'$sum': {'$cond': [{'$ifNull': ['$image_url', False]}, 1, 0]}},
+                'ai_response_chars': {'$sum': {'$cond': [
+                    {'$eq': ['$sender', 'ai']},
+                    {'$cond': [  # Compressed text carries its length
+                        {'$eq': [{'$type': '$text'}, 'object']}, '$text.chars', {'$strLenCP': {'$ifNull': ['$text', '']}}
+                    ]},
+                    0
+                ]}},
+                'first_activity': {'$min': '$timestamp'},
+                'last_activity': {'$max': '$timestamp'},
+            }},
+        ]
+        totals = next(Message.objects.aggregate(pipeline), {})
+        cls.objects(chatRoom=chatroom).update_one(
+            upsert=True,
+            set__user_messages=totals.get('user_messages', 0),
+            set__ai_messages=totals.get('ai_messages', 0),
+            set__image_messages=totals.get('image_messages', 0),
+            set__ai_response_chars=totals.get('ai_response_chars', 0),
+            set__first_activity=totals.get('first_activity'),
+            set__last_activity=totals.get('last_activity'),
+        )
+        return cls.objects.get(chatRoom=chatroom)
+
+    def to_json(self):
+        return {
+            "chatRoom": str(self.chatRoom.pk) if self.chatRoom else None,
+            "messages_by_sender": {"user": self.user_messages, "ai": self.ai_messages},
+            "image_messages": self.image_messages,
+            "first_activity": self.first_activity.isoformat() if self.first_activity else None,
+            "last_activity": self.last_activity.isoformat() if self.last_activity else None,
+            "avg_ai_response_chars": round(self.ai_response_chars / self.ai_messages, 1) if self.ai_messages else 0,
+        }
+
+
+class IdempotencyKey(Document):
+    """Stored outcome of a request made with an Idempotency-Key header."""
+    key = StringField(primary_key=True)  # "<path>:<header value>"
+    fingerprint = StringField(required=True)
+    state = StringField(choices=['pending', 'done'], default='pending')
+    status_code = IntField()
+    body = StringField()
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    claimed_at = DateTimeField(default=datetime.datetime.utcnow)  # When the current request took the key
+
+    meta = {
+        'indexes': [
+            # MongoDB's TTL monitor removes keys after IDEMPOTENCY_TTL_SECONDS
+            {'fields': ['created_at'], 'expireAfterSeconds': IDEMPOTENCY_TTL_SECONDS}
+        ]
+    }
+
+    def _record(self):
+        return {'fingerprint': self.fingerprint, 'state': self.state, 'claimed_at': self.claimed_at,
+                'status_code': self.status_code, 'body': self.body}
+
+    @classmethod
+    def begin(cls, key, fingerprint):
+        """Claims a key. Returns None if claimed, else the existing record."""
+        try:
+            cls(key=key, fingerprint=fingerprint).save(force_insert=True)
+            return None
+        except NotUniqueError:
+            return cls.lookup(key) or cls.begin(key, fingerprint)
+
+    @classmethod
+    def lookup(cls, key):
+        existing = cls.objects(key=key).first()
+        return existing._record() if existing else None
+
+    @classmethod
+    def take_over(cls, key, claimed_at):
+        """Re-claims a pending key still held by the claim made at `claimed_at`; returns whether it won."""
+        return cls.objects(key=key, state='pending', claimed_at=claimed_at).update_one(
+            set__claimed_at=datetime.datetime.utcnow()
+        ) == 1
+
+    @classmethod
+    def complete(cls, key, status_code, body):
+        cls.objects(key=key).update_one(set__state='done', set__status_code=status_code, set__body=body)
+
+    @classmethod
+    def release(cls, key):
+        cls.objects(key=key, state='pending').delete()
+
+
+class Regeneration(Document):
+    """One offline re-answer of a stored user message (see regenerate.py)."""
+    run = StringField(required=True)  # Name of the regeneration run
+    message = ReferenceField(Message, required=True)
+    chatRoom = ReferenceField(ChatRoom)
+    model = StringField()
+    response = CompressedStringField()
+    error = StringField()
+    latency_ms = FloatField()
+    prompt_tokens = IntField()
+    output_tokens = IntField()
+    finish_reason = StringField()
+    attempts = IntField(default=1)
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+
+    meta = {
+        'indexes': [
+            {'fields': ['run', 'message'], 'unique': True},  # Re-running a message overwrites its result
+        ]
+    }
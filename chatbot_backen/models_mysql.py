@@ -1,47 +1,261 @@
-# models_mysql.py - MySQL version for PythonAnywhere
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-import json
-
-db = SQLAlchemy()
-
-class ChatRoom(db.Model):
-    __tablename__ = 'chatrooms'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False, unique=True)
-    message_count = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    # Relationship to messages
-    messages = db.relationship('Message', backref='chatroom_ref', lazy=True, cascade='all, delete-orphan')
-    
-    def to_json(self):
-        return {
-            'id': str(self.id),
-            'name': self.name,
-            'message_count': self.message_count,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
-
-class Message(db.Model):
-    __tablename__ = 'messages'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    text = db.Column(db.Text, nullable=True)
-    sender = db.Column(db.String(50), nullable=False)  # 'user' or 'ai'
-    image = db.Column(db.String(255), nullable=True)  # filename for uploaded images
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    # Foreign key to chatroom
-    chatRoom_id = db.Column(db.Integer, db.ForeignKey('chatrooms.id'), nullable=False)
-    
-    def to_json(self):
-        return {
-            'id': str(self.id),
-            'text': self.text,
-            'sender': self.sender,
-            'image': self.image,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
-            'chatRoom': str(self.chatRoom_id)
-        }
+# models_mysql.py - MySQL version for PythonAnywhere
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import json
+from idempotency import IDEMPOTENCY_TTL_SECONDS
+
+db = SQLAlchemy()
+
+PREVIEW_CHARS = 120  # Length of the last-message snippet kept on each room
+
+
+def message_preview(text, has_image=False):
+    """Shortens a message to the snippet shown in the room list."""
+    preview = ' '.join((text or '').split())
+    if len(preview) > PREVIEW_CHARS:
+        preview = preview[:PREVIEW_CHARS - 1].rstrip() + '…'
+    return preview or ('[image]' if has_image else '')
+
+class ChatRoom(db.Model):
+    __tablename__ = 'chatrooms'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    message_count = db.Column(db.Integer, default=0)
+    model_tier = db.Column(db.String(20), nullable=True)  # Optional preferred Gemini tier
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Denormalized summary of the newest message, so the room list needs no message reads.
+    # last_activity_at must stay the last of these columns: MySQL applies SET clauses in
+    # order, and record_message compares against its old value.
+    last_message_preview = db.Column(db.String(PREVIEW_CHARS), nullable=True)
+    last_message_sender = db.Column(db.String(50), nullable=True)
+    last_activity_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    # Relationship to messages
+    messages = db.relationship('Message', backref='chatroom_ref', lazy=True, cascade='all, delete-orphan')
+
+    @classmethod
+    def record_message(cls, message, count=1):
+        """Bumps the message count and, if `message` is the newest, the room summary.
+
+        A single UPDATE, so concurrent writers can neither lose increments nor
+        leave an older message's preview on the room; the caller commits.
+        """
+        db.session.flush()  # Assigns the message's default timestamp
+        newer = db.or_(cls.last_activity_at.is_(None), cls.last_activity_at <= message.timestamp)
+        cls.query.filter_by(id=message.chatRoom_id).update({
+            cls.message_count: db.func.coalesce(cls.message_count, 0) + count,
+            cls.last_message_preview: db.case(
+                (newer, message_preview(message.text, bool(message.image))), else_=cls.last_message_preview
+            ),
+            cls.last_message_sender: db.case((newer, message.sender), else_=cls.last_message_sender),
+            cls.last_activity_at: db.case((newer, message.timestamp), else_=cls.last_activity_at),
+        }, synchronize_session=False)
+
+    @classmethod
+    def refresh_summary(cls, chatroom_id):
+        """Resets the summary from the room's newest message (after deletes and imports)."""
+        latest = Message.query.filter_by(chatRoom_id=chatroom_id).order_by(Message.timestamp.desc()).first()
+        cls.query.filter_by(id=chatroom_id).update({
+            cls.last_message_preview: message_preview(latest.text, bool(latest.image)) if latest else None,
+            cls.last_message_sender: latest.sender if latest else None,
+            cls.last_activity_at: latest.timestamp if latest else cls.last_activity_at,
+        }, synchronize_session=False)
+        db.session.commit()
+    
+    def to_json(self):
+        return {
+            'id': str(self.id),
+            'name': self.name,
+            'message_count': self.message_count,
+            'model_tier': self.model_tier,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_message_preview': self.last_message_preview,
+            'last_message_sender': self.last_message_sender,
+            'last_activity_at': self.last_activity_at.isoformat() if self.last_activity_at else None,
+        }
+
+class Message(db.Model):
+    __tablename__ = 'messages'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    text = db.Column(db.Text, nullable=True)
+    sender = db.Column(db.String(50), nullable=False)  # 'user' or 'ai'
+    image = db.Column(db.String(255), nullable=True)  # filename for uploaded images
+    thumbnail = db.Column(db.String(255), nullable=True)  # thumbnail filename under uploads/thumbs
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Sync cursor
+
+    # Generation metadata, set on AI messages produced by Gemini
+    generation_model = db.Column(db.String(64), nullable=True)
+    generation_latency_ms = db.Column(db.Float, nullable=True)
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    output_tokens = db.Column(db.Integer, nullable=True)
+    finish_reason = db.Column(db.String(32), nullable=True)
+    cache_hit = db.Column(db.Boolean, nullable=True)
+    
+    # Foreign key to chatroom
+    chatRoom_id = db.Column(db.Integer, db.ForeignKey('chatrooms.id'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_messages_chatroom_updated_at', 'chatRoom_id', 'updated_at'),
+        db.Index('ix_messages_chatroom_timestamp', 'chatRoom_id', 'timestamp'),
+    )
+    
+    def to_json(self):
+        return {
+            'id': str(self.id),
+            'text': self.text,
+            'sender': self.sender,
+            'image': self.image,
+            'thumbnail': self.thumbnail,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'chatRoom': str(self.chatRoom_id),
+            'generation': self.generation_json()
+        }
+
+    def generation_json(self):
+        if not self.generation_model:
+            return None
+        return {
+            'model': self.generation_model,
+            'latency_ms': self.generation_latency_ms,
+            'prompt_tokens': self.prompt_tokens,
+            'output_tokens': self.output_tokens,
+            'finish_reason': self.finish_reason,
+            'cache_hit': self.cache_hit,
+        }
+
+class RoomStats(db.Model):
+    """Per-room counters, updated atomically on every message write."""
+    __tablename__ = 'room_stats'
+
+    chatRoom_id = db.Column(db.Integer, db.ForeignKey('chatrooms.id', ondelete='CASCADE'), primary_key=True)
+    user_messages = db.Column(db.Integer, default=0, nullable=False)
+    ai_messages = db.Column(db.Integer, default=0, nullable=False)
+    image_messages = db.Column(db.Integer, default=0, nullable=False)
+    ai_response_chars = db.Column(db.BigInteger, default=0, nullable=False)  # Total length of AI replies
+    first_activity = db.Column(db.DateTime, nullable=True)
+    last_activity = db.Column(db.DateTime, nullable=True)
+
+    @classmethod
+    def record(cls, message):
+        """Folds a newly added message into its room's counters.
+
+        One INSERT ... ON DUPLICATE KEY UPDATE creates the row or adds to it
+        with column arithmetic, so concurrent writers (including a room's first
+        two messages) don't lose increments; the caller commits along with the message.
+        """
+        timestamp = message.timestamp or datetime.utcnow()
+        is_user = message.sender == 'user'
+        stmt = mysql_insert(cls).values(
+            chatRoom_id=message.chatRoom_id,
+            user_messages=int(is_user),
+            ai_messages=int(not is_user),
+            image_messages=int(bool(message.image)),
+            ai_response_chars=0 if is_user else len(message.text or ''),
+            first_activity=timestamp,
+            last_activity=timestamp,
+        )
+        inserted = stmt.inserted
+        db.session.execute(stmt.on_duplicate_key_update(
+            user_messages=cls.user_messages + inserted.user_messages,
+            ai_messages=cls.ai_messages + inserted.ai_messages,
+            image_messages=cls.image_messages + inserted.image_messages,
+            ai_response_chars=cls.ai_response_chars + inserted.ai_response_chars,
+            first_activity=db.func.coalesce(cls.first_activity, inserted.first_activity),
+            last_activity=db.func.greatest(db.func.coalesce(cls.last_activity, inserted.last_activity), inserted.last_activity),
+        ))
+
+    @classmethod
+    def rebuild(cls, chatroom_id):
+        """Recomputes a room's counters with one aggregate query over messages."""
+        is_ai = Message.sender == 'ai'
+        totals = db.session.query(
+            db.func.sum(db.case((Message.sender == 'user', 1), else_=0)),
+            db.func.sum(db.case((is_ai, 1), else_=0)),
+            db.func.sum(db.case((Message.image.isnot(None), 1), else_=0)),
+            db.func.sum(db.case((is_ai, db.func.char_length(db.func.coalesce(Message.text, ''))), else_=0)),
+            db.func.min(Message.timestamp),
+            db.func.max(Message.timestamp),
+        ).filter(Message.chatRoom_id == chatroom_id).one()
+        stats = db.session.merge(cls(
+            chatRoom_id=chatroom_id,
+            user_messages=int(totals[0] or 0),
+            ai_messages=int(totals[1] or 0),
+            image_messages=int(totals[2] or 0),
+            ai_response_chars=int(totals[3] or 0),
+            first_activity=totals[4],
+            last_activity=totals[5],
+        ))
+        db.session.commit()
+        return stats
+
+    def to_json(self):
+        return {
+            'chatRoom': str(self.chatRoom_id),
+            'messages_by_sender': {'user': self.user_messages, 'ai': self.ai_messages},
+            'image_messages': self.image_messages,
+            'first_activity': self.first_activity.isoformat() if self.first_activity else None,
+            'last_activity': self.last_activity.isoformat() if self.last_activity else None,
+            'avg_ai_response_chars': round(self.ai_response_chars / self.ai_messages, 1) if self.ai_messages else 0,
+        }
+
+class IdempotencyKey(db.Model):
+    """Stored outcome of a request made with an Idempotency-Key header."""
+    __tablename__ = 'idempotency_keys'
+
+    key = db.Column(db.String(255), primary_key=True)  # "<path>:<header value>"
+    fingerprint = db.Column(db.String(64), nullable=False)
+    state = db.Column(db.String(10), nullable=False, default='pending')
+    status_code = db.Column(db.Integer, nullable=True)
+    body = db.Column(db.Text, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    claimed_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)  # When the current request took the key
+
+    def _record(self):
+        return {'fingerprint': self.fingerprint, 'state': self.state, 'claimed_at': self.claimed_at,
+                'status_code': self.status_code, 'body': self.body}
+
+    @classmethod
+    def begin(cls, key, fingerprint):
+        """Claims a key. Returns None if claimed, else the existing record."""
+        now = datetime.utcnow()
+        cls.query.filter(cls.expires_at < now).delete(synchronize_session=False)
+        db.session.add(cls(key=key, fingerprint=fingerprint, state='pending',
+                           expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)))
+        try:
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+            return cls.lookup(key) or cls.begin(key, fingerprint)
+
+    @classmethod
+    def lookup(cls, key):
+        db.session.expire_all()  # Re-read rows another worker may have updated
+        existing = db.session.get(cls, key)
+        return existing._record() if existing else None
+
+    @classmethod
+    def take_over(cls, key, claimed_at):
+        """Re-claims a pending key still held by the claim made at `claimed_at`; returns whether it won."""
+        won = cls.query.filter_by(key=key, state='pending', claimed_at=claimed_at).update(
+            {'claimed_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        return won == 1
+
+    @classmethod
+    def complete(cls, key, status_code, body):
+        cls.query.filter_by(key=key).update({'state': 'done', 'status_code': status_code, 'body': body})
+        db.session.commit()
+
+    @classmethod
+    def release(cls, key):
+        db.session.rollback()
+        cls.query.filter_by(key=key, state='pending').delete()
+        db.session.commit()
@@ -0,0 +1,238 @@
+# profiling.py - Opt-in sampling profiler for individual requests, with admin retrieval endpoints
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import jsonify, request
+from werkzeug.wsgi import ClosingIterator
+
+from cache import get_cache
+
+# Profiling is only installed when an admin token is configured
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN")
+# Fraction of requests profiled without being asked (0 = only on request)
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+# Milliseconds between stack samples of the profiled request's thread
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_STORED = int(os.environ.get("PROFILE_MAX_STORED", "50"))
+PROFILE_TTL_SECONDS = int(os.environ.get("PROFILE_TTL_SECONDS", str(24 * 3600)))
+
+# Send `X-Profile: <admin token>` to profile a request; the response carries X-Profile-Id
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+# Samples whose stack passes through these files count as waiting on the DB or an upstream
+_DB_MARKERS = ('pymongo', 'mongoengine', 'sqlalchemy', 'pymysql')
+_UPSTREAM_MARKERS = ('generativeai', 'api_core', 'grpc', 'requests', 'urllib3', 'http/client', 'ssl.py', 'socket.py')
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+def _token_matches(header, token):
+    """Compares a header value with the admin token in constant time.
+
+    WSGI header values are latin-1 decoded, so they are compared as the raw
+    bytes the client sent; compare_digest rejects non-ASCII str arguments.
+    """
+    try:
+        return hmac.compare_digest(header.encode('latin-1'), token.encode('utf-8'))
+    except UnicodeEncodeError:
+        return False
+
+
+class StackSampler:
+    """Samples one thread's stack from a helper thread at a fixed interval.
+
+    Overhead is one stack walk per interval, independent of how many
+    functions the request calls, unlike a tracing profiler.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()  # root-first tuple of frame names -> samples
+        self._waits = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            wait = 'cpu'
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                filename = frame.f_code.co_filename
+                if wait != 'db' and any(marker in filename for marker in _DB_MARKERS):
+                    wait = 'db'
+                elif wait == 'cpu' and any(marker in filename for marker in _UPSTREAM_MARKERS):
+                    wait = 'upstream'
+                frame = frame.f_back
+            self._stacks[tuple(reversed(stack))] += 1
+            self._waits[wait] += 1
+            self.samples += 1
+
+    def report(self, top=25, min_share=0.01):
+        """Builds the call tree (nodes under `min_share` of samples are pruned) and top functions."""
+        interval_ms = self.interval * 1000
+        total = Counter()
+        own = Counter()
+        tree = {'name': 'root', 'samples': 0, 'children': {}}
+        for stack, count in self._stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+            node = tree
+            node['samples'] += count
+            for name in stack:
+                node = node['children'].setdefault(name, {'name': name, 'samples': 0, 'children': {}})
+                node['samples'] += count
+
+        cutoff = max(1, self.samples * min_share)
+
+        def prune(node):
+            children = sorted(node['children'].values(), key=lambda child: -child['samples'])
+            return {
+                'name': node['name'],
+                'ms': round(node['samples'] * interval_ms, 1),
+                'children': [prune(child) for child in children if child['samples'] >= cutoff],
+            }
+
+        return {
+            'samples': self.samples,
+            'interval_ms': interval_ms,
+            'wait_ms': {kind: round(count * interval_ms, 1) for kind, count in self._waits.items()},
+            'top_functions': [
+                {'function': name, 'total_ms': round(count * interval_ms, 1),
+                 'self_ms': round(own[name] * interval_ms, 1)}
+                for name, count in total.most_common(top)
+            ],
+            'call_tree': prune(tree),
+        }
+
+
+class ProfileStore:
+    """Keeps recent profiles in the shared cache so any worker can serve them.
+
+    The index of recent profiles is updated with the cache's atomic push(), so
+    workers saving at the same time don't drop each other's entries.
+    """
+
+    def __init__(self, cache, max_profiles=PROFILE_MAX_STORED, ttl=PROFILE_TTL_SECONDS):
+        self.cache = cache
+        self.max_profiles = max_profiles
+        self.ttl = ttl
+
+    def save(self, profile):
+        self.cache.set(f"profile:{profile['id']}", profile, self.ttl)
+        summary = {key: profile[key] for key in ('id', 'method', 'path', 'status', 'started_at', 'duration_ms')}
+        self.cache.push('index', summary, self.max_profiles, self.ttl)
+
+    def list(self):
+        return self.cache.get_list('index')
+
+    def get(self, profile_id):
+        return self.cache.get(f"profile:{profile_id}")
+
+
+class ProfilingMiddleware:
+    """Profiles requests that send the admin token in X-Profile, or a random sample."""
+
+    def __init__(self, wsgi_app, store, token, sample_rate=PROFILE_SAMPLE_RATE, interval_ms=PROFILE_INTERVAL_MS):
+        self.wsgi_app = wsgi_app
+        self.store = store
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000.0
+
+    def _wanted(self, environ):
+        if environ.get('PATH_INFO', '').startswith('/api/admin/'):
+            return False
+        header = environ.get(PROFILE_HEADER)
+        if header is not None:
+            return _token_matches(header, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, environ, start_response):
+        if not self._wanted(environ):
+            return self.wsgi_app(environ, start_response)
+
+        profile_id = uuid.uuid4().hex[:16]
+        status = {}
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        started_at = time.time()
+        start = time.perf_counter()
+
+        def profiled_start_response(status_line, headers, exc_info=None):
+            status['code'] = int(status_line.split(' ', 1)[0])
+            headers.append(('X-Profile-Id', profile_id))
+            return start_response(status_line, headers, exc_info)
+
+        def finish():
+            sampler.stop()
+            try:
+                self.store.save({
+                    'id': profile_id,
+                    'method': environ.get('REQUEST_METHOD'),
+                    'path': environ.get('PATH_INFO'),
+                    'status': status.get('code'),
+                    'started_at': started_at,
+                    'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+                    **sampler.report(),
+                })
+            except Exception as e:
+                print(f"Error storing profile {profile_id}: {e}")
+
+        sampler.start()
+        try:
+            result = self.wsgi_app(environ, profiled_start_response)
+        except Exception:
+            finish()
+            raise
+        # Streamed bodies are produced while the server iterates, so stop when it closes
+        return ClosingIterator(result, [finish])
+
+
+def init_profiling(app, token=PROFILE_ADMIN_TOKEN):
+    """Installs the profiler and its admin endpoints; does nothing without an admin token."""
+    if not token:
+        return
+    store = ProfileStore(get_cache('profiles'))
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app, store, token)
+
+    def authorized():
+        return _token_matches(request.headers.get('X-Admin-Token', ''), token)
+
+    @app.route('/api/admin/profiles', methods=['GET'])
+    def list_profiles():
+        """Lists recent request profiles, newest first."""
+        if not authorized():
+            return jsonify({'error': 'Invalid admin token'}), 403
+        return jsonify(store.list()), 200
+
+    @app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+    def get_profile(profile_id):
+        """Returns one profile: call tree, top functions and DB/upstream wait time."""
+        if not authorized():
+            return jsonify({'error': 'Invalid admin token'}), 403
+        profile = store.get(profile_id)
+        if profile is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return jsonify(profile), 200
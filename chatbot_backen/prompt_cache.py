@@ -0,0 +1,141 @@
+# prompt_cache.py - Near-duplicate prompt cache using hashed n-gram vectors and cosine similarity
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Off by default: the cache is shared by every room, so a false match hands one user another's answer
+PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE_ENABLED", "false").lower() == "true"
+# Cosine similarity at or above which two prompts count as the same question
+PROMPT_CACHE_THRESHOLD = float(os.environ.get("PROMPT_CACHE_THRESHOLD", "0.92"))
+# Prompts kept per worker; the matrix is capacity x dims float32 (10 MB at the defaults)
+PROMPT_CACHE_CAPACITY = int(os.environ.get("PROMPT_CACHE_CAPACITY", "20000"))
+PROMPT_CACHE_DIMS = int(os.environ.get("PROMPT_CACHE_DIMS", "128"))
+PROMPT_CACHE_TTL_SECONDS = int(os.environ.get("PROMPT_CACHE_TTL_SECONDS", "3600"))
+# 'lru' evicts the least recently hit prompt when full, 'fifo' the oldest
+PROMPT_CACHE_EVICTION = os.environ.get("PROMPT_CACHE_EVICTION", "lru")
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+# Words two prompts may differ by and still count as the same question
+STOPWORDS = frozenset(
+    "a an the please can could would you me tell what whats is are do does i im hi hey".split()
+)
+
+
+def normalize(text):
+    """Lowercases, drops punctuation and collapses whitespace."""
+    return ' '.join(_PUNCTUATION.sub('', text.lower()).split())
+
+
+def content_words(normalized):
+    """Sorted words of a normalized prompt, minus stopwords."""
+    return sorted(set(normalized.split()) - STOPWORDS)
+
+
+def vectorize(normalized, dims):
+    """Hashes character trigrams and words into a unit-length float32 vector."""
+    vector = np.zeros(dims, dtype=np.float32)
+    padded = f" {normalized} "
+    features = [padded[i:i + 3] for i in range(len(padded) - 2)] + normalized.split()
+    for feature in features:
+        vector[zlib.crc32(feature.encode('utf-8')) % dims] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class NearDuplicateCache:
+    """Maps prompts to earlier replies when they are near-duplicates.
+
+    Prompt vectors live in one preallocated matrix, so a lookup is a single
+    matrix-vector product over the filled rows. Entries only match within the
+    same scope (e.g. the model tier), and prompts must contain the same
+    words apart from stopwords, and the same numbers in the same order:
+    "ascending" vs "descending", or an added "not", score high as n-grams
+    but change the question. The vectors then only absorb word order and
+    stopword differences.
+    """
+
+    def __init__(self, capacity=PROMPT_CACHE_CAPACITY, dims=PROMPT_CACHE_DIMS, threshold=PROMPT_CACHE_THRESHOLD,
+                 ttl=PROMPT_CACHE_TTL_SECONDS, eviction=PROMPT_CACHE_EVICTION, clock=time.monotonic):
+        if eviction not in ('lru', 'fifo'):
+            raise ValueError(f"Unknown eviction policy '{eviction}'")
+        self.capacity = capacity
+        self.dims = dims
+        self.threshold = threshold
+        self.ttl = ttl
+        self.eviction = eviction
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((capacity, dims), dtype=np.float32)
+        self._scopes = np.full(capacity, -1, dtype=np.int64)  # -1 marks an empty row
+        self._expires_at = np.zeros(capacity, dtype=np.float64)
+        self._ranks = np.zeros(capacity, dtype=np.float64)  # Insert or last-hit order, for eviction
+        self._values = [None] * capacity
+        self._size = 0
+        self._tick = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _scope_id(scope, normalized):
+        key = (scope, _NUMBER.findall(normalized), content_words(normalized))
+        return zlib.crc32(repr(key).encode('utf-8'))
+
+    def _next_rank(self):
+        self._tick += 1
+        return self._tick
+
+    def get(self, text, scope=None):
+        """Returns (value, similarity) for the closest cached prompt, or None."""
+        normalized = normalize(text)
+        if not normalized:
+            return None
+        vector = vectorize(normalized, self.dims)
+        with self._lock:
+            scope_id = self._scope_id(scope, normalized)
+            if self._size:
+                scores = self._vectors[:self._size] @ vector
+                scores[(self._scopes[:self._size] != scope_id)
+                       | (self._expires_at[:self._size] <= self._clock())] = -1.0
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    if self.eviction == 'lru':
+                        self._ranks[best] = self._next_rank()
+                    self._hits += 1
+                    return self._values[best], float(scores[best])
+            self._misses += 1
+        return None
+
+    def put(self, text, value, scope=None):
+        normalized = normalize(text)
+        if not normalized:
+            return
+        vector = vectorize(normalized, self.dims)
+        with self._lock:
+            if self._size < self.capacity:
+                row = self._size
+                self._size += 1
+            else:
+                expired = np.flatnonzero(self._expires_at <= self._clock())
+                row = int(expired[0]) if len(expired) else int(np.argmin(self._ranks))
+                self._evictions += 1
+            self._vectors[row] = vector
+            self._scopes[row] = self._scope_id(scope, normalized)
+            self._expires_at[row] = self._clock() + self.ttl
+            self._ranks[row] = self._next_rank()
+            self._values[row] = value
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': self._size,
+                'capacity': self.capacity,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
@@ -0,0 +1,266 @@
+# regenerate.py - Offline re-generation of stored user messages into a side collection
+"""
+Re-answers stored user messages with a chosen Gemini model and records each
+result, with timing and token counts, in the Regeneration collection.
+
+    python regenerate.py --run pro-benchmark --model gemini-2.5-pro
+    python regenerate.py --run fix-errors --model gemini-2.0-flash --errors-only
+
+Progress is checkpointed to a JSON file; re-running the same command resumes
+after the last finished message.
+"""
+import argparse
+import json
+import mimetypes
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from blob_store import blob_key, get_blob_store
+from generation_stats import response_metadata, summarize_generations
+from resilience import TokenBucket
+
+# Prefix of the reply chatbot_api stores when a Gemini call failed
+ERROR_PREFIX = "Error from Gemini:"
+REGENERATE_CONCURRENCY = int(os.environ.get("REGENERATE_CONCURRENCY", "4"))
+REGENERATE_RATE_PER_MINUTE = int(os.environ.get("REGENERATE_RATE_PER_MINUTE", "60"))
+REGENERATE_MAX_RETRIES = int(os.environ.get("REGENERATE_MAX_RETRIES", "5"))
+
+
+def is_rate_limited(err):
+    """True for Gemini quota errors (HTTP 429 / ResourceExhausted)."""
+    return type(err).__name__ in ('ResourceExhausted', 'TooManyRequests') \
+        or getattr(err, 'code', None) == 429 or '429' in str(err)
+
+
+class Checkpoint:
+    """A run's progress, kept in a small JSON file that is replaced atomically."""
+
+    def __init__(self, path):
+        self.path = path
+        self.watermark = None  # Every message up to and including this id is finished
+        self.completed = 0
+        self.failed = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.watermark = state.get('watermark')
+            self.completed = state.get('completed', 0)
+            self.failed = state.get('failed', 0)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'watermark': self.watermark, 'completed': self.completed, 'failed': self.failed}, f)
+        os.replace(tmp_path, self.path)
+
+
+class Regenerator:
+    """Runs `generate(contents)` over a stream of messages, paced and concurrent.
+
+    Calls are spaced by a shared token bucket (`rate_per_minute`). A rate-limit
+    error pauses every worker with exponential backoff before the call is
+    retried, up to `max_retries` times. Each outcome is passed to
+    `save_result(item, result)` as it finishes.
+    """
+
+    def __init__(self, generate, save_result, model_name, concurrency=REGENERATE_CONCURRENCY,
+                 rate_per_minute=REGENERATE_RATE_PER_MINUTE, max_retries=REGENERATE_MAX_RETRIES,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.generate = generate
+        self.save_result = save_result
+        self.model_name = model_name
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._sleep = sleep
+        self._clock = clock
+        self._bucket = TokenBucket(rate_per_minute, burst=concurrency, clock=clock)
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self.rate_limited = 0
+
+    def _throttle(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                delay = self._paused_until - now
+                if delay <= 0:
+                    delay = self._bucket.take()
+                    if delay == 0:
+                        return
+            self._sleep(delay)
+
+    def _process(self, item):
+        attempts = 0
+        while True:
+            attempts += 1
+            if item['contents'] is None:
+                result = {'error': 'Image file is missing'}
+                break
+            self._throttle()
+            start = self._clock()
+            try:
+                response = self.generate(item['contents'])
+            except Exception as err:
+                if is_rate_limited(err) and attempts <= self.max_retries:
+                    with self._lock:
+                        self.rate_limited += 1
+                        self._paused_until = max(self._paused_until, self._clock() + min(60, 2 ** attempts))
+                    continue
+                result = {'error': str(err), 'latency_ms': round((self._clock() - start) * 1000, 1)}
+                break
+            try:
+                text = response.text
+            except ValueError:  # No text parts, e.g. blocked by safety filters
+                text = None
+            result = {
+                'response': text,
+                'latency_ms': round((self._clock() - start) * 1000, 1),
+                **response_metadata(response),
+            }
+            break
+        result['attempts'] = attempts
+        self.save_result(item, result)
+        return result
+
+    def run(self, items, checkpoint):
+        """Processes items (ascending by 'id'); returns rows for summarize_generations."""
+        in_flight = {}
+        order = deque()  # Ids in submission order, to advance the checkpoint watermark
+        finished = set()
+        rows = []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='regenerate') as executor:
+            for item in items:
+                # Only a bounded window is read ahead of the workers
+                while len(in_flight) >= 2 * self.concurrency:
+                    self._collect(in_flight, order, finished, checkpoint, rows)
+                in_flight[executor.submit(self._process, item)] = item
+                order.append(item['id'])
+            while in_flight:
+                self._collect(in_flight, order, finished, checkpoint, rows)
+        return rows
+
+    def _collect(self, in_flight, order, finished, checkpoint, rows):
+        done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+        for future in done:
+            item = in_flight.pop(future)
+            result = future.result()
+            finished.add(item['id'])
+            if result.get('error'):
+                checkpoint.failed += 1
+            else:
+                checkpoint.completed += 1
+            rows.append({
+                'chatRoom': item['chatRoom'],
+                'model': self.model_name,
+                'latency_ms': result.get('latency_ms'),
+                'prompt_tokens': result.get('prompt_tokens'),
+                'output_tokens': result.get('output_tokens'),
+                'finish_reason': result.get('finish_reason') or ('error' if result.get('error') else None),
+            })
+        while order and order[0] in finished:
+            finished.discard(order[0])
+            checkpoint.watermark = order.popleft()
+        checkpoint.save()
+
+
+def _message_contents(message):
+    """Rebuilds the prompt chatbot_api sent for a stored user message."""
+    if not message.image_url:
+        return message.text
+    key = blob_key(message.image_url)
+    try:
+        data = get_blob_store().read(key)
+    except FileNotFoundError:
+        return None
+    mime_type = mimetypes.guess_type(key)[0] or 'image/jpeg'
+    return [message.text or "Describe this image", {"mime_type": mime_type, "data": data}]
+
+
+def mongo_items(watermark=None, errors_only=False, chatroom_id=None):
+    """Streams target user messages from MongoDB in id order."""
+    from bson import ObjectId
+    from mongoengine import Q
+    from models import Message
+
+    filters = {'sender': 'user'}
+    if chatroom_id:
+        filters['chatRoom'] = ObjectId(chatroom_id)
+    if watermark:
+        filters['pk__gt'] = ObjectId(watermark)
+    messages = Message.objects(**filters)
+    if errors_only:
+        # Replies are AI messages referenced by `reply`; older messages keep a gemini_response copy
+        error_replies = Message.objects(sender='ai', text__startswith=ERROR_PREFIX).scalar('pk')
+        messages = messages.filter(Q(reply__in=list(error_replies)) | Q(gemini_response__startswith=ERROR_PREFIX))
+    messages = messages.only('text', 'image_url', 'chatRoom').order_by('pk')
+    for message in messages.no_cache().timeout(False):
+        yield {'id': str(message.pk), 'chatRoom': message.chatroom_id(), 'contents': _message_contents(message)}
+
+
+def mongo_saver(run, model_name):
+    from bson import ObjectId
+    from models import Regeneration
+
+    def save_result(item, result):
+        Regeneration.objects(run=run, message=ObjectId(item['id'])).update_one(
+            upsert=True,
+            set__chatRoom=ObjectId(item['chatRoom']) if item['chatRoom'] else None,
+            set__model=model_name,
+            set__response=result.get('response'),
+            set__error=result.get('error'),
+            set__latency_ms=result.get('latency_ms'),
+            set__prompt_tokens=result.get('prompt_tokens'),
+            set__output_tokens=result.get('output_tokens'),
+            set__finish_reason=result.get('finish_reason'),
+            set__attempts=result['attempts'],
+        )
+    return save_result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--run', required=True, help='Name of the run; results are stored under it')
+    parser.add_argument('--model', default='gemini-2.5-flash', help='Gemini model to answer with')
+    parser.add_argument('--errors-only', action='store_true', help='Only messages whose answer was a Gemini error')
+    parser.add_argument('--room', help='Only messages from this chat room id')
+    parser.add_argument('--concurrency', type=int, default=REGENERATE_CONCURRENCY)
+    parser.add_argument('--rpm', type=int, default=REGENERATE_RATE_PER_MINUTE, help='Maximum Gemini calls per minute')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: regenerate-<run>.json)')
+    args = parser.parse_args(argv)
+
+    import google.generativeai as genai
+    from dotenv import load_dotenv
+    from mongoengine import connect
+
+    load_dotenv()
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+    connect('chatbot', host=os.environ.get("MONGODB_HOST", 'mongodb://localhost:27017/'))
+    from gemini_settings import safety_settings  # Same filters as the live endpoint
+
+    model = genai.GenerativeModel(args.model)
+    checkpoint = Checkpoint(args.checkpoint or f"regenerate-{args.run}.json")
+    regenerator = Regenerator(
+        lambda contents: model.generate_content(contents, safety_settings=safety_settings),
+        mongo_saver(args.run, args.model),
+        args.model,
+        concurrency=args.concurrency,
+        rate_per_minute=args.rpm,
+    )
+    if checkpoint.watermark:
+        print(f"Resuming run '{args.run}' after message {checkpoint.watermark}")
+    rows = regenerator.run(mongo_items(checkpoint.watermark, args.errors_only, args.room), checkpoint)
+
+    print(json.dumps({
+        'run': args.run,
+        'completed': checkpoint.completed,
+        'failed': checkpoint.failed,
+        'rate_limited_retries': regenerator.rate_limited,
+        'this_session': summarize_generations(rows)['overall'],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
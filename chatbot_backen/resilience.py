@@ -0,0 +1,347 @@
+# resilience.py - Circuit breaker, hedged requests and admission control for slow or failing upstream calls
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit is open."""
+
+
+def upstream_failure(error):
+    """Whether an error says the upstream is unhealthy: transport errors, timeouts, 5xx and 429.
+
+    Client errors (invalid arguments, safety blocks, unreadable images) mean
+    the upstream answered, so they shouldn't open a circuit shared by everyone.
+    """
+    if isinstance(error, OSError):  # Includes ConnectionError, TimeoutError and socket errors
+        return True
+    status = getattr(error, 'code', None)  # google.api_core errors carry the HTTP status here
+    if not isinstance(status, int):
+        status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    return isinstance(status, int) and (status >= 500 or status == 429)
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing.
+
+    closed: calls go through; `failure_threshold` consecutive failures open the circuit.
+    open: calls fail fast with CircuitOpenError until `reset_timeout` seconds pass.
+    half_open: a single probe call goes through; success closes the circuit,
+    failure opens it again. Other callers keep failing fast while the probe runs.
+
+    `is_failure(error)` decides which exceptions count as failures (all of them
+    by default); others still propagate but count as the upstream answering.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, is_failure=None, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.is_failure = is_failure or (lambda error: True)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def _before_call(self):
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self._rejected += 1
+            retry_in = max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+        raise CircuitOpenError(f"{self.name} circuit is open, retry in {retry_in:.0f}s")
+
+    def _on_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def _on_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+            self._probe_in_flight = False
+
+    def call(self, fn, *args, **kwargs):
+        self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                self._on_failure()
+            else:
+                self._on_success()
+            raise
+        except BaseException:
+            # Interrupted mid-call (a worker timeout, SystemExit): count it as a failure
+            # so a half-open probe is always released and the circuit can't stay stuck
+            self._on_failure()
+            raise
+        self._on_success()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'rejected': self._rejected,
+            }
+
+
+class LatencyTracker:
+    """Keeps a sliding window of recent call latencies (seconds)."""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, p):
+        """Returns the p-th percentile (0-100) of the window, or None if empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+
+class HedgedCaller:
+    """Sends a second, identical request when the first is slower than usual.
+
+    The hedge fires once the first call has been running longer than the
+    `percentile`-th latency of recent successful calls; whichever call succeeds
+    first wins. Hedging is off when `percentile` is None or until `min_samples`
+    latencies have been recorded.
+    """
+
+    def __init__(self, percentile=None, min_samples=20, window=200, max_workers=8, clock=time.monotonic):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker(window)
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+        self._hedged = 0
+        self._hedge_wins = 0
+
+    def hedge_delay(self):
+        if self.percentile is None or len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    def _timed(self, fn, args, kwargs):
+        start = self._clock()
+        result = fn(*args, **kwargs)
+        self.latencies.record(self._clock() - start)
+        return result
+
+    def call(self, fn, *args, **kwargs):
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._timed(fn, args, kwargs)
+
+        primary = self._executor.submit(self._timed, fn, args, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            self._hedged += 1
+        hedge = self._executor.submit(self._timed, fn, args, kwargs)
+
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self._hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hedged': self._hedged,
+                'hedge_wins': self._hedge_wins,
+                'hedge_delay_seconds': self.hedge_delay(),
+            }
+
+
+class Overloaded(Exception):
+    """Raised when admission control sheds a request instead of queueing it."""
+
+    def __init__(self, message, status=503, retry_after=1.0):
+        super().__init__(message)
+        self.status = status  # 429 for rate limits, 503 when the service is saturated
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Allows `rate_per_minute` calls on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate_per_minute, burst, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._clock = clock
+        self._updated = clock()
+
+    def take(self):
+        """Takes a token; returns 0 on success, else seconds until one is available."""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1 - 1e-9:  # Tolerates float rounding after sleeping the exact wait
+            self._tokens = max(0.0, self._tokens - 1)
+            return 0.0
+        return (1 - self._tokens) / self.rate if self.rate > 0 else float('inf')
+
+
+class AdmissionController:
+    """Bounds concurrent upstream calls and sheds load once the backlog is full.
+
+    check_rate() applies per-key token buckets, e.g. one per room and one per
+    sender (`rate_limits` maps a kind to (rate_per_minute, burst)). slot()
+    admits at most `max_concurrent` calls, and `max_per_key` per room, so one
+    busy room can't take every slot. Up to `max_queue` callers wait for a slot
+    for at most `queue_timeout` seconds; anything beyond that fails fast with
+    Overloaded and a Retry-After estimate.
+    """
+
+    def __init__(self, name, max_concurrent=8, max_per_key=2, max_queue=16, queue_timeout=10.0,
+                 rate_limits=None, max_tracked_keys=10000, clock=time.monotonic):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_per_key = max_per_key
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate_limits = rate_limits or {}
+        self.max_tracked_keys = max_tracked_keys
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._buckets = {kind: OrderedDict() for kind in self.rate_limits}
+        self._active = 0
+        self._active_by_key = {}
+        self._queued = 0
+        self._max_queue_depth = 0
+        self._avg_seconds = None  # Moving average of slot hold times, for Retry-After
+        self._admitted = 0
+        self._shed = {'rate_limited': 0, 'queue_full': 0, 'timeout': 0}
+
+    def check_rate(self, **keys):
+        """Takes a token from each keyed bucket; raises Overloaded (429) if one is empty."""
+        with self._cond:
+            for kind, key in keys.items():
+                if key is None or kind not in self.rate_limits:
+                    continue
+                buckets = self._buckets[kind]
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = TokenBucket(*self.rate_limits[kind], clock=self._clock)
+                    if len(buckets) > self.max_tracked_keys:
+                        buckets.popitem(last=False)
+                buckets.move_to_end(key)
+                wait_seconds = bucket.take()
+                if wait_seconds > 0:
+                    self._shed['rate_limited'] += 1
+                    raise Overloaded(f"Too many {self.name} requests for this {kind}", 429, wait_seconds)
+
+    def _can_run(self, key):
+        return self._active < self.max_concurrent and (
+            key is None or self._active_by_key.get(key, 0) < self.max_per_key
+        )
+
+    def _retry_estimate(self):
+        average = self._avg_seconds or 1.0
+        return max(1.0, average * (self._queued + 1) / self.max_concurrent)
+
+    def _acquire(self, key):
+        with self._cond:
+            if not self._can_run(key):
+                if self._queued >= self.max_queue:
+                    self._shed['queue_full'] += 1
+                    raise Overloaded(f"{self.name} is at capacity", 503, self._retry_estimate())
+                self._queued += 1
+                self._max_queue_depth = max(self._max_queue_depth, self._queued)
+                deadline = self._clock() + self.queue_timeout
+                try:
+                    while not self._can_run(key):
+                        remaining = deadline - self._clock()
+                        if remaining <= 0:
+                            self._shed['timeout'] += 1
+                            raise Overloaded(f"Timed out waiting for {self.name} capacity", 503,
+                                             self._retry_estimate())
+                        self._cond.wait(remaining)
+                finally:
+                    self._queued -= 1
+            self._active += 1
+            if key is not None:
+                self._active_by_key[key] = self._active_by_key.get(key, 0) + 1
+            self._admitted += 1
+
+    def _release(self, key, held_seconds):
+        with self._cond:
+            self._active -= 1
+            if key is not None:
+                self._active_by_key[key] -= 1
+                if not self._active_by_key[key]:
+                    del self._active_by_key[key]
+            self._avg_seconds = held_seconds if self._avg_seconds is None \
+                else 0.8 * self._avg_seconds + 0.2 * held_seconds
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, key=None):
+        """Holds one concurrency slot (and one of `key`'s) for the duration of the block."""
+        self._acquire(key)
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self._release(key, self._clock() - start)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': self._active,
+                'queue_depth': self._queued,
+                'max_queue_depth': self._max_queue_depth,
+                'admitted': self._admitted,
+                'shed': dict(self._shed),
+            }
@@ -0,0 +1,70 @@
+# single_flight.py - Coalesces identical in-flight upstream calls into one
+import threading
+
+
+class _Call:
+    """One in-flight upstream call and the callers waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time.
+
+    The first caller for a key runs the function; callers arriving with the
+    same key while it is running wait and receive the same result, or the same
+    exception. Nothing is cached: once the call finishes the key is released,
+    so the next caller starts a fresh upstream call.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        return self.do_shared(key, fn, *args, **kwargs)[0]
+
+    def do_shared(self, key, fn, *args, **kwargs):
+        """Like do(), but returns (result, shared) where shared is True for
+        callers that joined another caller's in-flight call."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        """Returns counters of executed and coalesced calls."""
+        with self._lock:
+            return {
+                'executed': self._executed,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._calls),
+            }
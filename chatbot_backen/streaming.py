@@ -0,0 +1,83 @@
+# streaming.py - Incremental JSON array encoding with on-the-fly gzip/br compression
+import json
+import os
+import zlib
+
+from flask import Response, request
+
+try:
+    import brotli  # Optional: enables `Content-Encoding: br`
+except ImportError:
+    brotli = None
+
+# Bytes of JSON buffered before a chunk is compressed and sent
+STREAM_CHUNK_BYTES = int(os.environ.get("STREAM_CHUNK_BYTES", "16384"))
+# Responses are compressed only when the client accepts it; levels favour speed
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+
+
+def iter_json_array(items, serialize):
+    """Yields a JSON array of serialize(item) in chunks of about STREAM_CHUNK_BYTES.
+
+    Items are pulled from the iterable one at a time, so a DB cursor is never
+    materialized as a list. With serialize=None the items are already JSON text.
+    """
+    buffer = ['[']
+    size = 1
+    first = True
+    for item in items:
+        encoded = json.dumps(serialize(item)) if serialize is not None else item
+        if not first:
+            buffer.append(',')
+            size += 1
+        buffer.append(encoded)
+        size += len(encoded)
+        first = False
+        if size >= STREAM_CHUNK_BYTES:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    buffer.append(']')
+    yield ''.join(buffer).encode('utf-8')
+
+
+def _negotiate_encoding(accept_encoding):
+    accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compress(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def streamed_json_response(items, serialize, status=200, wrap=None):
+    """Streams items as a JSON array, compressed per the request's Accept-Encoding.
+
+    `wrap` lets callers keep a request/app context alive (e.g. stream_with_context).
+    """
+    chunks = iter_json_array(items, serialize)
+    encoding = _negotiate_encoding(request.headers.get('Accept-Encoding'))
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding:
+        chunks = _compress(chunks, encoding)
+        headers['Content-Encoding'] = encoding
+    if wrap is not None:
+        chunks = wrap(chunks)
+    return Response(chunks, status=status, mimetype='application/json', headers=headers)
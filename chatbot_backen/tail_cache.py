@@ -0,0 +1,153 @@
+# tail_cache.py - Per-room ring buffers of the most recent serialized messages
+import os
+import threading
+from collections import OrderedDict, deque
+
+# Messages kept per room; tail reads asking for more go to the database
+TAIL_CACHE_MESSAGES = int(os.environ.get("TAIL_CACHE_MESSAGES", "50"))
+# Upper bound on the serialized bytes held across all rooms in one worker
+TAIL_CACHE_MAX_BYTES = int(os.environ.get("TAIL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+class TailEntry:
+    __slots__ = ('message_id', 'encoded')
+
+    def __init__(self, message_id, encoded):
+        self.message_id = message_id
+        self.encoded = encoded  # The message's to_json(), already JSON-encoded
+
+
+class RoomTail:
+    __slots__ = ('entries', 'revision', 'complete', 'size')
+
+    def __init__(self, capacity, revision, complete):
+        self.entries = deque(maxlen=capacity)
+        self.revision = revision
+        self.complete = complete  # True while the buffer holds every message in the room
+        self.size = 0
+
+
+class TailCache:
+    """Recent messages per room, kept in sync by the write path.
+
+    Each room carries a revision counter that every write bumps atomically
+    (ChatRoom.record_message). A buffer is only served while its revision
+    matches the room's, and writes are only applied when they are the next
+    revision, so writes handled by another worker invalidate it instead of
+    leaving it stale. Cold rooms are evicted LRU-first past `max_bytes`.
+    """
+
+    def __init__(self, per_room=TAIL_CACHE_MESSAGES, max_bytes=TAIL_CACHE_MAX_BYTES):
+        self.per_room = per_room
+        self.max_bytes = max_bytes
+        self._rooms = OrderedDict()  # room id -> RoomTail, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, room_id, limit, revision):
+        """Returns the last `limit` encoded messages, oldest first, or None on a miss."""
+        with self._lock:
+            tail = self._rooms.get(room_id)
+            if tail is None or tail.revision != revision or (limit > len(tail.entries) and not tail.complete):
+                self._misses += 1
+                return None
+            self._rooms.move_to_end(room_id)
+            self._hits += 1
+            entries = list(tail.entries)
+        return [entry.encoded for entry in entries[-limit:]]
+
+    def prime(self, room_id, messages, revision):
+        """Loads a room's newest messages, given oldest first as (id, encoded) pairs."""
+        if revision is None:
+            return
+        with self._lock:
+            self._drop(room_id)
+            tail = RoomTail(self.per_room, revision, complete=len(messages) < self.per_room)
+            self._rooms[room_id] = tail
+            for message_id, encoded in messages[-self.per_room:]:
+                self._push(tail, message_id, encoded)
+            self._evict()
+
+    def append(self, room_id, message_id, encoded, revision):
+        """Adds a newly created message; the room must be at the preceding revision."""
+        with self._lock:
+            tail = self._next_revision(room_id, revision)
+            if tail is not None:
+                self._push(tail, message_id, encoded)
+                self._evict()
+
+    def replace(self, room_id, message_id, encoded, revision):
+        """Swaps in an edited message if it is still inside the buffered tail."""
+        with self._lock:
+            tail = self._next_revision(room_id, revision)
+            if tail is not None:
+                self._replace(tail, message_id, encoded)
+
+    def invalidate(self, room_id):
+        with self._lock:
+            self._drop(room_id)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._size = 0
+
+    def _next_revision(self, room_id, revision):
+        tail = self._rooms.get(room_id)
+        if tail is None:
+            return None
+        if revision is None or revision != tail.revision + 1:
+            self._drop(room_id)  # Missed a write (e.g. on another worker)
+            return None
+        tail.revision = revision
+        return tail
+
+    def _push(self, tail, message_id, encoded):
+        # Priming can race with a write, so a message may already be buffered
+        if self._replace(tail, message_id, encoded):
+            return
+        if len(tail.entries) == tail.entries.maxlen:
+            self._resize(tail, -len(tail.entries[0].encoded))
+            tail.complete = False
+        tail.entries.append(TailEntry(message_id, encoded))
+        self._resize(tail, len(encoded))
+
+    def _replace(self, tail, message_id, encoded):
+        for entry in tail.entries:
+            if entry.message_id == message_id:
+                self._resize(tail, len(encoded) - len(entry.encoded))
+                entry.encoded = encoded
+                return True
+        return False
+
+    def _resize(self, tail, delta):
+        tail.size += delta
+        self._size += delta
+
+    def _drop(self, room_id):
+        tail = self._rooms.pop(room_id, None)
+        if tail is not None:
+            self._size -= tail.size
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._rooms) > 1:
+            room_id = next(iter(self._rooms))
+            self._drop(room_id)
+            self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rooms': len(self._rooms),
+                'bytes': self._size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+
+
+# Shared by app.py and the chatbot_api blueprint within one worker
+message_tails = TailCache()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test the in-process weather agent runner with a scripted model
+"""
+
+import threading
+
+from agent_runner import AgentError, AgentRunner, AgentTurn
+from resilience import CircuitBreaker, upstream_failure
+
+
+class ScriptedModel:
+    """Replays a fixed list of AgentTurns and records the history it was given."""
+
+    def __init__(self, turns):
+        self.turns = list(turns)
+        self.histories = []
+
+    def generate(self, history):
+        self.histories.append(list(history))
+        return self.turns.pop(0)
+
+    def tool_results(self, results):
+        return {'role': 'user', 'parts': results}
+
+
+def test_compound_question_runs_tools_in_parallel():
+    print("🤖 Testing Agent Runner")
+    print("=" * 40)
+
+    barrier = threading.Barrier(4, timeout=5)  # Only passes if all four calls run at once
+    calls = []
+
+    def get_weather(city: str) -> dict:
+        calls.append(('weather', city))
+        barrier.wait()
+        return {"status": "success", "report": f"Sunny in {city}"}
+
+    def get_current_time(city: str) -> dict:
+        calls.append(('time', city))
+        barrier.wait()
+        return {"status": "success", "report": f"Noon in {city}"}
+
+    model = ScriptedModel([
+        AgentTurn(tool_calls=[
+            ('get_weather', {'city': 'Tokyo'}), ('get_current_time', {'city': 'Tokyo'}),
+            ('get_weather', {'city': 'Paris'}), ('get_current_time', {'city': 'Paris'}),
+        ], content='call tools'),
+        AgentTurn(tool_calls=[('get_weather', {'city': 'Tokyo'})], content='call again'),
+        AgentTurn(text="Tokyo: sunny, noon. Paris: sunny, noon."),
+    ])
+    runner = AgentRunner(model, [get_weather, get_current_time])
+
+    answer = runner.run("weather and time in Tokyo and Paris")
+
+    assert answer == "Tokyo: sunny, noon. Paris: sunny, noon."
+    assert len(calls) == 4
+    assert runner.stats() == {'tool_calls': 4, 'memo_hits': 1}
+    first_results = model.histories[1][-1]['parts']
+    assert [name for name, _ in first_results] == ['get_weather', 'get_current_time', 'get_weather', 'get_current_time']
+    print(f"✅ 4 tools ran concurrently, repeated call was memoized: {runner.stats()}")
+
+
+def test_numeric_arguments_are_coerced():
+    def get_weather_forecast(city: str, days: int = 3) -> dict:
+        return {"status": "success", "report": f"{days} days in {city}", "days_type": type(days).__name__}
+
+    model = ScriptedModel([
+        AgentTurn(tool_calls=[('get_weather_forecast', {'city': 'London', 'days': 5.0})], content='call'),
+        AgentTurn(text="done"),
+    ])
+    AgentRunner(model, [get_weather_forecast]).run("5 day forecast for London")
+
+    (_, result), = model.histories[1][-1]['parts']
+    assert result['days_type'] == 'int'
+
+
+def test_agent_errors_do_not_trip_breaker():
+    breaker = CircuitBreaker('gemini', failure_threshold=2, is_failure=upstream_failure)
+    runner = AgentRunner(ScriptedModel([AgentTurn(text="")] * 3), [])
+    for _ in range(3):
+        try:
+            breaker.call(runner.run, "weather?")
+            assert False, "expected AgentError"
+        except AgentError:
+            pass
+    assert breaker.state == CircuitBreaker.CLOSED
+    print("✅ Empty agent answers don't open the Gemini circuit")
+
+
+if __name__ == "__main__":
+    test_compound_question_runs_tools_in_parallel()
+    test_numeric_arguments_are_coerced()
+    test_agent_errors_do_not_trip_breaker()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test the per-room message broker
+"""
+
+import json
+import threading
+
+from broker import InMemoryBroker, room_channel, set_broker, publish_message
+
+
+def test_in_memory_broker():
+    print("📡 Testing In-Memory Broker")
+    print("=" * 40)
+
+    broker = InMemoryBroker()
+    room_a = broker.subscribe(room_channel("a"))
+    room_a_2 = broker.subscribe(room_channel("a"))
+    room_b = broker.subscribe(room_channel("b"))
+
+    broker.publish(room_channel("a"), {"event": "created", "cursor": "1", "message": {"id": "1"}})
+
+    assert json.loads(room_a.get(timeout=1))["message"]["id"] == "1"
+    assert json.loads(room_a_2.get(timeout=1))["message"]["id"] == "1"
+    assert room_b.get(timeout=0.05) is None
+    print("✅ Events fan out to every subscriber of the room only")
+
+    room_a.close()
+    broker.publish(room_channel("a"), {"event": "updated", "cursor": "2", "message": {"id": "1"}})
+    assert room_a.get(timeout=0.05) is None
+    assert json.loads(room_a_2.get(timeout=1))["event"] == "updated"
+    print("✅ Closed subscriptions stop receiving events")
+
+
+def test_publish_message_from_thread():
+    print("\n🧵 Testing publish_message across threads")
+    print("=" * 40)
+
+    broker = InMemoryBroker()
+    set_broker(broker)
+    try:
+        subscription = broker.subscribe(room_channel("room1"))
+        message_json = {"id": "m1", "chatRoom": "room1", "updated_at": "2025-01-01T00:00:00"}
+        thread = threading.Thread(target=publish_message, args=(message_json,))
+        thread.start()
+        thread.join()
+
+        event = json.loads(subscription.get(timeout=1))
+        assert event == {"event": "created", "cursor": "2025-01-01T00:00:00", "message": message_json}
+        print(f"✅ Received {event['event']} event with cursor {event['cursor']}")
+    finally:
+        set_broker(None)
+
+
+if __name__ == "__main__":
+    test_in_memory_broker()
+    test_publish_message_from_thread()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Test the cache backends (in-process LRU, SQLite, Redis protocol)
+"""
+
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+
+from cache import FailSafeCache, LRUCache, SQLiteCache, RedisCache, RespClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Local stand-in for a Redis server, speaking just enough RESP for RedisCache."""
+
+    def _read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _bulk(self, value):
+        return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def handle(self):
+        store, zsets, lists = self.server.store, self.server.zsets, self.server.lists
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            name, args = args[0].upper(), args[1:]
+            if name == b'GET':
+                reply = self._bulk(store.get(args[0]))
+            elif name == b'SET':
+                if b'NX' in args[2:] and args[0] in store:
+                    reply = self._bulk(None)
+                else:
+                    store[args[0]] = args[1]
+                    reply = b'+OK\r\n'
+            elif name == b'DEL':
+                reply = b':%d\r\n' % sum(1 for key in args if store.pop(key, None) is not None
+                                          or zsets.pop(key, None) is not None or lists.pop(key, None) is not None)
+            elif name == b'LPUSH':
+                items = lists.setdefault(args[0], [])
+                items[:0] = reversed(args[1:])
+                reply = b':%d\r\n' % len(items)
+            elif name == b'LTRIM':
+                lists[args[0]] = lists.get(args[0], [])[int(args[1]):int(args[2]) + 1]
+                reply = b'+OK\r\n'
+            elif name == b'LRANGE':
+                items = lists.get(args[0], [])
+                reply = b'*%d\r\n' % len(items) + b''.join(self._bulk(item) for item in items)
+            elif name == b'EXPIRE':
+                reply = b':1\r\n'
+            elif name == b'ZADD':
+                zsets.setdefault(args[0], {})[args[2]] = float(args[1])
+                reply = b':1\r\n'
+            elif name == b'ZREM':
+                reply = b':%d\r\n' % (zsets.get(args[0], {}).pop(args[1], None) is not None)
+            elif name == b'ZCARD':
+                reply = b':%d\r\n' % len(zsets.get(args[0], {}))
+            elif name in (b'ZPOPMIN', b'ZRANGE'):
+                members = sorted(zsets.get(args[0], {}).items(), key=lambda item: item[1])
+                if name == b'ZPOPMIN':
+                    members = members[:int(args[1])]
+                    for member, _ in members:
+                        del zsets[args[0]][member]
+                    items = [value for member, score in members for value in (member, str(score).encode())]
+                else:
+                    items = [member for member, _ in members]
+                reply = b'*%d\r\n' % len(items) + b''.join(self._bulk(item) for item in items)
+            else:
+                reply = b'-ERR unknown command\r\n'
+            self.wfile.write(reply)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    block_on_close = False
+
+
+def test_lru_cache_ttl_and_eviction():
+    print("🗃️ Testing LRU Cache")
+    print("=" * 40)
+
+    clock = FakeClock()
+    cache = LRUCache(max_entries=2, clock=clock)
+    cache.set('london', {'status': 'success'}, ttl=60)
+    cache.set('paris', {'status': 'success'})
+    assert cache.get('london') == {'status': 'success'}  # london is now most recent
+    cache.set('tokyo', {'status': 'success'})
+    assert cache.get('paris') is None
+    clock.now += 61
+    assert cache.get('london') is None
+    assert cache.get('tokyo') == {'status': 'success'}
+    print("✅ Expired and least-recently-used entries were dropped")
+
+
+def test_sqlite_cache_is_shared():
+    print("\n💾 Testing SQLite Cache")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite3')
+        clock = FakeClock()
+        worker_a = SQLiteCache(path, max_entries=2, clock=clock)
+        worker_b = SQLiteCache(path, max_entries=2, clock=clock)
+
+        worker_a.set('weather:london', {'report': 'Cloudy'}, ttl=60)
+        assert worker_b.get('weather:london') == {'report': 'Cloudy'}
+        print("✅ Value written by one worker was read by another")
+
+        clock.now += 1
+        worker_b.set('weather:paris', {'report': 'Sunny'})
+        clock.now += 1
+        worker_a.get('weather:london')
+        clock.now += 1
+        worker_a.set('weather:tokyo', {'report': 'Clear'})
+        assert worker_b.get('weather:paris') is None
+        clock.now += 61
+        assert worker_a.get('weather:london') is None
+        assert worker_a.get('weather:tokyo') == {'report': 'Clear'}
+        print("✅ LRU eviction and TTL expiry work across connections")
+
+        assert worker_a.add('lock:london', 1, ttl=30)
+        assert not worker_b.add('lock:london', 1, ttl=30)  # Held by worker_a
+        clock.now += 31
+        assert worker_b.add('lock:london', 1, ttl=30)  # Expired, so it can be taken over
+        print("✅ add() sets a key only while it is absent")
+
+
+def test_redis_cache_against_stand_in():
+    print("\n🧱 Testing Redis Cache")
+    print("=" * 40)
+
+    server = FakeRedisServer(('127.0.0.1', 0), FakeRedisHandler)
+    server.store, server.zsets, server.lists = {}, {}, {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = RespClient('127.0.0.1', server.server_address[1])
+        clock = FakeClock()
+        cache = RedisCache(client, namespace='weather', max_entries=2, clock=clock)
+
+        cache.set('london', {'report': 'Cloudy'}, ttl=60)
+        clock.now += 1
+        cache.set('paris', {'report': 'Sunny'})
+        clock.now += 1
+        assert cache.get('london') == {'report': 'Cloudy'}
+        clock.now += 1
+        cache.set('tokyo', {'report': 'Clear'})
+
+        assert cache.get('paris') is None
+        assert server.store[b'weather:london'] == b'{"report": "Cloudy"}'
+        assert cache.add('lock', 1, ttl=30) and not cache.add('lock', 1, ttl=30)
+        for i in range(4):
+            cache.push('recent', {'n': i}, max_items=3, ttl=60)
+        assert cache.get_list('recent') == [{'n': 3}, {'n': 2}, {'n': 1}]
+        print("✅ Values round-trip over RESP and the LRU key was evicted")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_sqlite_trims_periodically():
+    with tempfile.TemporaryDirectory() as directory:
+        clock = FakeClock()
+        cache = SQLiteCache(os.path.join(directory, 'cache.sqlite3'), max_entries=4, clock=clock, trim_every=3)
+        count = lambda: cache._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        for i in range(5):
+            clock.now += 1
+            cache.set(f'city:{i}', i)
+        assert count() == 5  # Over max_entries until the next trim
+        clock.now += 1
+        cache.set('city:5', 5)  # Sixth write checks the size again
+        assert count() == 4
+        assert cache.get('city:0') is None and cache.get('city:1') is None
+        assert cache.get('city:2') == 2
+
+
+def test_push_keeps_newest_items():
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite3')
+        for cache in (LRUCache(clock=clock), SQLiteCache(path, clock=clock)):
+            for i in range(4):
+                cache.push('recent', i, max_items=3, ttl=60)
+            assert cache.get_list('recent') == [3, 2, 1]
+            clock.now += 61
+            assert cache.get_list('recent') == []  # Expired with its TTL
+            cache.push('recent', 'fresh', max_items=3)
+            assert cache.get_list('recent') == ['fresh']
+
+        workers = [SQLiteCache(path) for _ in range(4)]
+
+        def push_many(cache, worker):
+            for i in range(25):
+                cache.push('shared', f"{worker}-{i}", max_items=1000)
+
+        threads = [threading.Thread(target=push_many, args=(cache, n)) for n, cache in enumerate(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(workers[0].get_list('shared')) == 100  # No worker's push was lost
+    print("✅ push() trims to the newest items and is safe across connections")
+
+
+def test_unreachable_backend_is_a_miss():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]  # Nothing listens here once the socket closes
+    cache = FailSafeCache(RedisCache(RespClient('127.0.0.1', port, timeout=0.5)), 'weather')
+    assert cache.get('london') is None
+    cache.set('london', {'report': 'Cloudy'}, ttl=60)
+    assert cache.add('lock:london', 1, ttl=30) is False
+    cache.push('recent', 1, max_items=10)
+    assert cache.get_list('recent') == []
+    cache.delete('london')
+    print("✅ Backend errors were treated as misses")
+
+
+if __name__ == "__main__":
+    test_lru_cache_ttl_and_eviction()
+    test_sqlite_cache_is_shared()
+    test_redis_cache_against_stand_in()
+    test_sqlite_trims_periodically()
+    test_push_keeps_newest_items()
+    test_unreachable_backend_is_a_miss()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Test compression of long stored text
+"""
+
+from compression import compress_text, expand_text, is_compressed
+
+
+def test_long_text_round_trips():
+    print("🗜️ Testing stored text compression")
+    print("=" * 40)
+
+    reply = "The forecast for London is cloudy with light rain. " * 80
+    for algorithm in ('zlib', 'bz2', 'lzma'):
+        stored = compress_text(reply, algorithm=algorithm, min_bytes=1024)
+        assert is_compressed(stored) and stored['codec'] == algorithm
+        assert stored['chars'] == len(reply)
+        assert expand_text(stored) == reply
+        print(f"✅ {algorithm}: {len(reply)} chars stored in {len(stored['data'])} bytes")
+
+
+def test_short_and_incompressible_text_stay_plain():
+    assert compress_text("Hello!", min_bytes=1024) == "Hello!"
+    assert compress_text(None) is None
+    assert expand_text("Hello!") == "Hello!"
+    assert expand_text(None) is None
+
+    noise = ''.join(chr(0x4e00 + (i * 7919) % 20000) for i in range(600))  # Unicode, little repetition
+    stored = compress_text(noise, min_bytes=100)
+    assert expand_text(stored) == noise
+    print("✅ Short text stays a plain string")
+
+
+if __name__ == "__main__":
+    test_long_text_round_trips()
+    test_short_and_incompressible_text_stay_plain()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Test connection pool checkout instrumentation
+"""
+
+import os
+import tempfile
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+import db_pool
+from db_pool import PoolMonitor
+
+
+def test_pool_monitor_counts_checkouts_and_timeouts():
+    print("🏊 Testing pool monitor")
+    print("=" * 40)
+
+    monitor = PoolMonitor('primary')
+    assert monitor.stats()['in_use'] == 0 and monitor.stats()['checkout_ms']['p95'] is None
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'pool.db')}", poolclass=monitor.pool_class(),
+                               pool_size=2, max_overflow=0, pool_timeout=0.05)
+        first, second = engine.connect(), engine.connect()
+        first.execute(text("SELECT 1"))
+        stats = monitor.stats()
+        assert stats['checkouts'] == 2 and stats['in_use'] == 2 and stats['peak_in_use'] == 2
+        assert stats['capacity'] == db_pool.DB_POOL_SIZE + db_pool.DB_MAX_OVERFLOW
+        assert stats['saturation'] == round(2 / stats['capacity'], 3)
+
+        try:
+            engine.connect()  # Pool exhausted
+            assert False, "expected a pool timeout"
+        except PoolTimeoutError:
+            pass
+        first.close()
+        second.close()
+        engine.connect().close()
+
+        stats = monitor.stats()
+        assert stats['timeouts'] == 1 and stats['checkouts'] == 3
+        assert stats['in_use'] == 0 and stats['peak_in_use'] == 2
+        assert stats['checkout_ms']['p99'] >= 50  # The timed-out wait is part of the latency window
+        engine.dispose()
+    print(f"✅ Checkouts, peak use and a timeout were recorded: {stats}")
+
+
+if __name__ == "__main__":
+    test_pool_monitor_counts_checkouts_and_timeouts()
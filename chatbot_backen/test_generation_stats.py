@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test the per-room summary of stored Gemini generation metadata
+"""
+
+from types import SimpleNamespace
+
+from generation_stats import percentile, response_metadata, summarize_generations
+
+
+def test_summary_percentiles():
+    print("📈 Testing generation stats")
+    print("=" * 40)
+
+    rows = [{'chatRoom': 'a', 'model': 'gemini-2.0-flash', 'latency_ms': float(ms), 'prompt_tokens': 10,
+             'output_tokens': 20, 'finish_reason': 'STOP', 'cache_hit': False} for ms in range(1, 101)]
+    rows.append({'chatRoom': 'b', 'model': None, 'latency_ms': None, 'prompt_tokens': None,
+                 'output_tokens': None, 'finish_reason': None, 'cache_hit': True})
+
+    summary = summarize_generations(rows)
+    overall, room_a = summary['overall'], summary['rooms']['a']
+    assert overall['generations'] == 101 and overall['cache_hits'] == 1
+    assert overall['prompt_tokens'] == 1000 and overall['output_tokens'] == 2000
+    assert room_a['latency_ms_p50'] == 51.0 and room_a['latency_ms_p90'] == 90.0 and room_a['latency_ms_p99'] == 99.0
+    assert room_a['latency_ms_max'] == 100.0 and room_a['latency_ms_total'] == 5050.0
+    assert overall['models'] == {'gemini-2.0-flash': 100, 'unknown': 1}
+    assert summary['rooms']['b']['latency_ms_p50'] is None  # Cache hits without a latency
+    print(f"✅ p50/p90/p99 of 1..100 ms: {room_a['latency_ms_p50']}, {room_a['latency_ms_p90']}, "
+          f"{room_a['latency_ms_p99']}")
+
+
+def test_empty_input():
+    summary = summarize_generations([])
+    assert summary['rooms'] == {}
+    assert summary['overall']['generations'] == 0 and summary['overall']['latency_ms_max'] is None
+    assert summary['overall']['latency_ms_p99'] is None
+    assert percentile([], 50) is None and percentile([7.0], 99) == 7.0
+    print("✅ No generations summarize to zeros and empty percentiles")
+
+
+def test_response_metadata():
+    response = SimpleNamespace(
+        usage_metadata=SimpleNamespace(prompt_token_count=12, candidates_token_count=34),
+        candidates=[SimpleNamespace(finish_reason=SimpleNamespace(name='MAX_TOKENS'))],
+    )
+    assert response_metadata(response) == {'prompt_tokens': 12, 'output_tokens': 34, 'finish_reason': 'MAX_TOKENS'}
+    assert response_metadata(SimpleNamespace()) == {'prompt_tokens': None, 'output_tokens': None, 'finish_reason': None}
+
+
+if __name__ == "__main__":
+    test_summary_percentiles()
+    test_empty_input()
+    test_response_metadata()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test Idempotency-Key handling: replays, mismatches, in-flight repeats and lease takeover
+"""
+
+import datetime
+import threading
+
+from flask import Flask, jsonify, request
+
+import idempotency
+from idempotency import idempotent
+
+
+class MemoryStore:
+    """In-memory version of the IdempotencyKey model interface."""
+
+    def __init__(self):
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key, fingerprint):
+        with self._lock:
+            if key in self.records:
+                return dict(self.records[key])
+            self.records[key] = {'fingerprint': fingerprint, 'state': 'pending',
+                                 'claimed_at': datetime.datetime.utcnow(), 'status_code': None, 'body': None}
+            return None
+
+    def lookup(self, key):
+        with self._lock:
+            return dict(self.records[key]) if key in self.records else None
+
+    def take_over(self, key, claimed_at):
+        with self._lock:
+            record = self.records.get(key)
+            if record is None or record['state'] != 'pending' or record['claimed_at'] != claimed_at:
+                return False
+            record['claimed_at'] = datetime.datetime.utcnow()
+            return True
+
+    def complete(self, key, status_code, body):
+        with self._lock:
+            self.records[key].update(state='done', status_code=status_code, body=body)
+
+    def release(self, key):
+        with self._lock:
+            if self.records.get(key, {}).get('state') == 'pending':
+                del self.records[key]
+
+
+def make_app(store):
+    app = Flask(__name__)
+    app.calls = 0
+
+    @app.route('/messages', methods=['POST'])
+    @idempotent(store)
+    def create():
+        app.calls += 1
+        return jsonify({'id': app.calls, 'text': request.get_json()['text']}), 201
+
+    return app
+
+
+def post(client, key, text):
+    return client.post('/messages', json={'text': text}, headers={'Idempotency-Key': key})
+
+
+def test_finished_key_is_replayed():
+    print("🔁 Testing Idempotency-Key handling")
+    print("=" * 40)
+
+    app = make_app(MemoryStore())
+    client = app.test_client()
+    first = post(client, 'abc', 'hello')
+    repeat = post(client, 'abc', 'hello')
+    assert first.status_code == repeat.status_code == 201
+    assert repeat.get_json() == first.get_json() and repeat.headers['Idempotent-Replayed'] == 'true'
+    assert app.calls == 1
+
+    assert post(client, 'abc', 'something else').status_code == 422  # Same key, different request
+    assert app.calls == 1
+    print("✅ Repeats replay the first response; a reused key with another body is refused")
+
+
+def test_pending_claim_waits_then_gives_up():
+    store = MemoryStore()
+    app = make_app(store)
+    client = app.test_client()
+    post(client, 'seed', 'hello')
+    # A request still running elsewhere holds the key under the same fingerprint
+    store.records['/messages:busy'] = dict(store.records['/messages:seed'], state='pending',
+                                           claimed_at=datetime.datetime.utcnow())
+
+    wait, idempotency.IDEMPOTENCY_WAIT_SECONDS = idempotency.IDEMPOTENCY_WAIT_SECONDS, 0.3
+    try:
+        assert post(client, 'busy', 'hello').status_code == 409
+
+        threading.Timer(0.1, store.complete, ('/messages:busy', 201, '{"id": 99}')).start()
+        repeat = post(client, 'busy', 'hello')
+        assert repeat.status_code == 201 and repeat.get_json() == {'id': 99}
+    finally:
+        idempotency.IDEMPOTENCY_WAIT_SECONDS = wait
+    assert app.calls == 1
+    print("✅ A repeat of an in-flight request waits for its result, then gives up with 409")
+
+
+def test_expired_lease_is_taken_over():
+    store = MemoryStore()
+    app = make_app(store)
+    client = app.test_client()
+    post(client, 'seed', 'hello')
+    # Claimed by a worker that crashed before finishing
+    stale = datetime.datetime.utcnow() - datetime.timedelta(seconds=idempotency.IDEMPOTENCY_LEASE_SECONDS + 1)
+    store.records['/messages:crashed'] = dict(store.records['/messages:seed'], state='pending', claimed_at=stale)
+
+    response = post(client, 'crashed', 'hello')
+    assert response.status_code == 201 and app.calls == 2
+    assert store.records['/messages:crashed']['state'] == 'done'
+    assert not store.take_over('/messages:crashed', stale)  # Only one repeat can win
+    print("✅ An abandoned claim is taken over once its lease expires")
+
+
+if __name__ == "__main__":
+    test_finished_key_is_replayed()
+    test_pending_claim_waits_then_gives_up()
+    test_expired_lease_is_taken_over()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test image preprocessing: downscaling, EXIF orientation, thumbnail reuse and non-image uploads
+"""
+
+import os
+import tempfile
+
+from PIL import Image
+
+from image_pipeline import preprocess_image, process_image
+
+
+def make_upload(directory, name, size, orientation=None, color=(200, 30, 30)):
+    path = os.path.join(directory, name)
+    image = Image.new('RGB', size, color)
+    if orientation is None:
+        image.save(path, 'JPEG')
+    else:
+        exif = Image.Exif()
+        exif[0x0112] = orientation  # Orientation tag
+        image.save(path, 'JPEG', exif=exif)
+    return path
+
+
+def process(directory, path, **kwargs):
+    return process_image(path, model_folder=os.path.join(directory, 'model'),
+                         thumbnail_folder=os.path.join(directory, 'thumbs'), **kwargs)
+
+
+def test_downscales_model_copy_and_thumbnail():
+    print("🖼️ Testing Image Pipeline")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as directory:
+        result = process(directory, make_upload(directory, 'wide.jpg', (4000, 2000)),
+                         model_max_side=1536, thumbnail_max_side=320, thumbnail_format='WEBP')
+        with Image.open(result['model_path']) as model_copy:
+            assert model_copy.size == (1536, 768) and model_copy.format == 'JPEG'
+        with Image.open(result['thumbnail_path']) as thumbnail:
+            assert thumbnail.size == (320, 160) and thumbnail.format == 'WEBP'
+        assert result['thumbnail'].endswith('.webp') and result['mime_type'] == 'image/jpeg'
+        assert not [name for folder in ('model', 'thumbs')
+                    for name in os.listdir(os.path.join(directory, folder)) if name.endswith('.tmp')]
+
+        small = process(directory, make_upload(directory, 'small.jpg', (100, 50), color=(0, 0, 255)))
+        with Image.open(small['model_path']) as model_copy:
+            assert model_copy.size == (100, 50)  # Never upscaled
+    print("✅ Model copy and thumbnail fit their longest side, keeping the aspect ratio")
+
+
+def test_exif_orientation_is_applied():
+    with tempfile.TemporaryDirectory() as directory:
+        # Orientation 6: stored landscape, displayed rotated 90° clockwise
+        result = process(directory, make_upload(directory, 'phone.jpg', (400, 200), orientation=6))
+        with Image.open(result['model_path']) as model_copy:
+            assert model_copy.size == (200, 400)
+            assert model_copy.getexif().get(0x0112) in (None, 1)
+    print("✅ EXIF orientation was applied to the pixels")
+
+
+def test_identical_upload_reuses_output():
+    with tempfile.TemporaryDirectory() as directory:
+        first = process(directory, make_upload(directory, 'a.jpg', (800, 600)))
+        written_at = os.stat(first['thumbnail_path']).st_mtime_ns
+        second = process(directory, make_upload(directory, 'b.jpg', (800, 600)))
+        assert second == first
+        assert os.stat(second['thumbnail_path']).st_mtime_ns == written_at
+    print("✅ A repeated upload reused the earlier thumbnail")
+
+
+def test_non_image_passes_through():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'notes.png')
+        with open(path, 'w') as f:
+            f.write("not an image")
+        try:
+            process(directory, path)
+            assert False, "expected an error for a non-image"
+        except Exception:
+            pass
+        assert not os.path.exists(os.path.join(directory, 'model'))
+        assert preprocess_image(path) is None  # Callers send the original upload instead
+    print("✅ Non-image uploads produce no output and fall back to the original")
+
+
+if __name__ == "__main__":
+    test_downscales_model_copy_and_thumbnail()
+    test_exif_orientation_is_applied()
+    test_identical_upload_reuses_output()
+    test_non_image_passes_through()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Test batched multi-room read requests and responses
+"""
+
+import datetime
+import json
+
+from message_batch import BATCH_DEFAULT_LIMIT, BATCH_MAX_ROOMS, encode_batch, parse_batch
+
+
+def test_parse_batch():
+    print("📦 Testing batch request parsing")
+    print("=" * 40)
+
+    wanted = parse_batch({'rooms': [{'id': 'a'}, {'id': 'b', 'limit': 5, 'since': '2024-05-01T10:00:00'}]})
+    assert wanted == [
+        {'id': 'a', 'limit': BATCH_DEFAULT_LIMIT, 'since': None},
+        {'id': 'b', 'limit': 5, 'since': datetime.datetime(2024, 5, 1, 10)},
+    ]
+
+    invalid = [
+        None,
+        {'rooms': []},
+        {'rooms': [{'id': str(i)} for i in range(BATCH_MAX_ROOMS + 1)]},
+        {'rooms': [{'limit': 5}]},
+        {'rooms': [{'id': 'a'}, {'id': 'a'}]},
+        {'rooms': [{'id': 'a', 'limit': 0}]},
+        {'rooms': [{'id': 'a', 'limit': True}]},
+        {'rooms': [{'id': 'a', 'since': 'yesterday'}]},
+    ]
+    for body in invalid:
+        try:
+            parse_batch(body)
+            assert False, f"Should reject {body}"
+        except ValueError:
+            pass
+    print("✅ Defaults applied and malformed requests rejected")
+
+
+def test_encode_batch():
+    body = encode_batch({'a': [json.dumps({'id': '1'}), json.dumps({'id': '2'})], 'b': []}, ['c'])
+    assert json.loads(body) == {'rooms': {'a': [{'id': '1'}, {'id': '2'}], 'b': []}, 'not_found': ['c']}
+    print("✅ Pre-encoded messages grouped by room")
+
+
+if __name__ == "__main__":
+    test_parse_batch()
+    test_encode_batch()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test the history bucket layout and page reads across bucket boundaries
+"""
+
+import datetime
+
+from bson import ObjectId
+
+from compression import is_compressed
+from models import Message, _bucket_documents, _page_from_buckets
+
+ROOM = ObjectId()
+START = datetime.datetime(2026, 1, 1, 12, 0, 0)
+
+
+def make_messages(count):
+    return [Message(id=ObjectId(), text=f"message {i}", sender='user' if i % 2 == 0 else 'ai',
+                    chatRoom=ROOM, timestamp=START + datetime.timedelta(seconds=i))
+            for i in range(count)]
+
+
+def select(buckets, limit, size, before=None):
+    """Stands in for page()'s MongoDB query: newest buckets first, starting before the cutoff."""
+    if before is not None:
+        buckets = [bucket for bucket in buckets if bucket['first_ts'] < before]
+    return sorted(buckets, key=lambda bucket: bucket['last_ts'], reverse=True)[:limit // size + 2]
+
+
+def texts(page):
+    return [message['text'] for message in page]
+
+
+def test_rebuild_layout():
+    print("🪣 Testing message buckets")
+    print("=" * 40)
+
+    buckets = list(_bucket_documents(ROOM, make_messages(7), size=3))
+    assert [bucket['count'] for bucket in buckets] == [3, 3, 1]
+    assert buckets[1]['first_ts'] == START + datetime.timedelta(seconds=3)
+    assert buckets[1]['last_ts'] == START + datetime.timedelta(seconds=5)
+    assert all(bucket['chatRoom'] == ROOM for bucket in buckets)
+    written = sum(bucket['count'] for bucket in buckets)
+    assert -(-written // 3) == len(buckets)  # The bucket count migrate_buckets.py reports
+    assert list(_bucket_documents(ROOM, [], size=3)) == []
+    print(f"✅ 7 messages were laid out in buckets of {[bucket['count'] for bucket in buckets]}")
+
+
+def test_page_crosses_bucket_boundaries():
+    buckets = list(_bucket_documents(ROOM, make_messages(10), size=3))  # 3, 3, 3 and an open bucket of 1
+
+    page = _page_from_buckets(select(buckets, 5, 3), 5)
+    assert texts(page) == [f"message {i}" for i in range(5, 10)]
+
+    before = START + datetime.timedelta(seconds=5)
+    older = _page_from_buckets(select(buckets, 4, 3, before), 4, before)
+    assert texts(older) == [f"message {i}" for i in range(1, 5)]  # Message 5 itself is excluded
+
+    assert texts(_page_from_buckets(select(buckets, 20, 3), 20)) == [f"message {i}" for i in range(10)]
+    print("✅ Pages spanning several buckets, and before a cutoff, came back in order")
+
+
+def test_duplicates_and_compressed_text():
+    messages = make_messages(4)
+    messages[3].text = "The forecast for London is cloudy with light rain. " * 40
+    buckets = list(_bucket_documents(ROOM, messages, size=2))
+    assert is_compressed(buckets[1]['messages'][1]['text'])
+    buckets.append(dict(buckets[1]))  # A rebuild racing an append can leave a copy behind
+
+    page = _page_from_buckets(select(buckets, 10, 2), 10)
+    assert len(page) == 4 and page[-1]['text'] == messages[3].text
+    print("✅ Duplicate copies were dropped and long text was expanded")
+
+
+if __name__ == "__main__":
+    test_rebuild_layout()
+    test_page_crosses_bucket_boundaries()
+    test_duplicates_and_compressed_text()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Test the last-message preview kept on each chat room
+"""
+
+import models
+import models_mysql
+
+
+def test_preview_truncation():
+    print("📝 Testing room message previews")
+    print("=" * 40)
+
+    for message_preview, limit in ((models.message_preview, models.PREVIEW_CHARS),
+                                   (models_mysql.message_preview, models_mysql.PREVIEW_CHARS)):
+        long_text = "The forecast for London is cloudy with light rain later. " * 5
+        preview = message_preview(long_text)
+        assert len(preview) <= limit and preview.endswith('…')
+        assert long_text.startswith(preview[:-1])
+        assert not preview[:-1].endswith(' ')  # Trailing space before the ellipsis is dropped
+
+        exact = 'x' * limit
+        assert message_preview(exact) == exact  # At the limit nothing is cut
+        assert message_preview('x' * (limit + 1)) == 'x' * (limit - 1) + '…'
+    print(f"✅ Long messages were cut to {models.PREVIEW_CHARS} characters with an ellipsis")
+
+
+def test_whitespace_and_images():
+    for message_preview in (models.message_preview, models_mysql.message_preview):
+        assert message_preview("  Hello\n\n  there\tfriend ") == "Hello there friend"
+        assert message_preview(None, has_image=True) == '[image]'
+        assert message_preview("   ", has_image=True) == '[image]'
+        assert message_preview("Look at this", has_image=True) == "Look at this"
+        assert message_preview(None) == ''
+    print("✅ Whitespace collapses and image-only messages read [image]")
+
+
+if __name__ == "__main__":
+    test_preview_truncation()
+    test_whitespace_and_images()
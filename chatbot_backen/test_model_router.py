@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test latency-aware model tier routing
+"""
+
+import threading
+
+from model_router import ModelRouter, DEFAULT_TIERS
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel; optionally blocks until released."""
+
+    def __init__(self, name):
+        self.name = name
+        self.release = None
+
+    def generate_content(self, contents, safety_settings=None):
+        if self.release is not None:
+            self.release.wait(timeout=5)
+        return f"{self.name}: {contents}"
+
+
+def make_router(tiers=DEFAULT_TIERS, **kwargs):
+    return ModelRouter(tiers, model_factory=FakeModel, short_prompt_chars=20, long_prompt_chars=100, **kwargs)
+
+
+def test_tier_rules():
+    print("🧭 Testing Model Tier Rules")
+    print("=" * 40)
+
+    router = make_router()
+    assert router.choose("hi there").name == 'fast'
+    assert router.choose("x" * 50).name == 'standard'
+    assert router.choose("x" * 150).name == 'pro'
+    assert router.choose("hi", has_image=True).name == 'pro'
+    assert router.choose("hi", room_preference='standard').name == 'standard'
+    assert router.choose("hi", room_preference='unknown').name == 'fast'
+    print("✅ Length, image and room preference rules pick the expected tier")
+
+
+def test_fallback_when_over_budget():
+    print("\n⏱️ Testing budget fallback")
+    print("=" * 40)
+
+    router = make_router()
+    pro = router.tiers['pro']
+    pro.latency_budget = 0.05
+    pro.model.release = threading.Event()  # Pro hangs until released
+
+    response, served_by = router.generate(pro, "long question")
+    pro.model.release.set()
+
+    assert served_by.name == 'standard'
+    assert response == "gemini-2.5-flash: long question"
+    assert pro.budget_exceeded == 1 and router.tiers['standard'].requests == 1
+    print(f"✅ Pro exceeded its budget, standard answered: {response}")
+
+
+def test_custom_tiers_are_validated():
+    tiers = {'flash': {'model': 'gemini-2.0-flash', 'latency_budget': 8, 'fallback': None}}
+    router = make_router(tiers=tiers, image_tier='flash', short_tier='flash', long_tier='flash', default_tier='flash')
+    assert router.choose("x" * 150).name == 'flash'
+
+    try:
+        make_router(tiers=tiers)  # Default roles name 'fast', 'standard' and 'pro'
+        assert False, "expected ValueError"
+    except ValueError as err:
+        assert "'fast'" in str(err)
+    try:
+        make_router(tiers=dict(DEFAULT_TIERS, fast=dict(DEFAULT_TIERS['fast'], fallback='nano')))
+        assert False, "expected ValueError"
+    except ValueError as err:
+        assert "'nano'" in str(err)
+    print("✅ Routing roles are configurable and unknown tiers fail at startup")
+
+
+if __name__ == "__main__":
+    test_tier_rules()
+    test_fallback_when_over_budget()
+    test_custom_tiers_are_validated()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test the sampling profiler's report: call tree, top functions and wait breakdown
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+from flask import Flask, jsonify
+
+from cache import SQLiteCache
+from profiling import ProfileStore, StackSampler, init_profiling
+
+
+def test_report_from_samples():
+    print("🔬 Testing profiler report")
+    print("=" * 40)
+
+    sampler = StackSampler(thread_id=0, interval=0.005)
+    view, query, call = 'app.py:get_messages:10', 'models.py:page:20', 'chatbot_api.py:generate_content:30'
+    recurse = 'models.py:walk:40'
+    sampler._stacks.update({
+        (view, query): 60,
+        (view, call): 30,
+        (view,): 9,
+        (view, recurse, recurse): 1,  # Recursive frames count once towards total time
+    })
+    sampler._waits.update({'db': 60, 'upstream': 30, 'cpu': 10})
+    sampler.samples = 100
+
+    report = sampler.report(top=3, min_share=0.05)
+    assert report['samples'] == 100 and report['interval_ms'] == 5.0
+    assert report['wait_ms'] == {'db': 300.0, 'upstream': 150.0, 'cpu': 50.0}
+
+    top = {entry['function']: entry for entry in report['top_functions']}
+    assert list(top) == [view, query, call]
+    assert top[view] == {'function': view, 'total_ms': 500.0, 'self_ms': 45.0}
+    assert top[query]['self_ms'] == top[query]['total_ms'] == 300.0
+
+    root = report['call_tree']
+    assert root['name'] == 'root' and root['ms'] == 500.0
+    (view_node,) = root['children']
+    assert [child['name'] for child in view_node['children']] == [query, call]  # The 1-sample branch is pruned
+    print(f"✅ Call tree and top functions built from {report['samples']} samples")
+
+
+def test_sampler_records_a_running_thread():
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_view():
+        started.set()
+        release.wait(timeout=5)
+
+    worker = threading.Thread(target=slow_view)
+    worker.start()
+    started.wait(timeout=5)
+    sampler = StackSampler(worker.ident, interval=0.002)
+    sampler.start()
+    time.sleep(0.05)
+    sampler.stop()
+    release.set()
+    worker.join(timeout=5)
+
+    report = sampler.report()
+    assert report['samples'] > 0
+    assert any(entry['function'].startswith('test_profiling.py:slow_view:') for entry in report['top_functions'])
+
+
+def test_non_ascii_tokens_are_refused():
+    app = Flask(__name__)
+
+    @app.route('/api/ping')
+    def ping():
+        return jsonify({'ok': True})
+
+    init_profiling(app, token='s3cret')
+    client = app.test_client()
+
+    response = client.get('/api/ping', headers={'X-Profile': 'café'})
+    assert response.status_code == 200 and 'X-Profile-Id' not in response.headers
+    assert client.get('/api/admin/profiles', headers={'X-Admin-Token': 'café'}).status_code == 403
+
+    profiled = client.get('/api/ping', headers={'X-Profile': 's3cret'})
+    assert 'X-Profile-Id' in profiled.headers
+    assert client.get('/api/admin/profiles', headers={'X-Admin-Token': 's3cret'}).status_code == 200
+    print("✅ Non-ASCII tokens were refused instead of failing the request")
+
+
+def test_workers_share_the_profile_index():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite3')
+        stores = [ProfileStore(SQLiteCache(path), max_profiles=100) for _ in range(3)]  # One per worker
+
+        def save_many(store, worker):
+            for i in range(10):
+                store.save({'id': f"{worker}-{i}", 'method': 'GET', 'path': '/api/chatRooms', 'status': 200,
+                            'started_at': time.time(), 'duration_ms': 1.0})
+
+        threads = [threading.Thread(target=save_many, args=(store, n)) for n, store in enumerate(stores)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(stores[0].list()) == 30 and stores[2].get('0-9')['status'] == 200
+    print("✅ Profiles saved by concurrent workers all reached the shared index")
+
+
+if __name__ == "__main__":
+    test_report_from_samples()
+    test_sampler_records_a_running_thread()
+    test_non_ascii_tokens_are_refused()
+    test_workers_share_the_profile_index()
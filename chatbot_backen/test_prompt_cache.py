@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test the near-duplicate prompt cache
+"""
+
+import time
+
+from prompt_cache import NearDuplicateCache, normalize
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_near_duplicates_hit():
+    print("🧠 Testing near-duplicate prompt cache")
+    print("=" * 40)
+
+    cache = NearDuplicateCache(capacity=100, dims=128, threshold=0.92)
+    assert normalize("  Whats the WEATHER like in London??") == "whats the weather like in london"
+
+    cache.put("What's the weather like in London", "Cloudy", scope='fast')
+    value, similarity = cache.get("whats the weather like in london??", scope='fast')
+    assert value == "Cloudy" and similarity > 0.99
+
+    assert cache.get("whats the weather like in london", scope='pro') is None  # Other tier
+    assert cache.get("tell me a joke about cats", scope='fast') is None
+    cache.put("is 5 greater than 3", "Yes", scope='fast')
+    assert cache.get("is 3 greater than 5", scope='fast') is None  # Numbers must match
+    print(f"✅ Trivial variants hit, different questions miss: {cache.stats()}")
+
+
+def test_changed_meaning_misses():
+    cache = NearDuplicateCache(capacity=100, dims=128, threshold=0.92)
+    pairs = [
+        ("write a function that sorts a list of integers in ascending order",
+         "write a function that sorts a list of integers in descending order"),
+        ("write a javascript function that checks for a palindrome",
+         "write a python function that checks for a palindrome"),
+        ("should I take aspirin with ibuprofen", "should I not take aspirin with ibuprofen"),
+    ]
+    for cached, asked in pairs:
+        cache.put(cached, "answer", scope='fast')
+        assert cache.get(asked, scope='fast') is None, asked
+    assert cache.get("Please, should I take aspirin with ibuprofen?", scope='fast')[0] == "answer"
+    print("✅ Substituted or negated prompts miss; politeness variants still hit")
+
+
+def test_expiry_and_lru_eviction():
+    clock = FakeClock()
+    cache = NearDuplicateCache(capacity=2, dims=128, ttl=60, eviction='lru', clock=clock)
+    cache.put("first prompt here", 1)
+    cache.put("second prompt here", 2)
+    assert cache.get("first prompt here")[0] == 1  # Now the most recently used
+    cache.put("third prompt here", 3)
+    assert cache.get("second prompt here") is None
+    assert cache.get("first prompt here")[0] == 1
+
+    clock.now = 61
+    assert cache.get("first prompt here") is None
+
+
+def test_lookup_is_fast_at_capacity():
+    cache = NearDuplicateCache(capacity=20000, dims=128)
+    for i in range(20000):
+        cache.put(f"question number {i} about topic {i * 7}", i, scope='fast')
+    start = time.perf_counter()
+    for _ in range(100):
+        cache.get("what is the capital of france", scope='fast')
+    per_lookup_ms = (time.perf_counter() - start) * 10
+    print(f"✅ Lookup over 20k prompts: {per_lookup_ms:.3f} ms")
+    assert per_lookup_ms < 5  # Generous bound for slow CI machines
+
+
+if __name__ == "__main__":
+    test_near_duplicates_hit()
+    test_changed_meaning_misses()
+    test_expiry_and_lru_eviction()
+    test_lookup_is_fast_at_capacity()
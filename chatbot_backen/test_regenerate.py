@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test the offline re-generation pipeline against a fake model
+"""
+
+import os
+import tempfile
+import threading
+
+from regenerate import Checkpoint, Regenerator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += seconds
+
+
+class ResourceExhausted(Exception):
+    """Named like google.api_core's 429 error."""
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.candidates = []
+        self.usage_metadata = type('Usage', (), {'prompt_token_count': 5, 'candidates_token_count': 7})()
+
+
+class FakeModel:
+    def __init__(self, rate_limit_first=0):
+        self.rate_limit_first = rate_limit_first
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate(self, contents):
+        with self._lock:
+            self.calls.append(contents)
+            if self.rate_limit_first:
+                self.rate_limit_first -= 1
+                raise ResourceExhausted("429 Quota exceeded")
+        if contents == 'boom':
+            raise RuntimeError("model error")
+        return FakeResponse(f"answer to {contents}")
+
+
+def items(ids):
+    return ({'id': f"{i:03d}", 'chatRoom': 'room', 'contents': f"question {i}"} for i in ids)
+
+
+def test_regenerates_and_checkpoints():
+    print("🔁 Testing bulk re-generation")
+    print("=" * 40)
+
+    clock = FakeClock()
+    model = FakeModel(rate_limit_first=1)
+    saved = {}
+    regenerator = Regenerator(model.generate, lambda item, result: saved.__setitem__(item['id'], result),
+                              'fake-model', concurrency=3, rate_per_minute=600, sleep=clock.sleep, clock=clock)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'run.json')
+        checkpoint = Checkpoint(path)
+        rows = regenerator.run(items(range(10)), checkpoint)
+
+        assert len(saved) == 10 and len(rows) == 10
+        assert saved['000']['response'] == 'answer to question 0'
+        assert saved['000']['output_tokens'] == 7
+        assert regenerator.rate_limited == 1
+        assert sum(result['attempts'] for result in saved.values()) == 11
+
+        resumed = Checkpoint(path)
+        assert resumed.watermark == '009' and resumed.completed == 10
+    print(f"✅ 10 messages answered, 1 rate-limit retry, checkpoint at {resumed.watermark}")
+
+
+def test_errors_are_recorded_not_raised():
+    clock = FakeClock()
+    model = FakeModel()
+    saved = {}
+    regenerator = Regenerator(model.generate, lambda item, result: saved.__setitem__(item['id'], result),
+                              'fake-model', concurrency=2, rate_per_minute=600, sleep=clock.sleep, clock=clock)
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = Checkpoint(os.path.join(tmp, 'run.json'))
+        regenerator.run([{'id': '001', 'chatRoom': 'room', 'contents': 'boom'},
+                         {'id': '002', 'chatRoom': 'room', 'contents': None}], checkpoint)
+    assert saved['001']['error'] == 'model error'
+    assert saved['002']['error'] == 'Image file is missing'
+    assert checkpoint.failed == 2 and checkpoint.watermark == '002'
+
+
+if __name__ == "__main__":
+    test_regenerates_and_checkpoints()
+    test_errors_are_recorded_not_raised()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Test the circuit breaker, hedged requests and admission control around Gemini calls
+"""
+
+import threading
+import time
+
+from resilience import AdmissionController, CircuitBreaker, CircuitOpenError, HedgedCaller, Overloaded, upstream_failure
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel, replaying a script of outcomes."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    def generate_content(self, contents, safety_settings=None):
+        self.calls += 1
+        outcome = self.script.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def test_circuit_opens_and_recovers():
+    print("🔌 Testing Circuit Breaker")
+    print("=" * 40)
+
+    clock = FakeClock()
+    breaker = CircuitBreaker('gemini', failure_threshold=3, reset_timeout=30, clock=clock)
+    model = FakeModel([RuntimeError("503")] * 3 + [RuntimeError("still down"), "recovered", "ok"])
+
+    for _ in range(3):
+        try:
+            breaker.call(model.generate_content, "hi")
+        except RuntimeError:
+            pass
+    assert breaker.state == CircuitBreaker.OPEN
+    print("✅ Opened after 3 consecutive failures")
+
+    try:
+        breaker.call(model.generate_content, "hi")
+        assert False, "expected CircuitOpenError"
+    except CircuitOpenError:
+        pass
+    assert model.calls == 3
+    print("✅ Failed fast without calling the model while open")
+
+    clock.now = 30
+    try:
+        breaker.call(model.generate_content, "hi")
+    except RuntimeError:
+        pass
+    assert breaker.state == CircuitBreaker.OPEN and model.calls == 4
+    print("✅ Failed half-open probe re-opened the circuit")
+
+    clock.now = 60
+    assert breaker.call(model.generate_content, "hi") == "recovered"
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.call(model.generate_content, "hi") == "ok"
+    print(f"✅ Successful probe closed the circuit: {breaker.stats()}")
+
+
+class ApiError(Exception):
+    """Shaped like google.api_core errors, which carry the HTTP status as `code`."""
+
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def test_client_errors_do_not_trip_breaker():
+    breaker = CircuitBreaker('gemini', failure_threshold=2, is_failure=upstream_failure, clock=FakeClock())
+    model = FakeModel([ApiError(400), ApiError(400), ApiError(400), ValueError("bad image"),
+                       ApiError(503), TimeoutError("read timed out")])
+    for _ in range(4):
+        try:
+            breaker.call(model.generate_content, "hi")
+        except Exception:
+            pass
+    assert breaker.state == CircuitBreaker.CLOSED
+    for _ in range(2):
+        try:
+            breaker.call(model.generate_content, "hi")
+        except Exception:
+            pass
+    assert breaker.state == CircuitBreaker.OPEN
+    assert upstream_failure(ApiError(429)) and not upstream_failure(ApiError(403))
+    print("✅ Bad requests pass through; 5xx and timeouts open the circuit")
+
+
+class WorkerTimeout(BaseException):
+    """Like gunicorn's or gevent's timeouts, which aren't Exceptions."""
+
+
+def test_interrupted_probe_releases_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker('gemini', failure_threshold=1, reset_timeout=30, clock=clock)
+    model = FakeModel([RuntimeError("503"), WorkerTimeout(), "recovered"])
+    try:
+        breaker.call(model.generate_content, "hi")
+    except RuntimeError:
+        pass
+
+    clock.now = 30
+    try:
+        breaker.call(model.generate_content, "hi")  # The half-open probe is interrupted
+        assert False, "expected WorkerTimeout"
+    except WorkerTimeout:
+        pass
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 60
+    assert breaker.call(model.generate_content, "hi") == "recovered"
+    assert breaker.state == CircuitBreaker.CLOSED
+    print("✅ An interrupted probe re-opened the circuit instead of blocking it for good")
+
+
+def test_hedged_request_wins():
+    print("\n🏇 Testing Hedged Requests")
+    print("=" * 40)
+
+    release_first = threading.Event()
+    calls = []
+
+    def generate_content(contents):
+        calls.append(contents)
+        if len(calls) == 1:
+            release_first.wait(timeout=5)  # The first request hangs
+            return "slow"
+        return "fast"
+
+    hedger = HedgedCaller(percentile=95, min_samples=3)
+    for _ in range(3):
+        hedger.latencies.record(0.01)
+
+    assert hedger.call(generate_content, "hi") == "fast"
+    release_first.set()
+    assert len(calls) == 2
+    assert hedger.stats()['hedged'] == 1 and hedger.stats()['hedge_wins'] == 1
+    print(f"✅ Hedge fired after p95 and won: {hedger.stats()}")
+
+
+def test_hedging_disabled_without_samples():
+    hedger = HedgedCaller(percentile=95, min_samples=20)
+    assert hedger.hedge_delay() is None
+    assert hedger.call(lambda: "direct") == "direct"
+    assert hedger.stats()['hedged'] == 0
+
+
+def test_admission_sheds_when_saturated():
+    print("\n🚦 Testing admission control")
+    print("=" * 40)
+
+    admission = AdmissionController('test', max_concurrent=1, max_per_key=1, max_queue=1, queue_timeout=5)
+    holding = threading.Event()
+    release = threading.Event()
+
+    def hold_slot():
+        with admission.slot('room-a'):
+            holding.set()
+            release.wait(timeout=5)
+
+    holder = threading.Thread(target=hold_slot)
+    holder.start()
+    holding.wait(timeout=5)
+
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(admission._acquire('room-b')))
+    waiter.start()
+    while admission.stats()['queue_depth'] < 1:
+        time.sleep(0.01)
+
+    try:
+        admission._acquire('room-c')
+        assert False, "expected Overloaded"
+    except Overloaded as err:
+        assert err.status == 503 and err.retry_after >= 1
+
+    release.set()
+    holder.join(timeout=5)
+    waiter.join(timeout=5)
+    stats = admission.stats()
+    assert len(admitted) == 1 and stats['admitted'] == 2 and stats['shed']['queue_full'] == 1
+    print(f"✅ Queued caller admitted, overflow shed: {stats}")
+
+
+def test_room_rate_limit():
+    clock = FakeClock()
+    admission = AdmissionController('test', rate_limits={'room': (60, 2)}, clock=clock)
+    admission.check_rate(room='a')
+    admission.check_rate(room='a')
+    admission.check_rate(room='b')  # Other rooms have their own bucket
+    try:
+        admission.check_rate(room='a')
+        assert False, "expected Overloaded"
+    except Overloaded as err:
+        assert err.status == 429 and err.retry_after == 1.0
+    clock.now = 1.0
+    admission.check_rate(room='a')
+
+
+if __name__ == "__main__":
+    test_circuit_opens_and_recovers()
+    test_client_errors_do_not_trip_breaker()
+    test_interrupted_probe_releases_circuit()
+    test_hedged_request_wins()
+    test_hedging_disabled_without_samples()
+    test_admission_sheds_when_saturated()
+    test_room_rate_limit()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test request coalescing for identical in-flight calls
+"""
+
+import threading
+import time
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    print("🔗 Testing Single-Flight Coalescing")
+    print("=" * 40)
+
+    flight = SingleFlight('test')
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_weather(city):
+        calls.append(city)
+        started.set()
+        release.wait(timeout=5)
+        return {"status": "success", "report": f"The weather in {city}"}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('london', slow_weather, 'London')))
+    leader.start()
+    started.wait(timeout=5)
+
+    followers = [
+        threading.Thread(target=lambda: results.append(flight.do('london', slow_weather, 'London')))
+        for _ in range(4)
+    ]
+    for thread in followers:
+        thread.start()
+    while flight.stats()['coalesced'] < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(timeout=5)
+
+    assert calls == ['London']
+    assert len(results) == 5 and all(r == results[0] for r in results)
+    assert flight.stats() == {'executed': 1, 'coalesced': 4, 'in_flight': 0}
+    print(f"✅ 5 callers, 1 upstream call: {flight.stats()}")
+
+
+def test_errors_are_shared_but_not_cached():
+    print("\n💥 Testing error sharing")
+    print("=" * 40)
+
+    flight = SingleFlight('test')
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        raise RuntimeError("upstream down")
+
+    for _ in range(2):
+        try:
+            flight.do('key', failing)
+            assert False, "expected RuntimeError"
+        except RuntimeError:
+            pass
+
+    assert len(attempts) == 2
+    assert flight.do('key', lambda: 'recovered') == 'recovered'
+    print("✅ Each failure released the key, next caller retried upstream")
+
+
+if __name__ == "__main__":
+    test_concurrent_callers_share_one_call()
+    test_errors_are_shared_but_not_cached()
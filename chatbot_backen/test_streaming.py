@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test streamed JSON array responses and their gzip compression
+"""
+
+import gzip
+import json
+
+from flask import Flask
+
+import streaming
+from streaming import iter_json_array, streamed_json_response
+
+
+def make_app(items):
+    app = Flask(__name__)
+
+    @app.route('/items')
+    def list_items():
+        return streamed_json_response(iter(items), lambda item: {'id': item, 'text': 'x' * 50})
+
+    return app
+
+
+def test_gzip_round_trip():
+    print("🌊 Testing streamed JSON")
+    print("=" * 40)
+
+    items = list(range(500))
+    client = make_app(items).test_client()
+    response = client.get('/items', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip' and response.headers['Vary'] == 'Accept-Encoding'
+    body = json.loads(gzip.decompress(response.get_data()))
+    assert [item['id'] for item in body] == items
+    print(f"✅ {len(items)} items streamed as {len(response.get_data())} gzip bytes and decoded intact")
+
+    plain = client.get('/items')
+    assert 'Content-Encoding' not in plain.headers and plain.get_json() == body
+
+
+def test_empty_list():
+    client = make_app([]).test_client()
+    assert gzip.decompress(client.get('/items', headers={'Accept-Encoding': 'gzip'}).get_data()) == b'[]'
+    assert client.get('/items').get_json() == []
+    print("✅ An empty listing is a valid empty array")
+
+
+def test_chunks_split_on_size():
+    chunk_bytes, streaming.STREAM_CHUNK_BYTES = streaming.STREAM_CHUNK_BYTES, 100
+    try:
+        chunks = list(iter_json_array(['"%s"' % ('a' * 40)] * 5, None))
+    finally:
+        streaming.STREAM_CHUNK_BYTES = chunk_bytes
+    assert len(chunks) > 1
+    assert json.loads(b''.join(chunks)) == ['a' * 40] * 5
+
+
+if __name__ == "__main__":
+    test_gzip_round_trip()
+    test_empty_list()
+    test_chunks_split_on_size()
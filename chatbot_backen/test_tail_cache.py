@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Test the per-room tail cache of recent messages
+"""
+
+import json
+
+from tail_cache import TailCache
+
+
+def encoded(message_id, text):
+    return str(message_id), json.dumps({'id': str(message_id), 'text': text})
+
+
+def test_tail_follows_writes_and_detects_gaps():
+    print("📜 Testing tail cache")
+    print("=" * 40)
+
+    tails = TailCache(per_room=3, max_bytes=10_000)
+    assert tails.get('room', 2, revision=0) is None  # Not primed yet
+
+    tails.prime('room', [encoded(1, 'hi'), encoded(2, 'hello')], revision=2)
+    assert [json.loads(m)['id'] for m in tails.get('room', 5, revision=2)] == ['1', '2']  # Whole room held
+
+    tails.append('room', *encoded(3, 'how are you'), revision=3)
+    tails.append('room', *encoded(4, 'fine'), revision=4)
+    assert [json.loads(m)['id'] for m in tails.get('room', 3, revision=4)] == ['2', '3', '4']
+    assert tails.get('room', 4, revision=4) is None  # Older than the buffer
+
+    tails.replace('room', *encoded(3, 'how are you?'), revision=5)
+    assert json.loads(tails.get('room', 2, revision=5)[0])['text'] == 'how are you?'
+
+    tails.append('room', *encoded(6, 'skipped one'), revision=7)  # Revision 6 happened elsewhere
+    assert tails.get('room', 1, revision=7) is None
+    print(f"✅ Tail served, edits applied, gaps invalidate: {tails.stats()}")
+
+
+def test_cold_rooms_evicted_past_memory_bound():
+    tails = TailCache(per_room=10, max_bytes=300)
+    for room in ('a', 'b', 'c'):
+        tails.prime(room, [encoded(i, 'x' * 20) for i in range(3)], revision=1)
+        tails.get('a', 1, revision=1)  # Keep room a warm
+    assert tails.get('a', 1, revision=1) is not None
+    assert tails.get('b', 1, revision=1) is None
+    assert tails.stats()['bytes'] <= 300
+
+
+if __name__ == "__main__":
+    test_tail_follows_writes_and_detects_gaps()
+    test_cold_rooms_evicted_past_memory_bound()
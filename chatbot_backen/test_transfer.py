@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test the NDJSON export/import format
+"""
+
+import datetime
+import io
+
+import transfer
+
+
+def test_round_trip_in_batches():
+    print("📦 Testing NDJSON Export/Import")
+    print("=" * 40)
+
+    stamp = datetime.datetime(2025, 1, 1, 12, 0)
+    lines = [transfer.encode(transfer.header_record())]
+    for room_id, name in [('r1', 'General'), ('r2', 'Travel')]:
+        lines.append(transfer.encode(transfer.room_record(room_id, name)))
+        for i in range(5):
+            lines.append(transfer.encode(transfer.message_record(
+                room_id, f"{name} {i}", 'user' if i % 2 == 0 else 'ai', stamp,
+                generation_model='gemini-2.0-flash' if i % 2 else None
+            )))
+    stream = io.BytesIO("".join(lines).encode('utf-8'))
+
+    batches, finished = [], []
+    result = transfer.import_records(
+        transfer.read_records(stream),
+        get_or_create_room=lambda record: record['name'],
+        insert_messages=lambda room, records: batches.append((room, len(records))),
+        finish_room=lambda room, count: finished.append((room, count)),
+        batch_size=2,
+    )
+
+    assert result == {'rooms': 2, 'messages': {'General': 5, 'Travel': 5}}
+    assert batches == [('General', 2), ('General', 2), ('General', 1), ('Travel', 2), ('Travel', 2), ('Travel', 1)]
+    assert sorted(finished) == [('General', 5), ('Travel', 5)]
+    print(f"✅ Imported {result['messages']} in {len(batches)} batches, one counter update per room")
+
+
+def test_reply_links_survive_round_trip():
+    stamp = datetime.datetime(2025, 1, 1, 12, 0)
+    lines = [transfer.encode(transfer.room_record('r1', 'General'))]
+    for i in range(4):  # user q0, ai a0, user q1, ai a1, ...
+        lines.append(transfer.encode(transfer.message_record(
+            'r1', f"question {i}", 'user', stamp, message_id=f"q{i}", reply=f"a{i}")))
+        lines.append(transfer.encode(transfer.message_record('r1', f"answer {i}", 'ai', stamp, message_id=f"a{i}")))
+
+    stored = {}  # New id -> imported record
+    linked = {}
+
+    def insert_messages(room, records):
+        ids = []
+        for record in records:
+            new_id = len(stored) + 100
+            stored[new_id] = record
+            ids.append(new_id)
+        return ids
+
+    transfer.import_records(
+        transfer.read_records(lines),
+        get_or_create_room=lambda record: record['name'],
+        insert_messages=insert_messages,
+        finish_room=lambda room, count: None,
+        link_replies=lambda links: linked.update(links),
+        batch_size=3,  # Puts some questions and their answers in different batches
+    )
+
+    assert len(linked) == 4
+    for message_id, reply_id in linked.items():
+        assert stored[message_id]['sender'] == 'user'
+        assert stored[reply_id]['text'] == stored[message_id]['text'].replace('question', 'answer')
+    print("✅ Imported user messages point at their imported AI replies")
+
+
+def test_invalid_lines_are_reported():
+    try:
+        list(transfer.read_records([b'{"type": "room", "id": "1", "name": "a"}\n', b'not json\n']))
+        assert False, "expected ValueError"
+    except ValueError as e:
+        assert "line 2" in str(e)
+
+
+if __name__ == "__main__":
+    test_round_trip_in_batches()
+    test_reply_links_survive_round_trip()
+    test_invalid_lines_are_reported()
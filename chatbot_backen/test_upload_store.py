@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test the reference-counted upload store
+"""
+
+import os
+import tempfile
+
+from blob_store import LocalBlobStore
+from upload_store import UploadStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+def _write(root, key, size):
+    with open(os.path.join(root, key), 'wb') as f:
+        f.write(b'x' * size)
+    return key
+
+
+def _store(root, **kwargs):
+    return UploadStore(LocalBlobStore(root), index_path=os.path.join(root, '.index.sqlite3'), **kwargs)
+
+
+def test_release_deletes_unreferenced_files():
+    print("🗂️ Testing upload reference counting")
+    print("=" * 40)
+
+    with tempfile.TemporaryDirectory() as root:
+        store = _store(root, max_bytes=10_000)
+        shared = _write(root, 'cat.png', 100)
+        store.acquire([shared])
+        store.acquire([shared])  # A second message uploads the same filename
+
+        store.release([shared])
+        assert os.path.exists(os.path.join(root, shared)) and store.in_use(shared)
+        store.release([shared])
+        assert not store.in_use(shared)
+        assert not os.path.exists(os.path.join(root, shared))
+        assert store.stats()['files'] == 0
+        print("✅ File deleted only after its last reference is released")
+
+
+def test_eviction_skips_referenced_files():
+    with tempfile.TemporaryDirectory() as root:
+        store = _store(root, max_bytes=250, clock=FakeClock())
+        old = _write(root, 'old.png', 100)
+        kept = _write(root, 'kept.png', 100)
+        store.acquire([old])
+        store.acquire([kept])
+        store.reconcile([kept])  # old.png is no longer referenced
+        assert store.stats()['unreferenced'] == 1
+
+        store.acquire([_write(root, 'new.png', 100)])
+        assert not os.path.exists(os.path.join(root, old))
+        assert os.path.exists(os.path.join(root, kept))
+        print(f"✅ Over the limit, the unreferenced file is evicted first: {store.stats()}")
+
+
+def test_reconcile_rebuilds_counts():
+    with tempfile.TemporaryDirectory() as root:
+        store = _store(root)
+        used = _write(root, 'used.png', 10)
+        orphan = _write(root, 'orphan.png', 10)
+        result = store.reconcile([used, used, 'gone.png'], delete_orphans=True)
+        assert result['orphans_deleted'] == 1 and result['missing_files'] == 1
+        assert not os.path.exists(os.path.join(root, orphan))
+
+        store.release([used])
+        assert os.path.exists(os.path.join(root, used))  # Still one reference left
+        print(f"✅ Reconcile rebuilt the counts: {result}")
+
+
+if __name__ == "__main__":
+    test_release_deletes_unreferenced_files()
+    test_eviction_skips_referenced_files()
+    test_reconcile_rebuilds_counts()
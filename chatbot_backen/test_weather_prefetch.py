@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test popularity-driven weather prefetching
+"""
+
+from cache import LRUCache
+from weather_prefetch import CallBudget, PopularityTracker, PrefetchScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeTool:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.calls = []
+
+    def refresh(self, *args):
+        self.calls.append(args)
+        return {"status": "success", "report": f"Weather for {args}"}
+
+
+def test_popular_lookups_refresh_before_expiry():
+    print("🔥 Testing prefetch scheduling")
+    print("=" * 40)
+
+    clock = FakeClock()
+    weather = FakeTool(ttl=600)
+    scheduler = PrefetchScheduler({'weather': weather}, top_n=2, calls_per_minute=60, margin=60, clock=clock)
+    scheduler.start = lambda: None  # Ticks are driven by the test
+
+    for city, requests in [('London', 3), ('Paris', 2), ('Oslo', 1)]:
+        scheduler.record('weather', city, fetched=True)
+        for _ in range(requests - 1):
+            scheduler.record('weather', city)
+
+    assert scheduler.run_once() == 0  # The requests just filled the cache
+    clock.now = 500  # Not yet within the margin
+    assert scheduler.run_once() == 0
+    clock.now = 541
+    assert scheduler.run_once() == 2
+    assert weather.calls == [('london',), ('paris',)]
+
+    clock.now = 900
+    scheduler.record('weather', 'Paris', fetched=True)  # A user refilled Paris after a miss
+    clock.now = 1082
+    assert scheduler.run_once() == 1 and weather.calls[-1] == ('london',)
+    print(f"✅ Top 2 refreshed near expiry, Oslo skipped: {scheduler.stats()}")
+
+
+def test_workers_share_refreshes():
+    clock = FakeClock()
+    locks = LRUCache(clock=clock)
+    weather = FakeTool(ttl=600)
+    workers = [PrefetchScheduler({'weather': weather}, margin=60, locks=locks, clock=clock) for _ in range(3)]
+    for worker in workers:
+        worker.start = lambda: None
+        worker.record('weather', 'London', fetched=True)
+
+    clock.now = 541
+    assert sum(worker.run_once() for worker in workers) == 1
+    assert weather.calls == [('london',)]
+    clock.now = 1082  # The lock has lapsed by the next cycle
+    assert sum(worker.run_once() for worker in workers) == 1
+    print("✅ One refresh per entry across workers sharing a lock cache")
+
+
+def test_budget_and_decay():
+    print("\n⏳ Testing call budget and popularity decay")
+    print("=" * 40)
+
+    clock = FakeClock()
+    budget = CallBudget(2, clock)
+    assert budget.try_acquire() and budget.try_acquire()
+    assert not budget.try_acquire()
+    clock.now = 30  # One call's worth refilled
+    assert budget.try_acquire() and not budget.try_acquire()
+
+    popularity = PopularityTracker(half_life=60, clock=clock)
+    for _ in range(4):
+        popularity.record('old')
+    clock.now += 180  # Three half-lives: 4 requests now weigh 0.5
+    popularity.record('new')
+    assert popularity.top(2) == ['new', 'old']
+    print("✅ Budget caps upstream calls and stale favourites fade")
+
+
+if __name__ == "__main__":
+    test_popular_lookups_refresh_before_expiry()
+    test_workers_share_refreshes()
+    test_budget_and_decay()
@@ -0,0 +1,134 @@
+# transfer.py - Backend-neutral NDJSON export/import format for chat rooms
+import datetime
+import json
+import os
+
+EXPORT_VERSION = 1
+# Messages written per bulk insert during import
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "500"))
+# Rows fetched per round trip while exporting
+EXPORT_FETCH_SIZE = int(os.environ.get("EXPORT_FETCH_SIZE", "500"))
+
+GENERATION_FIELDS = ('generation_model', 'generation_latency_ms', 'prompt_tokens', 'output_tokens',
+                     'finish_reason', 'cache_hit')
+
+
+def encode(record):
+    """Encodes one record as an NDJSON line."""
+    return json.dumps(record, default=_json_default, ensure_ascii=False) + "\n"
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def header_record():
+    return {'type': 'export', 'version': EXPORT_VERSION, 'exported_at': datetime.datetime.utcnow()}
+
+
+def room_record(room_id, name, model_tier=None):
+    return {'type': 'room', 'id': str(room_id), 'name': name, 'model_tier': model_tier}
+
+
+def message_record(room_id, text, sender, timestamp, image=None, thumbnail=None, gemini_response=None,
+                   message_id=None, reply=None, **generation):
+    """A message line; `reply` is the export id of the AI message that answered it."""
+    record = {
+        'type': 'message',
+        'id': str(message_id) if message_id is not None else None,
+        'room': str(room_id),
+        'text': text,
+        'sender': sender,
+        'timestamp': timestamp,
+        'image': image,
+        'thumbnail': thumbnail,
+        'gemini_response': gemini_response,
+        'reply': str(reply) if reply is not None else None,
+    }
+    for field in GENERATION_FIELDS:
+        if generation.get(field) is not None:
+            record[field] = generation[field]
+    return record
+
+
+def parse_timestamp(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def read_records(lines):
+    """Yields records from an iterable of NDJSON lines (bytes or str)."""
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}")
+        if record.get('type') == 'export' and record.get('version', EXPORT_VERSION) > EXPORT_VERSION:
+            raise ValueError(f"Unsupported export version {record['version']}")
+        yield record
+
+
+def import_records(records, get_or_create_room, insert_messages, finish_room, link_replies=None,
+                   batch_size=IMPORT_BATCH_SIZE):
+    """Imports rooms and messages, writing messages in batches.
+
+    Backends supply these callbacks:
+        get_or_create_room(room_record) -> room
+        insert_messages(room, [message_record, ...])   one bulk insert; returns the new ids
+                                                       in order when link_replies is given
+        finish_room(room, imported_count)              one counter update per room
+        link_replies([(message_id, reply_id), ...])    optional; points user messages at
+                                                       their imported AI replies
+
+    Exports list messages oldest first, so a reply follows the message it
+    answers; only those forward links are kept, and memory holds just the
+    links still waiting for their reply.
+
+    Returns:
+        dict: rooms and messages imported, keyed by room name.
+    """
+    rooms = {}  # Export-local room id -> (room, name)
+    counts = {}
+    awaiting = {}  # Export id of a reply -> new id of the message it answers
+    batch_room, batch = None, []
+
+    def flush():
+        if not batch:
+            return
+        new_ids = insert_messages(batch_room, list(batch))
+        if link_replies is not None:
+            links = []
+            for record, new_id in zip(batch, new_ids):
+                if record.get('id') in awaiting:
+                    links.append((awaiting.pop(record['id']), new_id))
+                if record.get('reply'):
+                    awaiting[record['reply']] = new_id
+            if links:
+                link_replies(links)
+        batch.clear()
+
+    for record in records:
+        kind = record.get('type')
+        if kind == 'room':
+            rooms[record['id']] = (get_or_create_room(record), record['name'])
+            counts.setdefault(record['name'], 0)
+        elif kind == 'message':
+            if record['room'] not in rooms:
+                raise ValueError(f"Message references unknown room {record['room']}")
+            room, name = rooms[record['room']]
+            if room is not batch_room or len(batch) >= batch_size:
+                flush()
+                batch_room = room
+            batch.append(record)
+            counts[name] += 1
+    flush()
+
+    for name, room in {name: room for room, name in rooms.values()}.items():
+        finish_room(room, counts[name])
+    return {'rooms': len(rooms), 'messages': counts}
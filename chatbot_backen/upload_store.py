@@ -0,0 +1,256 @@
+# upload_store.py - Reference-counted, size-bounded index of uploaded blobs
+"""
+Tracks which messages reference each uploaded blob (see blob_store.py),
+deletes blobs once nothing references them, and keeps uploads under
+UPLOAD_MAX_BYTES by evicting the least recently accessed unreferenced or
+archived blobs.
+
+Rebuild the reference counts from the database after a crash or manual edits:
+
+    python upload_store.py reconcile              # MongoDB (app.py)
+    python upload_store.py reconcile --mysql      # MySQL (app_pythonanywhere.py)
+    python upload_store.py reconcile --delete-orphans
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from blob_store import blob_key, get_blob_store
+from image_pipeline import UPLOAD_FOLDER
+
+# Total bytes of uploads kept before eviction starts
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+UPLOAD_INDEX_PATH = os.environ.get("UPLOAD_INDEX_PATH", os.path.join(UPLOAD_FOLDER, '.index.sqlite3'))
+
+
+def message_blobs(image, thumbnail=None):
+    """Blob keys a message with an image keeps alive: the original, its thumbnail and model copy."""
+    keys = []
+    if image:
+        keys.append(blob_key(image))
+    if thumbnail:
+        keys.append(f"thumbs/{thumbnail}")
+        keys.append(f"model/{os.path.splitext(thumbnail)[0]}.jpg")
+    return keys
+
+
+class UploadStore:
+    """Reference counts and access times for uploaded blobs, in a SQLite index.
+
+    The index is a file on this host, shared by its worker processes. Model
+    copies are registered as archived: they can be rebuilt from the original,
+    so they may be evicted even while referenced.
+
+    Other nodes' references are invisible to the index, so with a shared
+    backend (S3) writes are not counted and nothing is deleted on release;
+    `reconcile --delete-orphans`, which reads the database, cleans up instead.
+    """
+
+    def __init__(self, blobs=None, index_path=UPLOAD_INDEX_PATH, max_bytes=UPLOAD_MAX_BYTES,
+                 clock=time.time):
+        self.blobs = blobs or get_blob_store()
+        self.counting = self.blobs.per_host
+        self.max_bytes = max_bytes
+        self.index_path = index_path
+        self._clock = clock
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            # 'path' holds the blob key (a path under uploads/ on the local backend)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, refs INTEGER NOT NULL DEFAULT 0, "
+                "archived INTEGER NOT NULL DEFAULT 0, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_blobs_accessed_at ON blobs (accessed_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _is_archived(self, key):
+        return key.startswith('model/')
+
+    def acquire(self, keys):
+        """Adds one reference to each existing blob, then enforces the size limit."""
+        if not self.counting:
+            return
+        conn = self._connect()
+        now = self._clock()
+        for key in keys:
+            size = self.blobs.size(key)
+            if size is None:
+                continue
+            conn.execute(
+                "INSERT INTO blobs (path, size, refs, archived, accessed_at) VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET refs = refs + 1, size = excluded.size, accessed_at = excluded.accessed_at",
+                (key, size, int(self._is_archived(key)), now)
+            )
+        self.enforce_limit()
+
+    def release(self, keys):
+        """Drops one reference from each blob; blobs left unreferenced are deleted."""
+        if not self.counting:
+            return
+        conn = self._connect()
+        for key in keys:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("UPDATE blobs SET refs = refs - 1 WHERE path = ? AND refs > 0", (key,))
+                row = conn.execute("SELECT refs FROM blobs WHERE path = ?", (key,)).fetchone()
+                if row is not None and row[0] <= 0:
+                    conn.execute("DELETE FROM blobs WHERE path = ?", (key,))
+                    self._remove(key)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def in_use(self, key):
+        """Whether a message references the blob; always False when references aren't counted."""
+        if not self.counting:
+            return False
+        row = self._connect().execute("SELECT refs FROM blobs WHERE path = ?", (key,)).fetchone()
+        return row is not None and row[0] > 0
+
+    def touch(self, key):
+        """Records an access, so recently viewed blobs are evicted last."""
+        if not self.counting:
+            return
+        self._connect().execute("UPDATE blobs SET accessed_at = ? WHERE path = ?", (self._clock(), key))
+
+    def enforce_limit(self):
+        """Evicts least recently accessed unreferenced or archived blobs until under max_bytes.
+
+        Runs in one write transaction, so a blob acquired by another worker
+        meanwhile can't be picked from a stale candidate list.
+        """
+        conn = self._connect()
+        evicted = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total > self.max_bytes:
+                candidates = conn.execute(
+                    "SELECT path, size FROM blobs WHERE refs <= 0 OR archived = 1 ORDER BY accessed_at"
+                ).fetchall()
+                for key, size in candidates:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM blobs WHERE path = ?", (key,))
+                    self._remove(key)
+                    total -= size
+                    evicted += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def _remove(self, key):
+        try:
+            self.blobs.delete(key)
+        except Exception as e:
+            print(f"Error deleting upload {key}: {e}")
+
+    def reconcile(self, referenced_keys, delete_orphans=False):
+        """Rebuilds the index from the stored blobs and the keys messages reference.
+
+        `referenced_keys` yields one key per reference (repeat a key for each
+        message using it). Unreferenced blobs are indexed with zero references,
+        or deleted when `delete_orphans` is set.
+        """
+        refs = {}
+        for key in referenced_keys:
+            refs[key] = refs.get(key, 0) + 1
+        files = list(self.blobs.entries())
+
+        conn = self._connect()
+        now = self._clock()
+        orphans = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            previous = dict(conn.execute("SELECT path, accessed_at FROM blobs"))
+            conn.execute("DELETE FROM blobs")
+            for key, size in files:
+                count = refs.get(key, 0)
+                if count == 0 and delete_orphans:
+                    self._remove(key)
+                    orphans += 1
+                    continue
+                conn.execute(
+                    "INSERT INTO blobs (path, size, refs, archived, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, size, count, int(self._is_archived(key)), previous.get(key, now))
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        stored = {key for key, _ in files}
+        missing = sum(1 for key in refs if key not in stored)
+        return {'files': len(files) - orphans, 'orphans_deleted': orphans, 'missing_files': missing,
+                'evicted': self.enforce_limit()}
+
+    def stats(self):
+        files, size, unreferenced = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refs <= 0), 0) FROM blobs"
+        ).fetchone()
+        return {'files': files, 'bytes': size, 'unreferenced': unreferenced, 'max_bytes': self.max_bytes}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    """Returns the process-wide store, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = UploadStore()
+    return _store
+
+
+def _mongo_references():
+    from mongoengine import connect
+    from models import Message
+
+    connect('chatbot', host=os.environ.get("MONGODB_HOST", 'mongodb://localhost:27017/'))
+    for message in Message.objects(image_url__ne=None).only('image_url', 'thumbnail').no_cache():
+        yield from message_blobs(message.image_url, message.thumbnail)
+
+
+def _mysql_references():
+    from app_pythonanywhere import app
+    from models_mysql import Message
+
+    with app.app_context():
+        query = Message.query.with_entities(Message.image, Message.thumbnail).filter(Message.image.isnot(None))
+        for image, thumbnail in query.yield_per(1000):
+            yield from message_blobs(image, thumbnail)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['reconcile', 'stats'])
+    parser.add_argument('--mysql', action='store_true', help='Read references from the MySQL database')
+    parser.add_argument('--delete-orphans', action='store_true', help='Delete files no message references')
+    args = parser.parse_args(argv)
+
+    store = get_upload_store()
+    if args.command == 'reconcile':
+        references = _mysql_references() if args.mysql else _mongo_references()
+        print(json.dumps(store.reconcile(references, delete_orphans=args.delete_orphans), indent=2))
+    print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+# weather_prefetch.py - Refreshes the most requested weather lookups before their cache entries expire
+import heapq
+import os
+import threading
+import time
+
+# Number of most popular lookups kept warm
+WEATHER_PREFETCH_TOP_N = int(os.environ.get("WEATHER_PREFETCH_TOP_N", "20"))
+# Upstream (OpenWeatherMap) calls the scheduler may spend per minute
+WEATHER_PREFETCH_CALLS_PER_MINUTE = int(os.environ.get("WEATHER_PREFETCH_CALLS_PER_MINUTE", "30"))
+# Refresh this many seconds before an entry's TTL runs out
+WEATHER_PREFETCH_MARGIN_SECONDS = int(os.environ.get("WEATHER_PREFETCH_MARGIN_SECONDS", "60"))
+# Popularity halves after this long without requests
+WEATHER_PREFETCH_HALF_LIFE_SECONDS = int(os.environ.get("WEATHER_PREFETCH_HALF_LIFE_SECONDS", "3600"))
+
+
+class CallBudget:
+    """Token bucket allowing `per_minute` calls, with bursts up to the same amount."""
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class PopularityTracker:
+    """Request counts that decay exponentially, so yesterday's favourites fade out."""
+
+    def __init__(self, half_life, max_tracked=1000, clock=time.monotonic):
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._clock = clock
+        self._scores = {}  # key -> (score, time of last update)
+        self._lock = threading.Lock()
+
+    def _decayed(self, score, updated, now):
+        return score * 0.5 ** ((now - updated) / self.half_life)
+
+    def record(self, key):
+        with self._lock:
+            now = self._clock()
+            score, updated = self._scores.get(key, (0.0, now))
+            self._scores[key] = (self._decayed(score, updated, now) + 1, now)
+            if len(self._scores) > 2 * self.max_tracked:
+                self._scores = dict(self._top(self.max_tracked, now))
+
+    def _top(self, n, now):
+        return heapq.nlargest(
+            n,
+            ((key, (self._decayed(score, updated, now), now)) for key, (score, updated) in self._scores.items()),
+            key=lambda item: item[1][0]
+        )
+
+    def top(self, n):
+        """Returns the n most popular keys, most popular first."""
+        with self._lock:
+            return [key for key, _ in self._top(n, self._clock())]
+
+    def __len__(self):
+        return len(self._scores)
+
+
+class PrefetchScheduler:
+    """Keeps popular weather lookups warm in the shared cache.
+
+    `tools` maps a name to a cached tool exposing `ttl` and `refresh(*args)`
+    (see _shared_tool in chatbot_api.py). Lookups are recorded as
+    (name, *args) along with whether they filled the cache; each tick the
+    top-N whose entries are within `margin` seconds of expiring are
+    refreshed, most popular first, until the call budget runs out.
+
+    With a shared `locks` cache (anything with `add`), a worker takes a
+    per-lookup lock before refreshing, so workers sharing the weather cache
+    don't spend their budgets refreshing the same entry.
+    """
+
+    def __init__(self, tools, top_n=WEATHER_PREFETCH_TOP_N,
+                 calls_per_minute=WEATHER_PREFETCH_CALLS_PER_MINUTE,
+                 margin=WEATHER_PREFETCH_MARGIN_SECONDS,
+                 half_life=WEATHER_PREFETCH_HALF_LIFE_SECONDS,
+                 interval=10.0, locks=None, clock=time.monotonic):
+        self.tools = tools
+        self.locks = locks
+        self.top_n = top_n
+        self.margin = margin
+        self.interval = interval
+        self.budget = CallBudget(calls_per_minute, clock)
+        self.popularity = PopularityTracker(half_life, clock=clock)
+        self._clock = clock
+        self._refreshed_at = {}  # (name, *args) -> when its cache entry was last filled or refreshed
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._refreshes = 0
+        self._failures = 0
+        self._over_budget = 0
+        self._locked_out = 0
+
+    def record(self, name, *args, fetched=False):
+        """Counts one user request for a lookup and starts the scheduler if needed.
+
+        `fetched` means the request itself just filled the cache entry. A
+        cache hit on an unseen lookup counts as filled now too: the entry's
+        real age is unknown, and refreshing it early would waste a call.
+        """
+        if name not in self.tools:
+            return
+        key = (name,) + tuple(arg.lower() if isinstance(arg, str) else arg for arg in args)
+        self.popularity.record(key)
+        with self._lock:
+            if fetched:
+                self._refreshed_at[key] = self._clock()
+            else:
+                self._refreshed_at.setdefault(key, self._clock())
+        self.start()
+
+    def due(self):
+        """Top-N lookups whose cached entry expires within the margin, most popular first."""
+        now = self._clock()
+        popular = self.popularity.top(self.top_n)
+        with self._lock:
+            # Lookups that dropped out of the top N stop being refreshed; their next request re-seeds them
+            self._refreshed_at = {key: at for key, at in self._refreshed_at.items() if key in popular}
+            return [
+                key for key in popular
+                if key in self._refreshed_at
+                and now >= self._refreshed_at[key] + self.tools[key[0]].ttl - self.margin
+            ]
+
+    def _lock_key(self, key):
+        return 'prefetch-lock:' + ':'.join(str(part) for part in key)
+
+    def run_once(self):
+        """Refreshes due lookups within the call budget; returns how many succeeded."""
+        refreshed = 0
+        for key in self.due():
+            # Held until the entry is next due; whoever takes it refreshes for every worker
+            lease = self.tools[key[0]].ttl - self.margin
+            if self.locks is not None and not self.locks.add(self._lock_key(key), True, lease):
+                with self._lock:
+                    self._refreshed_at[key] = self._clock()
+                    self._locked_out += 1
+                continue
+            if not self.budget.try_acquire():
+                if self.locks is not None:
+                    self.locks.delete(self._lock_key(key))
+                with self._lock:
+                    self._over_budget += 1
+                break
+            name, args = key[0], key[1:]
+            try:
+                result = self.tools[name].refresh(*args)
+            except Exception as e:
+                print(f"Weather prefetch for {key} failed: {e}")
+                result = None
+            with self._lock:
+                # Failures wait a full cycle too, so one bad lookup can't drain the budget
+                self._refreshed_at[key] = self._clock()
+                if isinstance(result, dict) and result.get('status') == 'success':
+                    self._refreshes += 1
+                    refreshed += 1
+                else:
+                    self._failures += 1
+        return refreshed
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Weather prefetch tick failed: {e}")
+
+    def start(self):
+        """Starts the background thread once per process."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='weather-prefetch', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tracked': len(self.popularity),
+                'scheduled': len(self._refreshed_at),
+                'refreshes': self._refreshes,
+                'failures': self._failures,
+                'over_budget': self._over_budget,
+                'locked_out': self._locked_out,
+            }